@@ -0,0 +1,490 @@
+import sys
+import os
+import mmap
+import time
+import glob
+import struct
+import bisect
+import random
+import binascii
+import tempfile
+import multiprocessing
+import Sudoku_IO
+from Sudoku_Board import Sudoku_Board, Compact_Sudoku_Board
+
+# Packed binary archive of puzzles
+#
+#   header    16 bytes: 'SDKA', version, board_size, block_size, flags, record_size (little endian), 4 unused
+#   records   record_size bytes each, back to back
+#
+# A record is the cells of a puzzle packed by Sudoku_IO.pack_cells (4 bits per cell, 41 bytes for a 9x9
+# board, one byte per cell from 16x16 up), followed by the packed cells of its solution when the flags hold
+# WITH_SOLUTIONS.  A puzzle without a solution keeps a record of blanks there.  Every record has the same
+# size, so record i starts at HEADER.size + i * record_size and the number of records is given by the size
+# of the file.  Readers map the file into memory and decode any record without reading the ones before it.
+#
+# Producers running in parallel each write a shard of their own (see shard_path), the shards are read as
+# one archive by Archive_Set or joined into one file by merge_archives.
+
+MAGIC = 'SDKA'
+VERSION = 1
+HEADER = struct.Struct('<4sBBBBI4x')
+WITH_SOLUTIONS = 1 # flag: every record holds a solution after the puzzle
+WRITE_BUFFER = 4096 # records packed at once by Archive_Writer
+
+# input: board_size
+# output: number of bytes of one board packed by Sudoku_IO.pack_cells
+def packed_size(board_size):
+    count = board_size * board_size
+    return count if count >= 256 else (count + 1) / 2
+
+# input: a Compact_Sudoku_Board, a Sudoku_Board, a puzzle line or a bytearray of cell values
+# output: the cell values, the cells of a Compact_Sudoku_Board are returned as they are
+def cells_of(board):
+    if isinstance(board, bytearray):
+        return board
+    if isinstance(board, basestring):
+        return Sudoku_IO.parse_cells(board)
+    if hasattr(board, 'cells'):
+        return board.cells
+    return bytearray(value for row in board.board for value in row)
+
+# input: an iterable of boards (anything cells_of takes), or of (puzzle, solution or None) pairs when
+#        with_solutions is True, and board_size
+# output: str of the records, packed in one pass over all of them
+def encode_records(items, board_size, with_solutions = False):
+    count = board_size * board_size
+    pad = '\0' if count % 2 and count < 256 else '' # every record fills whole bytes
+    blank = '\0' * count + pad
+    parts = []
+    for item in items:
+        if with_solutions:
+            puzzle, solution = item
+            parts.append(str(cells_of(puzzle)) + pad)
+            parts.append(blank if solution is None else str(cells_of(solution)) + pad)
+        else:
+            parts.append(str(cells_of(item)) + pad)
+    data = ''.join(parts)
+    if count >= 256:
+        return data
+    return binascii.unhexlify(data.translate(Sudoku_IO.VALUE_TO_HEX))
+
+# input: str of whole records, board_size and whether the records hold solutions
+# output: list of bytearrays of the cells of every puzzle, or of (cells, solution cells or None) pairs when
+#         with_solutions is True
+def decode_records(data, board_size, with_solutions = False):
+    count = board_size * board_size
+    if count >= 256:
+        values, size = data, count
+    else:
+        values, size = binascii.hexlify(data).translate(Sudoku_IO.HEX_TO_VALUE), 2 * packed_size(board_size)
+    if not with_solutions:
+        return [bytearray(values[start:start + count]) for start in xrange(0, len(values), size)]
+    blank = '\0' * count
+    records = []
+    for start in xrange(0, len(values), 2 * size):
+        solution = values[start + size:start + size + count]
+        records.append((bytearray(values[start:start + count]), None if solution == blank else bytearray(solution)))
+    return records
+
+# input: a path prefix and the number of a shard
+# output: the path of the shard
+def shard_path(prefix, shard):
+    return '%s-%05d.sdka' % (prefix, shard)
+
+class Archive_Writer(object):
+    # input: a path, board_size, block_size (its square root when None), whether records hold solutions and
+    #        whether to add to the records of an existing archive (its header must match)
+    # output: a writer, records are packed WRITE_BUFFER at a time
+    def __init__(self, path, board_size = 9, block_size = None, with_solutions = False, append = False):
+        self.board_size = board_size
+        self.block_size = block_size or int(round(board_size ** 0.5))
+        assert self.block_size * self.block_size == board_size
+        self.with_solutions = with_solutions
+        self.record_size = packed_size(board_size) * (2 if with_solutions else 1)
+        self.header = HEADER.pack(MAGIC, VERSION, board_size, self.block_size,
+                                  WITH_SOLUTIONS if with_solutions else 0, self.record_size)
+        if append and os.path.exists(path) and os.path.getsize(path) > 0:
+            the_file = open(path, 'rb')
+            assert the_file.read(HEADER.size) == self.header
+            the_file.close()
+            self.file = open(path, 'ab', Sudoku_IO.BUFFER_SIZE)
+        else:
+            self.file = open(path, 'wb', Sudoku_IO.BUFFER_SIZE)
+            self.file.write(self.header)
+        self.buffer = []
+        self.count = 0 # records written by this writer
+
+    # input: a board (anything cells_of takes) and its solution, which is required to be None when the
+    #        archive holds no solutions
+    # output: none, the record is written once the buffer is full or on flush()
+    def write(self, puzzle, solution = None):
+        assert solution is None or self.with_solutions
+        self.buffer.append((puzzle, solution) if self.with_solutions else puzzle)
+        self.count += 1
+        if len(self.buffer) >= WRITE_BUFFER:
+            self.flush()
+
+    # input: an iterable of boards, or of (puzzle, solution) pairs when the archive holds solutions
+    # output: the number of records written
+    def write_many(self, items):
+        written = 0
+        for item in items:
+            if self.with_solutions:
+                self.write(item[0], item[1])
+            else:
+                self.write(item)
+            written += 1
+        return written
+
+    def flush(self):
+        if self.buffer:
+            self.file.write(encode_records(self.buffer, self.board_size, self.with_solutions))
+            self.buffer = []
+        self.file.flush()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+class Archive_Reader(object):
+    # input: a path of an archive
+    # output: a reader of the records of the archive through a memory map
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        magic, version, self.board_size, self.block_size, flags, self.record_size = HEADER.unpack(
+            self.file.read(HEADER.size))
+        assert magic == MAGIC and version == VERSION
+        self.with_solutions = bool(flags & WITH_SOLUTIONS)
+        self.map = mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ)
+        self.count = (len(self.map) - HEADER.size) / self.record_size # a partly written last record is ignored
+
+    def __len__(self):
+        return self.count
+
+    # input: the first record and the one after the last
+    # output: list of the cells of the records (pairs with their solutions when the archive holds them)
+    def read_cells(self, start, stop):
+        start, stop = max(start, 0), min(stop, self.count)
+        if start >= stop:
+            return []
+        offset = HEADER.size + start * self.record_size
+        data = self.map[offset:offset + (stop - start) * self.record_size]
+        return decode_records(data, self.board_size, self.with_solutions)
+
+    # input: the index of a record (negative from the end)
+    # output: the cells of the record, or (cells, solution cells or None) when the archive holds solutions
+    def get_cells(self, index):
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        return self.read_cells(index, index + 1)[0]
+
+    # input: cells, or (cells, solution cells or None)
+    # output: Compact_Sudoku_Board, or (puzzle, solution or None) boards
+    def to_boards(self, record):
+        n, block_size = self.board_size, self.block_size
+        if not self.with_solutions:
+            return Compact_Sudoku_Board.from_cells(record, n, block_size)
+        puzzle, solution = record
+        solved = None if solution is None else Compact_Sudoku_Board.from_cells(solution, n, block_size)
+        return Compact_Sudoku_Board.from_cells(puzzle, n, block_size), solved
+
+    # input: the index of a record
+    # output: Compact_Sudoku_Board of the puzzle, or (puzzle, solution or None) when the archive holds solutions
+    def __getitem__(self, index):
+        return self.to_boards(self.get_cells(index))
+
+    # input: the number of records to decode at once
+    # output: generator of the cells of every record, in order
+    def iter_cells(self, chunk_size = WRITE_BUFFER):
+        for start in xrange(0, self.count, chunk_size):
+            for record in self.read_cells(start, start + chunk_size):
+                yield record
+
+    def __iter__(self):
+        for record in self.iter_cells():
+            yield self.to_boards(record)
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+class Archive_Set(object):
+    # input: paths of archives of the same board size (such as the shards of one producer run, see
+    #        shard_path), or a glob pattern
+    # output: one archive of the records of all of them, in the order of the paths
+    def __init__(self, paths):
+        if isinstance(paths, basestring):
+            paths = sorted(glob.glob(paths))
+        self.readers = [Archive_Reader(path) for path in paths]
+        assert len(set((r.board_size, r.with_solutions) for r in self.readers)) <= 1
+        self.starts = [] # index of the first record of every reader
+        self.count = 0
+        for reader in self.readers:
+            self.starts.append(self.count)
+            self.count += len(reader)
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        shard = bisect.bisect_right(self.starts, index) - 1
+        return self.readers[shard][index - self.starts[shard]]
+
+    def __iter__(self):
+        for reader in self.readers:
+            for boards in reader:
+                yield boards
+
+    def close(self):
+        for reader in self.readers:
+            reader.close()
+
+# input: paths of archives with the same header and the path of the archive to write
+# output: the number of records copied, the records are copied as they are without being decoded
+def merge_archives(paths, destination):
+    output = open(destination, 'wb', Sudoku_IO.BUFFER_SIZE)
+    header = None
+    count = 0
+    try:
+        for path in paths:
+            the_file = open(path, 'rb', Sudoku_IO.BUFFER_SIZE)
+            this_header = the_file.read(HEADER.size)
+            if header is None:
+                header = this_header
+                output.write(header)
+            assert this_header == header
+            record_size = HEADER.unpack(header)[5]
+            records = (os.fstat(the_file.fileno()).st_size - HEADER.size) / record_size
+            left = records * record_size
+            while left > 0:
+                data = the_file.read(min(left, Sudoku_IO.BUFFER_SIZE))
+                output.write(data)
+                left -= len(data)
+            the_file.close()
+            count += records
+    finally:
+        output.close()
+    return count
+
+# input: the path of a text file and the number of parts
+# output: list of (begin, end) byte offsets cutting the file into parts of about the same size
+def byte_ranges(path, parts):
+    size = os.path.getsize(path)
+    return [(part * size / parts, (part + 1) * size / parts) for part in xrange(parts)]
+
+# input: the path of a text file and a byte range
+# output: generator of the lines starting inside the range, so ranges that cut a file into parts give
+#         every line once without any part reading the others
+def iter_range_lines(path, begin, end):
+    the_file = open(path, 'rb', Sudoku_IO.BUFFER_SIZE)
+    try:
+        if begin > 0:
+            the_file.seek(begin - 1)
+            the_file.readline() # the rest of the line started before the range
+        while the_file.tell() < end:
+            line = the_file.readline()
+            if not line:
+                break
+            yield line
+    finally:
+        the_file.close()
+
+# input: (path of the shard, board_size, path of a text file of puzzles, first byte, byte after the last,
+#        whether to copy the solution column), one task of a parallel producer (see byte_ranges)
+# output: the number of records written, puzzles of another size are skipped
+def write_shard(task):
+    path, board_size, source, begin, end, with_solutions = task
+    writer = Archive_Writer(path, board_size, with_solutions = with_solutions)
+    for puzzle, cells, solution in Sudoku_IO.read_records(iter_range_lines(source, begin, end)):
+        if len(cells) == board_size * board_size:
+            if with_solutions:
+                solution = Sudoku_IO.parse_cells(solution) if solution is not None else None
+                writer.write(cells, solution if solution is not None and len(solution) == len(cells) else None)
+            else:
+                writer.write(cells)
+    writer.close()
+    return writer.count
+
+# Program runs from here
+
+if __name__ == "__main__":
+    TEST = len(sys.argv) == 1
+    if not TEST:
+        import argparse
+        parser = argparse.ArgumentParser(description = 'Pack a file of sudoku puzzles into an archive, or unpack one.')
+        parser.add_argument('command', choices = ('pack', 'unpack'))
+        parser.add_argument('input', help = 'puzzle file to pack, or archive to unpack')
+        parser.add_argument('output', help = 'archive to write, or puzzle file to write (- for stdout)')
+        parser.add_argument('--size', type = int, default = 9, help = 'board size of the puzzles to pack')
+        parser.add_argument('--solutions', action = 'store_true', help = 'pack the solution column too')
+        parser.add_argument('--workers', type = int, default = 1, help = 'processes packing one shard each')
+        args = parser.parse_args()
+        start = time.time()
+        if args.command == 'unpack':
+            archive = Archive_Set(args.input)
+            count = Sudoku_IO.write_puzzles(sys.stdout if args.output == '-' else args.output, archive)
+        elif args.workers == 1:
+            writer = Archive_Writer(args.output, args.size, with_solutions = args.solutions)
+            for puzzle, cells, solution in Sudoku_IO.read_records(args.input):
+                if len(cells) == args.size * args.size:
+                    if args.solutions:
+                        solution = Sudoku_IO.parse_cells(solution) if solution is not None else None
+                        writer.write(cells, solution if solution is not None and len(solution) == len(cells) else None)
+                    else:
+                        writer.write(cells)
+            writer.close()
+            count = writer.count
+        else:
+            tasks = [(shard_path(args.output, shard), args.size, args.input, begin, end, args.solutions)
+                     for shard, (begin, end) in enumerate(byte_ranges(args.input, args.workers))]
+            pool = multiprocessing.Pool(args.workers)
+            count = sum(pool.map(write_shard, tasks))
+            pool.close()
+            pool.join()
+        sys.stderr.write('%d puzzles in %.2f seconds\n' % (count, time.time() - start))
+    else:
+        print "Running sudoku archive tests.\n"
+        test_count = 0
+        pass_count = 0
+        fail_count = 0
+        time_start = time.time()
+
+        def test_message(passed_test, message):
+            global pass_count
+            global fail_count
+            global test_count
+            test_count += 1
+            if passed_test:
+                print ">>> PASSED TEST: " + message + "\n"
+                pass_count += 1
+            else:
+                print "!!! FAILED TEST: " + message + " !!!\n"
+                fail_count += 1
+
+        boards = [Sudoku_Board.generate_random_board(random.randint(0, 81)) for x in xrange(50)]
+        solutions = [board.solve_board('propagate') for board in boards]
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'puzzles.sdka')
+
+        # TEST: 41 bytes per 9x9 puzzle, written then read back in order and at random
+        m = 'Archive_Writer then Archive_Reader round trip'
+        writer = Archive_Writer(path)
+        test_result = writer.write_many(boards) == len(boards)
+        writer.close()
+        test_result = test_result and os.path.getsize(path) == HEADER.size + 41 * len(boards)
+        reader = Archive_Reader(path)
+        test_result = test_result and len(reader) == len(boards) and (reader.board_size, reader.block_size) == (9, 3)
+        test_result = test_result and [compact.to_board().board for compact in reader] == [b.board for b in boards]
+        for index in random.sample(xrange(len(boards)), 10) + [-1]:
+            test_result = test_result and reader[index].to_board().board == boards[index].board
+        # candidates computed from the decoded cells match those built from the board
+        test_result = test_result and reader[3].candidates == Compact_Sudoku_Board.from_board(boards[3]).candidates
+        try:
+            reader[len(boards)]
+            test_result = False
+        except IndexError:
+            pass
+        reader.close()
+        test_message(test_result, m)
+
+        # TEST: solutions after the puzzles, None for puzzles without one
+        m = 'records with solutions'
+        writer = Archive_Writer(path, with_solutions = True)
+        for board, solution in zip(boards, solutions):
+            writer.write(board, solution)
+        writer.write('12345678.' + '.' * 8 + '9' + '.' * 63)
+        writer.close()
+        reader = Archive_Reader(path)
+        test_result = reader.with_solutions and len(reader) == len(boards) + 1 and reader.record_size == 82
+        for index in xrange(len(boards)):
+            puzzle, solved = reader[index]
+            test_result = test_result and puzzle.to_board().board == boards[index].board
+            test_result = test_result and solved.to_board().board == solutions[index].board
+        test_result = test_result and reader[-1][1] is None
+        reader.close()
+        test_message(test_result, m)
+
+        # TEST: appending keeps the records already written
+        m = 'append to an archive'
+        writer = Archive_Writer(path, with_solutions = True, append = True)
+        writer.write(boards[0], solutions[0])
+        writer.close()
+        reader = Archive_Reader(path)
+        test_result = len(reader) == len(boards) + 2 and reader[-1][0].to_board().board == boards[0].board
+        test_result = test_result and reader.read_cells(0, len(boards)) == \
+            [(cells_of(b), cells_of(s)) for b, s in zip(boards, solutions)]
+        reader.close()
+        test_message(test_result, m)
+
+        # TEST: larger boards keep one byte per cell
+        m = '16x16 and 25x25 archives'
+        test_result = True
+        for n in (16, 25):
+            big = [Sudoku_Board.generate_random_board(n * n / 2, n) for x in xrange(3)]
+            writer = Archive_Writer(path, n)
+            writer.write_many(big)
+            writer.close()
+            reader = Archive_Reader(path)
+            test_result = test_result and reader.block_size * reader.block_size == n and reader.record_size == n * n
+            test_result = test_result and [compact.to_board().board for compact in reader] == [b.board for b in big]
+            reader.close()
+        test_message(test_result, m)
+
+        # TEST: shards written by parallel producers, read as one archive and merged into one file
+        m = 'write_shard() in a pool, Archive_Set and merge_archives()'
+        text = os.path.join(directory, 'puzzles.txt')
+        Sudoku_IO.write_puzzles(text, zip(boards, solutions))
+        prefix = os.path.join(directory, 'shard')
+        tasks = [(shard_path(prefix, shard), 9, text, begin, end, True)
+                 for shard, (begin, end) in enumerate(byte_ranges(text, 4))]
+        pool = multiprocessing.Pool(2)
+        counts = pool.map(write_shard, tasks)
+        test_result = sum(counts) == len(boards) and min(counts) > 0
+        pool.close()
+        pool.join()
+        archive = Archive_Set(prefix + '-*.sdka')
+        test_result = test_result and len(archive) == len(boards)
+        for index in (0, 14, 15, 31, 49, -1):
+            puzzle, solved = archive[index]
+            test_result = test_result and puzzle.to_board().board == boards[index].board
+            test_result = test_result and solved.to_board().board == solutions[index].board
+        test_result = test_result and [p.to_board().board for p, s in archive] == [b.board for b in boards]
+        archive.close()
+        test_result = test_result and merge_archives([t[0] for t in tasks], path) == len(boards)
+        reader = Archive_Reader(path)
+        test_result = test_result and [p.to_board().board for p, s in reader] == [b.board for b in boards]
+        reader.close()
+        # ranges cutting lines anywhere, and ranges of a few bytes, still give every line once
+        lines = list(Sudoku_IO.iter_raw_lines(text))
+        for parts in (3, 7, 50, 1000):
+            test_result = test_result and \
+                [line for begin, end in byte_ranges(text, parts) for line in iter_range_lines(text, begin, end)] == lines
+        test_message(test_result, m)
+
+        # TEST: bulk encode and decode against pack_cells one board at a time
+        m = 'encode_records() and decode_records()'
+        cells = [cells_of(board) for board in boards]
+        data = encode_records(cells, 9)
+        test_result = data == ''.join(Sudoku_IO.pack_cells(c) for c in cells)
+        test_result = test_result and decode_records(data, 9) == cells
+        test_message(test_result, m)
+
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+        os.rmdir(directory)
+
+        # displays test result summary:
+        time_end = time.time()
+        print "ran a total of " + str(test_count) + " tests."
+        print "test runtime: " + str(time_end - time_start) + " seconds"
+        print "total tests passed: " + str(pass_count)
+        print "total tests failed: " + str(fail_count)
+        print "\n"
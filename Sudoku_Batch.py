@@ -0,0 +1,344 @@
+import sys
+import time
+import Queue
+import random
+import itertools
+import traceback
+import multiprocessing
+import Sudoku_IO
+import Sudoku_DLX
+import Sudoku_Propagator
+
+# Batch solving of many puzzles across a pool of worker processes
+#
+# Puzzles travel between processes as one line of board_size * board_size characters ('.' or '0'
+# for a blank), which is far cheaper to pickle than a Sudoku_Board.  Puzzles are grouped into
+# chunks so every message to a worker carries many puzzles, and only a bounded number of chunks
+# is in flight at once so an input of millions of puzzles is streamed instead of loaded.  The chunks
+# not sent yet stay in this process and one is handed to the pool each time a result is taken, so
+# none of the pool's threads ever waits on the caller and the pool can be shut down at any time.
+
+ENGINES = ('propagate', 'dlx')
+
+# input: a puzzle line (see Sudoku_IO)
+# output: (board_size, block_size, grid) where grid is a 2d list of the values, or None if the line is not a
+#         puzzle (see Sudoku_IO.parse_cells) or its board_size is not a square
+def parse_line(line):
+    cells = Sudoku_IO.parse_cells(line.strip())
+    if cells is None:
+        return None
+    n = int(round(len(cells) ** 0.5))
+    block_size = int(round(n ** 0.5))
+    if block_size * block_size != n:
+        return None
+    return n, block_size, [cells[row * n:(row + 1) * n] for row in xrange(n)]
+
+# input: the values of a board in cell order (row * board_size + col)
+# output: the puzzle line, '.' for a blank
+def format_values(values):
+    return Sudoku_IO.format_cells(bytearray(values))
+
+# input: a Sudoku_Board, a Compact_Sudoku_Board or a puzzle line
+# output: the puzzle line
+def to_line(puzzle):
+    return Sudoku_IO.format_board(puzzle).strip()
+
+# output: True if no row, col or sub block of grid holds a duplicate
+def grid_is_valid(board_size, block_size, grid):
+    used = [0] * (3 * board_size)
+    for row in xrange(board_size):
+        for col in xrange(board_size):
+            value = grid[row][col]
+            if value != 0:
+                bit = 1 << value
+                for unit in (row, board_size + col,
+                             2 * board_size + (row / block_size) * block_size + col / block_size):
+                    if used[unit] & bit:
+                        return False
+                    used[unit] |= bit
+    return True
+
+# input: a puzzle line, the engine to solve it with (see ENGINES) and optionally the Sudoku_Stats.Search_Limits
+#        to stop at (limits.reason is then set when they stopped the search)
+# output: the solution line, or None if the puzzle is not valid or not solveable
+def solve_line(line, engine = 'propagate', limits = None):
+    parsed = parse_line(line)
+    if parsed is None:
+        return None
+    n, block_size, grid = parsed
+    if not grid_is_valid(n, block_size, grid):
+        return None
+    if engine == 'dlx':
+        solver = Sudoku_DLX.Dancing_Links(n, block_size, grid)
+        solver.limits = limits
+        placements = solver.solve()
+        if placements is None:
+            return None
+        for row, col, value in placements:
+            grid[row][col] = value
+        return format_values(value for row in grid for value in row)
+    propagator = Sudoku_Propagator.Propagator(n, block_size, grid)
+    propagator.limits = limits
+    values = propagator.solve()
+    if values is None:
+        return None
+    return format_values(values)
+
+# input: (engine, chunk) where chunk is a list of (index, puzzle line)
+# output: list of (index, puzzle line, solution line or None), runs inside a worker process
+def solve_chunk(task):
+    engine, chunk = task
+    return [(index, line, solve_line(line, engine)) for index, line in chunk]
+
+# input: the task of solve_chunk()
+# output: (its results, None), or (None, the traceback) if it raised.  Pool.apply_async in Python 2 has no
+#         error callback, so solve_many() would otherwise wait for ever on a chunk that failed.
+def solve_task(task):
+    try:
+        return solve_chunk(task), None
+    except Exception:
+        return None, traceback.format_exc()
+
+# input: an iterable and a chunk size
+# output: generator of lists of up to chunksize items
+def chunked(iterable, chunksize):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, chunksize))
+        if not chunk:
+            return
+        yield chunk
+
+# input: an iterable of puzzles (lines or Sudoku_Boards), the number of worker processes (None for one per
+#        core, 1 to solve in this process), puzzles per chunk, whether to keep the input order and the engine
+# output: generator of (index, puzzle line, solution line or None), by default as soon as each chunk is done
+def solve_many(puzzles, workers = None, chunksize = 64, ordered = False, engine = 'propagate'):
+    assert engine in ENGINES
+    chunks = chunked(enumerate(to_line(puzzle) for puzzle in puzzles), chunksize)
+    if workers == 1:
+        for chunk in chunks:
+            for result in solve_chunk((engine, chunk)):
+                yield result
+        return
+    # at most 4 chunks per worker are waiting, running or done but not yet yielded
+    window = 4 * (workers or multiprocessing.cpu_count())
+    pool = multiprocessing.Pool(workers)
+    finished = Queue.Queue() # (chunk number, result of solve_task) as the workers finish them
+    done = {} # chunk number -> results not yielded yet
+    submitted = yielded = 0
+    try:
+        while True:
+            while submitted - yielded < window:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                pool.apply_async(solve_task, ((engine, chunk),),
+                                 callback = lambda result, number = submitted: finished.put((number, result)))
+                submitted += 1
+            if yielded == submitted:
+                break
+            number, (chunk_results, error) = finished.get()
+            if error is not None:
+                raise RuntimeError('a chunk failed in a worker:\n' + error)
+            done[number] = chunk_results
+            key = yielded if ordered else number
+            while key in done:
+                yielded += 1
+                for result in done.pop(key):
+                    yield result
+                key = yielded
+    finally:
+        # the chunks already sent are at most window, the workers finish them and exit
+        pool.close()
+        pool.join()
+
+# input: puzzle lines, a store of solutions (see Sudoku_Cache.Solution_Store), the options of solve_many and
+#        the number of puzzles to look up at once
+# output: generator of (index, puzzle line, solution line or None) in input order.  Every batch of puzzles is
+#         looked up in the store with one query, only the misses are solved and they are then stored.
+def solve_stored(puzzles, store, workers = None, chunksize = 64, engine = 'propagate', batch_size = 4096):
+    index = 0
+    for batch in chunked((to_line(puzzle) for puzzle in puzzles), batch_size):
+        found = store.get_many(batch)
+        misses = list(set(line for line in batch if line not in found))
+        solved = {}
+        if misses:
+            pool_workers = workers if len(misses) > chunksize else 1 # not worth starting a pool
+            for miss_index, line, solution in solve_many(misses, pool_workers, chunksize, False, engine):
+                solved[line] = solution
+            store.put_many(solved.iteritems())
+        for line in batch:
+            yield index, line, (found[line] if line in found else solved[line])
+            index += 1
+
+# input: a puzzle file (path or open file, see Sudoku_IO), where to write the results, the options of
+#        solve_many (results are kept in input order by default), and optionally a store of solutions to
+#        reuse and fill (see solve_stored)
+# output: the number of puzzles written as "puzzle,solution" lines (empty solution when there is none)
+# The whole file goes through read -> solve -> write as one stream.
+def solve_file(source, destination, workers = None, chunksize = 64, ordered = True, engine = 'propagate',
+               use_mmap = False, store = None):
+    lines = (puzzle for puzzle, solution in Sudoku_IO.read_lines(source, use_mmap))
+    if store is not None:
+        results = solve_stored(lines, store, workers, chunksize, engine)
+    else:
+        results = solve_many(lines, workers, chunksize, ordered, engine)
+    return Sudoku_IO.write_puzzles(destination, ((line, solution) for index, line, solution in results))
+
+# Program runs from here
+#
+# usage: python Sudoku_Batch.py [--workers N] [--chunksize K] [--unordered] [--engine E] [--mmap]
+#                               [--store FILE] input [output]
+# reads one puzzle per line from input (- for stdin) and writes "puzzle,solution" lines to output (or
+# stdout), the solution is left empty when there is none.  With no arguments the self tests are run.
+
+if __name__ == "__main__":
+    TEST = len(sys.argv) == 1
+    if not TEST:
+        import argparse
+        parser = argparse.ArgumentParser(description = 'Solve a file of sudoku puzzles, one per line.')
+        parser.add_argument('input', help = 'puzzle file, - for stdin')
+        parser.add_argument('output', nargs = '?', default = '-', help = 'result file, - for stdout')
+        parser.add_argument('--workers', type = int, default = None, help = 'worker processes (default: cores)')
+        parser.add_argument('--chunksize', type = int, default = 64, help = 'puzzles per message to a worker')
+        parser.add_argument('--unordered', action = 'store_true', help = 'write results as they are solved')
+        parser.add_argument('--engine', choices = ENGINES, default = 'propagate')
+        parser.add_argument('--mmap', action = 'store_true', help = 'read the input through a memory map')
+        parser.add_argument('--store', default = None, help = 'SQLite file of solutions to reuse and fill')
+        args = parser.parse_args()
+        store = None
+        if args.store:
+            import Sudoku_Cache
+            store = Sudoku_Cache.Solution_Store(args.store)
+        source = sys.stdin if args.input == '-' else args.input
+        destination = sys.stdout if args.output == '-' else args.output
+        start = time.time()
+        count = solve_file(source, destination, args.workers, args.chunksize, not args.unordered, args.engine,
+                           args.mmap, store)
+        if store is not None:
+            store.close() # writes the used times and counts the lookups kept in memory
+        elapsed = time.time() - start
+        sys.stderr.write('solved ' + str(count) + ' puzzles in ' + str(elapsed) + ' seconds ('
+                         + str(count / max(elapsed, 1e-9)) + ' puzzles / second)\n')
+    else:
+        from Sudoku_Board import Sudoku_Board
+        test_count = 0
+        pass_count = 0
+        fail_count = 0
+        time_start = time.time()
+
+        def test_message(passed_test, message):
+            global pass_count
+            global fail_count
+            global test_count
+            test_count += 1
+            if passed_test:
+                print ">>> PASSED TEST: " + message + "\n"
+                pass_count += 1
+            else:
+                print "!!! FAILED TEST: " + message + " !!!\n"
+                fail_count += 1
+
+        # output: True if solution is a complete valid board that keeps the values of puzzle
+        def solves(puzzle, solution):
+            if solution is None or '.' in solution or len(solution) != len(puzzle):
+                return False
+            n, block_size, grid = parse_line(solution)
+            keeps = all(p == '.' or p == s for p, s in zip(puzzle, solution))
+            return keeps and grid_is_valid(n, block_size, grid)
+
+        print "TESTING BATCH SOLVER\n"
+        puzzles = [to_line(Sudoku_Board.generate_random_board(random.randint(40, 64))) for x in xrange(60)]
+        puzzles.append('8..........36......7..9.2...5...7.......457.....1...3...1....68..85...1..9....4..')
+        bad = '11' + '.' * 79 # duplicate in the first row
+        puzzles.append(bad)
+
+        for engine in ENGINES:
+            for workers in (1, 2):
+                results = list(solve_many(puzzles, workers = workers, chunksize = 7, engine = engine))
+                m = 'solve_many(workers = ' + str(workers) + ', engine = ' + engine + ') solves every puzzle'
+                test_result = sorted(index for index, line, solution in results) == range(len(puzzles))
+                for index, line, solution in results:
+                    if line == bad:
+                        test_result = test_result and solution is None
+                    else:
+                        test_result = test_result and line == puzzles[index] and solves(line, solution)
+                test_message(test_result, m)
+
+        m = 'solve_many(ordered = True) keeps the input order'
+        results = list(solve_many(puzzles, workers = 2, chunksize = 3, ordered = True))
+        test_result = [index for index, line, solution in results] == range(len(puzzles))
+        test_message(test_result, m)
+
+        m = 'solve_line() and solve_many() give None for a line that is not a puzzle'
+        junk = ['12345', 'x' * 81, '.' * 25]
+        test_result = all(solve_line(line) is None for line in junk)
+        results = list(solve_many(puzzles[:5] + junk, workers = 2, chunksize = 2, ordered = True))
+        test_result = test_result and [solution for index, line, solution in results[5:]] == [None] * 3
+        test_result = test_result and all(solves(line, solution) for index, line, solution in results[:5])
+        test_message(test_result, m)
+
+        m = 'solve_many() stops its pool when the caller stops early'
+        results = solve_many(puzzles * 20, workers = 2, chunksize = 1)
+        test_result = len(list(itertools.islice(results, 3))) == 3
+        results.close()
+        test_result = test_result and not multiprocessing.active_children()
+        test_message(test_result, m)
+
+        m = 'a chunk that raises in a worker is raised by solve_many()'
+        solver = solve_chunk
+        def solve_chunk(task): # the workers are forked after this, they see it too
+            raise ValueError('broken chunk')
+        try:
+            list(solve_many(puzzles * 20, workers = 2, chunksize = 1))
+            test_result = False
+        except RuntimeError as error:
+            test_result = 'broken chunk' in str(error)
+        solve_chunk = solver
+        test_result = test_result and not multiprocessing.active_children()
+        test_result = test_result and len(list(solve_many(puzzles, workers = 2, chunksize = 7))) == len(puzzles)
+        test_message(test_result, m)
+
+        m = 'solve_many accepts Sudoku_Board objects'
+        board = Sudoku_Board.generate_random_board()
+        results = list(solve_many([board], workers = 1))
+        test_result = len(results) == 1 and solves(to_line(board), results[0][2])
+        test_message(test_result, m)
+
+        m = 'solve_file() reads, solves and writes a puzzle file in order'
+        import tempfile, os
+        source = tempfile.mktemp(suffix = '.txt')
+        destination = tempfile.mktemp(suffix = '.txt')
+        Sudoku_IO.write_puzzles(source, ['quizzes,solutions'] + puzzles)
+        test_result = solve_file(source, destination, workers = 2, chunksize = 5) == len(puzzles)
+        results = list(Sudoku_IO.read_lines(destination))
+        test_result = test_result and [line for line, solution in results] == puzzles
+        for line, solution in results:
+            test_result = test_result and (solution is None if line == bad else solves(line, solution))
+        test_message(test_result, m)
+        m = 'solve_file(store) solves each puzzle once and reuses the stored solutions'
+        import Sudoku_Cache
+        path = tempfile.mktemp(suffix = '.sqlite')
+        store = Sudoku_Cache.Solution_Store(path)
+        test_result = solve_file(source, destination, workers = 2, chunksize = 5, store = store) == len(puzzles)
+        test_result = test_result and store.misses == len(set(puzzles)) and store.hits == 0
+        store = Sudoku_Cache.Solution_Store(path) # a new process sees the same solutions
+        test_result = test_result and solve_file(source, destination, store = store) == len(puzzles)
+        test_result = test_result and store.hits == len(set(puzzles)) and store.misses == 0
+        results = list(Sudoku_IO.read_lines(destination))
+        test_result = test_result and [line for line, solution in results] == puzzles
+        for line, solution in results:
+            test_result = test_result and (solution is None if line == bad else solves(line, solution))
+        test_message(test_result, m)
+        store.close()
+        os.remove(path)
+        os.remove(source)
+        os.remove(destination)
+
+        # displays test result summary:
+        time_end = time.time()
+        print "ran a total of " + str(test_count) + " tests."
+        print "test runtime: " + str(time_end - time_start) + " seconds"
+        print "total tests passed: " + str(pass_count)
+        print "total tests failed: " + str(fail_count)
+        print "\n"
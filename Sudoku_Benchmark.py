@@ -0,0 +1,361 @@
+import sys
+import time
+import json
+import math
+import random
+import platform
+import resource
+import multiprocessing
+import Sudoku_IO
+import Sudoku_DLX
+import Sudoku_Propagator
+import Sudoku_Stats
+import Sudoku_Symmetry
+from Sudoku_Board import Sudoku_Board
+
+# Reproducible benchmarks of the solver engines
+#
+# Every corpus is built from a seed, so two runs with the same seed solve exactly the same puzzles:
+#   easy      - boards from Sudoku_Board.generate_random_board
+#   hard      - known hard puzzles (and seeded symmetric variants of them)
+#   17clue    - minimal 17 clue puzzles (and seeded symmetric variants of them)
+#   16x16     - seeded random 16x16 grids with cells removed
+#   25x25     - the same on 25x25 grids, with easy and 16x16 it shows how solve time grows with the board size
+# Every engine (and every heuristic of the propagate engine) solves every corpus in its own process, which
+# reports per puzzle latency percentiles, throughput, search nodes and the peak memory of the process.
+# The results are written as json so two runs can be compared with compare().
+
+HARD_PUZZLES = ['8..........36......7..9.2...5...7.......457.....1...3...1....68..85...1..9....4..', # Inkala 2012
+                '1....7.9..3..2...8..96..5....53..9...1..8...26....4...3......1..4......7..7...3..', # AI Escargot
+                '1.......2.9.4...5...6...7...5.9.3.......7.......85..4.7.....6...3...9.8...2.....1', # Easter Monster
+                '..53.....8......2..7..1.5..4....53...1..7...6..32...8..6.5....9..4....3......97..']
+
+SEVENTEEN_CLUE_PUZZLES = ['.......1.4.........2...........5.4.7..8...3....1.9....3..4..2...5.1........8.6...',
+                          '.......1.4.........2...........5.6.4..8...3....1.9....3..4..2...5.1........8.7...',
+                          '.......12....35......6...7.7.....3.....4..8..1...........12.....8.....4..5....6..',
+                          '.......12..36..........7...41..2.......5..3..7.....6..28.....4....3..5...........',
+                          '.......12..8.3...........4.12.5..........47...6.......5.7...3.....62.......1.....']
+
+CORPORA = ('easy', 'hard', '17clue', '16x16', '25x25')
+CORPUS_SIZES = {'easy': 50, 'hard': 12, '17clue': 20, '16x16': 8, '25x25': 4}
+SIZE_CORPORA = {'easy': 9, '16x16': 16, '25x25': 25} # corpus -> board size, for scaling()
+
+# (engine, heuristic) pairs
+ENGINES = [('backtrack', None), ('trail', None), ('dlx', None)] + \
+          [('propagate', name) for name in sorted(Sudoku_Propagator.HEURISTICS)]
+
+# input: board_size, block_size and a random.Random
+# output: a complete grid (2d list), a pattern grid shuffled by rows, cols, bands, stacks and digits.  It is
+#         not searched for like Sudoku_Generator.full_grid, so it costs the same on every size and a corpus
+#         seed gives the same grids from one run to the next, which the benchmark corpora rely on.
+def pattern_grid(board_size, block_size, rng):
+    n, bs = board_size, block_size
+    rows, cols = Sudoku_Symmetry.shuffled_lines(bs, rng), Sudoku_Symmetry.shuffled_lines(bs, rng)
+    digits = range(1, n + 1)
+    rng.shuffle(digits)
+    return [[digits[(bs * (row % bs) + row / bs + col) % n] for col in cols] for row in rows]
+
+# input: a puzzle line, block_size and a random.Random
+# output: the puzzle after a random symmetry (rows and cols within bands / stacks, bands, stacks, transpose
+#         and digit relabeling), it has the same number of solutions and about the same difficulty
+def transform_line(line, block_size, rng):
+    n = block_size * block_size
+    cells = Sudoku_IO.parse_cells(line)
+    rows, cols = Sudoku_Symmetry.shuffled_lines(block_size, rng), Sudoku_Symmetry.shuffled_lines(block_size, rng)
+    digits = range(1, n + 1)
+    rng.shuffle(digits)
+    digits = [0] + digits
+    transpose = rng.random() < 0.5
+    result = bytearray(n * n)
+    for row in xrange(n):
+        for col in xrange(n):
+            value = digits[cells[rows[row] * n + cols[col]]]
+            if transpose:
+                result[col * n + row] = value
+            else:
+                result[row * n + col] = value
+    return Sudoku_IO.format_cells(result)
+
+# input: a corpus name (see CORPORA), the seed and the number of puzzles (None for the default size)
+# output: list of puzzle lines, the same for the same arguments
+def build_corpus(name, seed = 0, size = None):
+    assert name in CORPORA
+    if size is None:
+        size = CORPUS_SIZES[name]
+    rng = random.Random('%s-%d' % (name, seed))
+    if name == 'easy':
+        # generate_random_board draws from the global random, keep the caller's sequence untouched
+        state = random.getstate()
+        random.seed(rng.random())
+        try:
+            return [Sudoku_IO.format_board(Sudoku_Board.generate_random_board(rng.randint(40, 55)))
+                    for x in xrange(size)]
+        finally:
+            random.setstate(state)
+    if name in ('hard', '17clue'):
+        base = HARD_PUZZLES if name == 'hard' else SEVENTEEN_CLUE_PUZZLES
+        return [base[x] if x < len(base) else transform_line(rng.choice(base), 3, rng) for x in xrange(size)]
+    n, block_size = SIZE_CORPORA[name], int(round(SIZE_CORPORA[name] ** 0.5))
+    lines = []
+    for x in xrange(size):
+        cells = bytearray(value for row in pattern_grid(n, block_size, rng) for value in row)
+        for i in rng.sample(xrange(n * n), n * n * 15 / 32): # 120 of the 256 cells of a 16x16 board
+            cells[i] = 0
+        lines.append(Sudoku_IO.format_cells(cells))
+    return lines
+
+# input: a puzzle line, the engine and the heuristic (for the propagate engine)
+# output: (seconds, nodes, backtracks, solved) of solving the puzzle once
+def solve_one(line, engine, heuristic):
+    cells = Sudoku_IO.parse_cells(line)
+    n = int(round(len(cells) ** 0.5))
+    block_size = int(round(n ** 0.5))
+    grid = [list(cells[row * n:(row + 1) * n]) for row in xrange(n)]
+    board = Sudoku_Board(n, block_size)
+    board.fill(grid)
+    stats = Sudoku_Stats.Solver_Stats()
+    start = time.time()
+    solution = board.solve_board(engine, heuristic or 'mrv', stats = stats)
+    return time.time() - start, stats.nodes, stats.backtracks, solution is not None
+
+# input: a sorted list of numbers and a percentile (0 - 100)
+# output: the nearest rank percentile
+def percentile(values, p):
+    if not values:
+        return None
+    rank = int(math.ceil(p / 100.0 * len(values))) - 1
+    return values[min(max(rank, 0), len(values) - 1)]
+
+# input: (corpus name, puzzle lines, engine, heuristic, repeat)
+# output: dict of the measurements, runs inside a fresh worker process so peak memory is its own
+def run_cell(task):
+    corpus, lines, engine, heuristic, repeat = task
+    rss_start = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    latencies = []
+    nodes = []
+    backtracks = 0
+    solved = 0
+    wall_start = time.time()
+    for line in lines:
+        best = None
+        for x in xrange(repeat): # keep the fastest of repeat runs of each puzzle
+            seconds, puzzle_nodes, puzzle_backtracks, puzzle_solved = solve_one(line, engine, heuristic)
+            if best is None or seconds < best:
+                best = seconds
+        latencies.append(best)
+        nodes.append(puzzle_nodes)
+        backtracks += puzzle_backtracks
+        solved += puzzle_solved
+    wall = time.time() - wall_start
+    latencies.sort()
+    return {'corpus': corpus, 'engine': engine, 'heuristic': heuristic, 'puzzles': len(lines), 'solved': solved,
+            'latency': {'min': latencies[0], 'p50': percentile(latencies, 50), 'p90': percentile(latencies, 90),
+                        'p99': percentile(latencies, 99), 'max': latencies[-1],
+                        'mean': sum(latencies) / len(latencies)},
+            'throughput': len(lines) * repeat / max(wall, 1e-9), # puzzles per second
+            'nodes': {'total': sum(nodes), 'mean': float(sum(nodes)) / len(nodes), 'max': max(nodes)},
+            'backtracks': backtracks,
+            'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            'start_rss_kb': rss_start}
+
+# input: the seed, the corpora and (engine, heuristic) pairs to run, corpus size overrides (dict), runs per
+#        puzzle, whether to run every cell in its own process, and a callback(result) called as cells finish
+# output: dict ready to be dumped as json: {'meta': ..., 'results': [one dict per corpus and engine]}
+def run_benchmark(seed = 0, corpora = CORPORA, engines = ENGINES, sizes = None, repeat = 1, isolate = True,
+                  progress = None):
+    sizes = sizes or {}
+    meta = {'seed': seed, 'repeat': repeat, 'isolated': isolate, 'python': platform.python_version(),
+            'platform': platform.platform(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'corpora': {}}
+    results = []
+    for corpus in corpora:
+        lines = build_corpus(corpus, seed, sizes.get(corpus))
+        meta['corpora'][corpus] = len(lines)
+        for engine, heuristic in engines:
+            task = (corpus, lines, engine, heuristic, repeat)
+            if isolate:
+                pool = multiprocessing.Pool(1)
+                try:
+                    result = pool.apply(run_cell, (task,))
+                finally:
+                    pool.terminate()
+                    pool.join()
+            else:
+                result = run_cell(task)
+            results.append(result)
+            if progress is not None:
+                progress(result)
+    return {'meta': meta, 'results': results}
+
+# output: the key naming the row of a result, such as "hard propagate/mrv"
+def result_key(result):
+    engine = result['engine'] if result['heuristic'] is None else result['engine'] + '/' + result['heuristic']
+    return result['corpus'] + ' ' + engine
+
+# input: the json dicts of a baseline and a new run, and the slowdown ratio that counts as a regression
+# output: list of (key, baseline p50, new p50, ratio, regressed) for the rows found in both runs
+def compare(baseline, current, threshold = 1.2):
+    old = dict((result_key(result), result) for result in baseline['results'])
+    rows = []
+    for result in current['results']:
+        key = result_key(result)
+        if key in old:
+            before = old[key]['latency']['p50']
+            after = result['latency']['p50']
+            ratio = after / max(before, 1e-9)
+            rows.append((key, before, after, ratio, ratio > threshold or result['solved'] < old[key]['solved']))
+    return rows
+
+# input: the json dict of a run
+# output: list of (engine key, [(board size, p50 seconds), ...] smallest board first) for every engine that ran
+#         more than one of the SIZE_CORPORA
+def scaling(results):
+    by_engine = {}
+    for result in results['results']:
+        if result['corpus'] in SIZE_CORPORA:
+            engine = result_key(result).split(' ', 1)[1]
+            by_engine.setdefault(engine, []).append((SIZE_CORPORA[result['corpus']], result['latency']['p50']))
+    return [(engine, sorted(points)) for engine, points in sorted(by_engine.iteritems()) if len(points) > 1]
+
+# output: a one line summary of a result
+def format_result(result):
+    latency = result['latency']
+    return '%-34s %3d/%-3d p50 %9.3f ms  p90 %9.3f ms  p99 %9.3f ms  %8.1f/s  nodes %7.1f  rss %6d kb' % (
+        result_key(result), result['solved'], result['puzzles'], latency['p50'] * 1000, latency['p90'] * 1000,
+        latency['p99'] * 1000, result['throughput'], result['nodes']['mean'], result['peak_rss_kb'])
+
+# Program runs from here
+#
+# usage: python Sudoku_Benchmark.py [--seed S] [--corpora C,C] [--engines E,E] [--size corpus=N] [--repeat R]
+#                                   [--no-isolate] [--compare baseline.json] output.json
+# engines are named like "dlx" or "propagate/lcv".  With no arguments the self tests are run.
+
+if __name__ == "__main__":
+    TEST = len(sys.argv) == 1
+    if not TEST:
+        import argparse
+        parser = argparse.ArgumentParser(description = 'Benchmark the sudoku solver engines.')
+        parser.add_argument('output', help = 'json file to write the results to, - for stdout')
+        parser.add_argument('--seed', type = int, default = 0)
+        parser.add_argument('--corpora', default = ','.join(CORPORA))
+        parser.add_argument('--engines', default = None, help = 'comma separated, default: every engine')
+        parser.add_argument('--size', action = 'append', default = [], help = 'corpus=N, overrides a corpus size')
+        parser.add_argument('--repeat', type = int, default = 1, help = 'runs per puzzle, the fastest is kept')
+        parser.add_argument('--no-isolate', action = 'store_true', help = 'run every engine in this process')
+        parser.add_argument('--compare', default = None, help = 'baseline json to check for regressions')
+        parser.add_argument('--threshold', type = float, default = 1.2, help = 'p50 slowdown that is a regression')
+        args = parser.parse_args()
+        engines = ENGINES
+        if args.engines:
+            engines = []
+            for name in args.engines.split(','):
+                engine, slash, heuristic = name.partition('/')
+                engines.append((engine, heuristic or ('mrv' if engine == 'propagate' else None)))
+        sizes = dict((corpus, int(size)) for corpus, size in (item.split('=') for item in args.size))
+        report = lambda result: sys.stderr.write(format_result(result) + '\n')
+        results = run_benchmark(args.seed, args.corpora.split(','), engines, sizes, args.repeat,
+                                not args.no_isolate, report)
+        for engine, points in scaling(results):
+            sys.stderr.write('%-22s' % engine + ''.join('  %dx%d %9.3f ms' % (size, size, p50 * 1000)
+                                                          for size, p50 in points) + '\n')
+        text = json.dumps(results, indent = 2, sort_keys = True)
+        if args.output == '-':
+            print text
+        else:
+            with open(args.output, 'w') as the_file:
+                the_file.write(text + '\n')
+        if args.compare:
+            with open(args.compare) as the_file:
+                rows = compare(json.load(the_file), results, args.threshold)
+            regressions = 0
+            for key, before, after, ratio, regressed in rows:
+                regressions += regressed
+                sys.stderr.write('%-34s %9.3f ms -> %9.3f ms  x%.2f%s\n' % (key, before * 1000, after * 1000, ratio,
+                                                                            '  REGRESSION' if regressed else ''))
+            sys.exit(1 if regressions else 0)
+    else:
+        test_count = 0
+        pass_count = 0
+        fail_count = 0
+        time_start = time.time()
+
+        def test_message(passed_test, message):
+            global pass_count
+            global fail_count
+            global test_count
+            test_count += 1
+            if passed_test:
+                print ">>> PASSED TEST: " + message + "\n"
+                pass_count += 1
+            else:
+                print "!!! FAILED TEST: " + message + " !!!\n"
+                fail_count += 1
+
+        print "TESTING BENCHMARK HARNESS\n"
+        m = 'build_corpus() is the same for the same seed and does not touch the global random'
+        state = random.getstate()
+        test_result = True
+        for corpus in CORPORA:
+            lines = build_corpus(corpus, 3, 6)
+            test_result = test_result and lines == build_corpus(corpus, 3, 6) and len(lines) == 6
+            test_result = test_result and (corpus == 'hard' or lines != build_corpus(corpus, 4, 6))
+        test_result = test_result and random.getstate() == state
+        test_message(test_result, m)
+
+        m = 'the hard and 17 clue corpora hold unique puzzles, variants keep the number of clues'
+        test_result = True
+        for corpus, clues in (('hard', None), ('17clue', 17)):
+            for line in build_corpus(corpus, 0, 10):
+                board = Sudoku_Board()
+                board.fill([list(row) for row in zip(*[iter(Sudoku_IO.parse_cells(line))] * 9)])
+                test_result = test_result and board.has_unique_solution()
+                test_result = test_result and (clues is None or board.filled == clues)
+        test_message(test_result, m)
+
+        m = 'pattern_grid() makes valid 16x16 grids'
+        grid = pattern_grid(16, 4, random.Random(1))
+        test_result = all(sorted(row) == range(1, 17) for row in grid)
+        test_result = test_result and all(sorted(col) == range(1, 17) for col in zip(*grid))
+        test_result = test_result and all(sorted(grid[r][c] for r in xrange(br, br + 4) for c in xrange(bc, bc + 4))
+                                          == range(1, 17) for br in xrange(0, 16, 4) for bc in xrange(0, 16, 4))
+        test_message(test_result, m)
+
+        m = 'percentile() uses the nearest rank'
+        values = range(1, 101)
+        test_result = percentile(values, 50) == 50 and percentile(values, 99) == 99 and percentile(values, 100) == 100
+        test_result = test_result and percentile([7], 90) == 7 and percentile([], 50) is None
+        test_message(test_result, m)
+
+        m = 'run_benchmark() reports every corpus and engine as json'
+        results = run_benchmark(1, CORPORA, [('dlx', None), ('propagate', 'mrv'), ('trail', None)],
+                                {'easy': 3, 'hard': 1, '17clue': 1, '16x16': 1, '25x25': 1})
+        results = json.loads(json.dumps(results))
+        keys = [result_key(result) for result in results['results']]
+        test_result = len(keys) == 15 and '25x25 trail' in keys and 'hard propagate/mrv' in keys
+        for result in results['results']:
+            test_result = test_result and result['solved'] == result['puzzles']
+            test_result = test_result and result['latency']['p50'] <= result['latency']['max']
+            test_result = test_result and result['peak_rss_kb'] > 0 and result['throughput'] > 0
+        test_message(test_result, m)
+
+        m = 'compare() flags a slower run as a regression'
+        slower = json.loads(json.dumps(results))
+        slower['results'][0]['latency']['p50'] *= 2
+        rows = compare(results, slower)
+        test_result = len(rows) == len(keys) and rows[0][4] and not any(row[4] for row in rows[1:])
+        test_message(test_result, m)
+
+        m = 'scaling() lists the p50 of every engine by board size'
+        rows = scaling(results)
+        test_result = [engine for engine, points in rows] == ['dlx', 'propagate/mrv', 'trail']
+        test_result = test_result and all([size for size, p50 in points] == [9, 16, 25] for engine, points in rows)
+        for engine, points in rows:
+            print engine + ': ' + ', '.join('%dx%d %.3f ms' % (size, size, p50 * 1000) for size, p50 in points)
+        test_message(test_result, m)
+
+        # displays test result summary:
+        time_end = time.time()
+        print "ran a total of " + str(test_count) + " tests."
+        print "test runtime: " + str(time_end - time_start) + " seconds"
+        print "total tests passed: " + str(pass_count)
+        print "total tests failed: " + str(fail_count)
+        print "\n"
@@ -2,23 +2,91 @@ import sys
 import copy
 import random
 import time
+from array import array
+import Sudoku_DLX
+import Sudoku_Generator
+import Sudoku_Parallel
+import Sudoku_Propagator
+import Sudoku_Stats
+import Sudoku_Symmetry
+
+VALUE_CHARS = '.123456789ABCDEFGHIJKLMNOP' # one character per value, the alphabet of Sudoku_IO
 
 # The Sudoku Board Class is simple board consisting of a 2d array
+# board_size is any square (9, 16, 25), block_size defaults to its square root.  Every unit keeps a bitmask of
+# its digits (bit v for digit v), so checking a move costs the same on every size.
 class Sudoku_Board(object):
-    def __init__(self):
-        self.board_size = 9
-        self.block_size = 3
+    def __init__(self, board_size = 9, block_size = None):
+        if block_size is None:
+            block_size = int(round(board_size ** 0.5))
+        assert block_size * block_size == board_size
+        self.board_size = board_size
+        self.block_size = block_size
         self.easy_setting = (self.board_size * self.board_size) / 2
         self.board = [0] * self.board_size
         self.isValidBoard = True
         self.givens = {} # dictionary to hold given spots with coordinate (tuple) as key and (int) 0-9 as value
         self.guesses = {} # similar to givens, except the keys will consist of tuples of possible answers 
+        self.trail = [] # undo log of (cell index, old value) pairs written by place()
         for r in xrange(self.board_size): # prefill the board with zeros
             self.board[r] = [0] * self.board_size
+        self.reset_units()
+
+    # input: none
+    # output: none, but will rebuild the incremental constraint state from self.board
+    # unit index: rows are 0 .. n-1, cols are n .. 2n-1, sub blocks are 2n .. 3n-1 (n = board_size)
+    def reset_units(self):
+        units = 3 * self.board_size
+        self.unit_masks = [0] * units # bit v is set when digit v is present in the unit
+        self.unit_counts = [[0] * (self.board_size + 1) for u in xrange(units)] # how many times each digit appears
+        self.conflicts = 0 # number of placements that duplicate a digit already in one of their units
+        self.filled = 0 # number of non-zero cells
+        for row in xrange(self.board_size):
+            for col in xrange(self.board_size):
+                if self.board[row][col] != 0:
+                    self.update_units(row, col, self.board[row][col], 1)
+
+    # input: a cell (row, col), a digit and delta (1 to add the digit, -1 to remove it)
+    # output: none, but will update the masks, counts and conflict counter of the cell's row, col and sub block
+    # time complexity: O(1)
+    def update_units(self, row, col, value, delta):
+        n = self.board_size
+        bit = 1 << value
+        masks = self.unit_masks
+        for unit in (row, n + col, 2 * n + (row / self.block_size) * self.block_size + col / self.block_size):
+            counts = self.unit_counts[unit]
+            count = counts[value]
+            if delta > 0:
+                if count > 0:
+                    self.conflicts += 1
+                else:
+                    masks[unit] |= bit
+            else:
+                if count > 1:
+                    self.conflicts -= 1
+                else:
+                    masks[unit] &= ~bit
+            counts[value] = count + delta
+        self.filled += delta
 
+    # time complexity: O(1), all boards should be mutated through set() to keep the unit masks in sync
     def set(self, row, col, value):
+        old = self.board[row][col]
+        if old == value:
+            return
+        if old != 0:
+            self.update_units(row, col, old, -1)
+        if value != 0:
+            self.update_units(row, col, value, 1)
         self.board[row][col] = value
 
+    # input: a 2d list of size board_size * board_size
+    # output: none, but will set every cell of the board to the matching value in grid
+    def fill(self, grid):
+        for row in xrange(self.board_size):
+            for col in xrange(self.board_size):
+                self.set(row, col, grid[row][col])
+
     def get(self, row, col):
         return self.board[row][col]
     # return a copy of the row in a list
@@ -30,10 +98,14 @@ class Sudoku_Board(object):
     # input: when called by a Sudoku Board (self)
     # output: produce a deep copy, which must be assigned ie: new_board = self.copy()
     def copy(self):
-        the_copy = Sudoku_Board()
-        the_copy.board = copy.deepcopy(self.board)
-        the_copy.givens = copy.deepcopy(self.givens)
-        the_copy.guesses = copy.deepcopy(self.guesses)
+        the_copy = Sudoku_Board(self.board_size, self.block_size)
+        the_copy.board = [row[:] for row in self.board] # values are ints so slices are deep enough
+        the_copy.givens = dict(self.givens)
+        the_copy.guesses = dict((key, guesses[:]) for key, guesses in self.guesses.iteritems())
+        the_copy.unit_masks = self.unit_masks[:]
+        the_copy.unit_counts = [counts[:] for counts in self.unit_counts]
+        the_copy.conflicts = self.conflicts
+        the_copy.filled = self.filled
         return the_copy
 
     # input: a starting x and y value inside of the board
@@ -49,22 +121,18 @@ class Sudoku_Board(object):
             for col in xrange(block_size):
                 temp.append(self.get(start_x + row, start_y + col))
         return temp
-    # input: number of spaces to leave as 0's (int)
-    # output: generates a psuedo-random (legal) board with the number of spaces specified missing
+    # input: number of spaces to leave as 0's (int) and the board_size
+    # output: generates a psuedo-random (legal) board with the number of spaces specified missing, the board
+    #         may have more than one solution (see Sudoku_Generator for puzzles with exactly one)
     @staticmethod
-    def generate_random_board(blank_spaces = None):
-        random_board = Sudoku_Board()
+    def generate_random_board(blank_spaces = None, board_size = 9):
+        random_board = Sudoku_Board(board_size)
         if blank_spaces == None:
             blank_spaces = random_board.easy_setting # default board blank spaces = 1/2 of spaces available
-        choices = range(1,random_board.board_size + 1)
-        line = []
-        # make a randomly ordered line of numbers 1 - 9
-        while len(choices) > 0:
-            num = random.randint(0,len(choices) - 1)
-            line.append(choices.pop(num))
-
-        # permute this list to create a random board that is completely filled out
-        random_board.board = random_board.generate_board_using_list(line)
+        # a random board that is completely filled out
+        n = random_board.board_size
+        cells = Sudoku_Generator.full_grid(n, random_board.block_size, random)
+        random_board.fill(Sudoku_Generator.to_grid(cells, n))
         # verify this is a valid board
         if random_board.valid_board():
             # randomly remove number of blank_space specified by user (or by default about half)
@@ -82,10 +150,10 @@ class Sudoku_Board(object):
             else:
                 print ">>> Started with a random board, but had problems during removing numbers!!!"
                 print random_board
-                return generate_random_board(blank_spaces)
+                return Sudoku_Board.generate_random_board(blank_spaces, board_size)
         else:
             print ">>> !!! problem generating random board, will try again !!!"
-            return generate_random_board(blank_spaces)
+            return Sudoku_Board.generate_random_board(blank_spaces, board_size)
 
     # input: a first line (list) which is the length of the board
     # output: a 2d list (board) with the line permuted to be a valid sudoku board
@@ -120,83 +188,60 @@ class Sudoku_Board(object):
             i += 1
         return False
 
-    # TODO: this potentially has problems.
-    # TODO: check sub_block for duplicates
-    # TODO: figure out how you are going to exclude the current selected position.
     def valid_move(self, row, col, value):
         '''When passed a row, col, and value, returns True if the move is valid and there are no
-        duplicates of value found in the row and col selected, otherwise if a match to Value is
-        found, this function will return False.''' 
+        duplicates of value found in the row, col and sub block selected, otherwise if a match to Value is
+        found, this function will return False. The value currently at (row, col) is ignored.''' 
         assert (0 <= value <= self.board_size)
         assert (0 <= row < self.board_size)
         assert (0 <= col < self.board_size)
         if value != 0: # 0 symbolizes an empty box
-            # check row
-            temp_row = self.get_row(row)
-            temp_row[col] = value # try the current value at position
-            if Sudoku_Board.has_duplicate(temp_row):
-                return False
-            # check col
-            temp_col = self.get_col(col)
-            temp_col[row] = value # try the current value at position
-            if Sudoku_Board.has_duplicate(temp_col):
-                return False
-            # check sub_block
-            temp_sub_block = self.get_sub_block(row, col)
-            pos = (row % self.block_size) * self.block_size + (col % self.block_size)
-            #print ">>>> Temp Sub Block: " + str(temp_sub_block)
-            #print "  >> From (row,col): " + str((row,col))
-            #print "  >> Searching for : " + str(value)
-            #print ">>>> Position in sub-block trying to be accessed: " + str(pos) + "\n"
-            temp_sub_block[pos] = value # try the current value at position
-            if Sudoku_Board.has_duplicate(temp_sub_block):
-                return False
+            n = self.board_size
+            block = 2 * n + (row / self.block_size) * self.block_size + col / self.block_size
+            if self.board[row][col] != value:
+                masks = self.unit_masks
+                return not ((masks[row] | masks[n + col] | masks[block]) & (1 << value))
+            # the position already holds value, so it is only a duplicate if another cell holds it too
+            counts = self.unit_counts
+            return counts[row][value] == 1 and counts[n + col][value] == 1 and counts[block][value] == 1
         return True # return true if a duplicate is not found or value == 0
 
-    def valid_board(self):
+    # input: a Sudoku Board, and optionally the Solver_Stats to report the duplicate to
+    # output: True if no row, col or sub block holds a duplicate, otherwise False
+    # time complexity: O(1), the board is only scanned to report the duplicate when it is invalid
+    def valid_board(self, stats = None):
         if self.__class__ != Sudoku_Board:
             return False
-        # check rows
-        for row in xrange(self.board_size):
-            if Sudoku_Board.has_duplicate(self.board[row][:]): # pass list by value
-                print "Duplicate found in row: " + str(row)
-                print self.board[row]
-                return False
-        # check cols
-        for col in xrange(self.board_size):
-            tempcol = []
-            for row in xrange(self.board_size): # build a temporary column
-                tempcol.append(self.get(row, col))
-            if Sudoku_Board.has_duplicate(tempcol):
-                print "Duplicate found in col: " + str(col) 
-                print tempcol
-                return False
-        # check sub blocks
-        start_vals_x = list(xrange(self.board_size))[::self.block_size]
-        start_vals_y = start_vals_x
-        for x in start_vals_x:
-            for y in start_vals_y:
-                if Sudoku_Board.has_duplicate(self.get_sub_block(x,y)):
-                    print "\n"
-                    print self
-                    print "Duplicate found in sub block: [" + str(x) + ", " + str(y) + "]"
-                    print "Sub block: " + str(self.get_sub_block(x,y)) + "\n"
+        if self.conflicts == 0:
+            return True
+        if stats is None or stats.callback is None:
+            return False
+        n = self.board_size
+        for unit in xrange(3 * n):
+            for value in xrange(1, n + 1):
+                if self.unit_counts[unit][value] > 1:
+                    if unit < n:
+                        stats.message("Duplicate found in row: " + str(unit))
+                        stats.message(str(self.board[unit]))
+                    elif unit < 2 * n:
+                        stats.message("Duplicate found in col: " + str(unit - n))
+                        stats.message(str(self.get_col(unit - n)))
+                    else:
+                        x = ((unit - 2 * n) / self.block_size) * self.block_size
+                        y = ((unit - 2 * n) % self.block_size) * self.block_size
+                        stats.message("\n")
+                        stats.message(str(self))
+                        stats.message("Duplicate found in sub block: [" + str(x) + ", " + str(y) + "]")
+                        stats.message("Sub block: " + str(self.get_sub_block(x,y)) + "\n")
                     return False
-        # if no duplicate is found, return True
-        return True
+        return False
 
     # input: a Sudoku Board
     # output: True, if board if valid and contains no spaces (0's), otherwise False
+    # time complexity: O(1)
     def is_complete(self):
         assert self.__class__ == Sudoku_Board
-        if self.valid_board():
-            # check for zeros
-            for row in self.board:
-                for num in row:
-                    if num == 0: return False
-            return True
-        else:
-            return False
+        return self.conflicts == 0 and self.filled == self.board_size * self.board_size
 
    
     # TODO: This find givens will be made obsolete after inputing givens is created.  It is used
@@ -209,101 +254,360 @@ class Sudoku_Board(object):
                 if 0 < tempval <= self.board_size: # ignore non-valid numbers
                     self.givens[(row,col)] = tempval
 
-    # TODO: Need to catch when a sub_block has 8 values, to fill in the 9th
-    # input: a valid sudoku board
-    # output: none, but will mutate self.givens by adding other logical values.
-    def find_values(self):
+    # input: a valid sudoku board, and optionally the Solver_Stats to count the propagation steps in
+    # output: True, but will mutate self.givens (and the board) by adding other logical values and fill
+    #         self.guesses with the remaining possible values of every empty position.  False if propagation
+    #         runs into a position with no possible values, the board is then not solveable.
+    # The deductions (naked / hidden singles, naked / hidden pairs, pointing / claiming) are made by
+    # Sudoku_Propagator, which only revisits the peers of a placed value instead of rescanning the board.
+    def find_values(self, stats = None):
         # At this point, we will assume that self is a valid board
         assert self.valid_board()
         self.find_givens()
-        # loop through board and find all possible values for each slot, ignoring given slots
-        changes_made = False
-        for row in xrange(self.board_size):
-            for col in xrange(self.board_size):
-                temp_key = (row,col)
-                if not self.givens.has_key(temp_key):
-                    # if not in givens, see if it is in guesses
-                    if not self.guesses.has_key(temp_key):
-                        # if not in guesses, add key and find all possible values for that position
-                        changes_made = True
-                        self.guesses[temp_key] = []
-                        # only add values that are valid to the guesses list
-                        choices = xrange(1, self.board_size + 1) # possible values to insert
-                        self.guesses[temp_key] = [ v for v in choices if self.valid_move(row, col, v) ]
-                    else: # if (rol, col) key is found in guesses
-                        # verify values work with current board and remove values that are not valid
-                        self.guesses[temp_key] = [ v for v in self.guesses[temp_key] if self.valid_move(row, col, v)]
-                    num_guesses = len(self.guesses[temp_key])
-                    # if there are no possible values
-                    if num_guesses < 1:
-                        print ">>> No possible values for position: " + str(temp_key)
-                        # assume this board is not solveable
-                    # if there is only 1 possible value 
-                    if num_guesses == 1:
-                        changes_made = True # flag to verify that changes have been made to the givens list
-                        val = self.guesses.pop(temp_key)[0] # gets val and removes entry TODO: make sure this works
-                        print ">>> Adding new value to board: " + str(val) + " at " + str(temp_key)
-                        # add tuple (row, col) to self.givens as key and value as value
-                        self.givens[temp_key] = val
-                        # add value to self.board[row][col] = value
-                        self.board[row][col] = val
-        if changes_made: # if we successfully added values, see with new givens if we can't add some more
-            self.find_values()
-
-    def solve_board(self):
+        propagator = Sudoku_Propagator.Propagator(self.board_size, self.block_size, self.board)
+        solveable = propagator.propagate()
+        report = stats is not None and stats.callback is not None
+        if stats is not None:
+            stats.add_search(0, 0, propagator.steps, 0)
+        if not solveable:
+            if report and propagator.contradiction is not None:
+                stats.message(">>> No possible values for position: " + str(divmod(propagator.contradiction, self.board_size)))
+            return False
+        self.guesses.clear()
+        for i in xrange(self.board_size * self.board_size):
+            row, col = divmod(i, self.board_size)
+            val = propagator.values[i]
+            if val != 0:
+                if self.board[row][col] == 0:
+                    if report:
+                        stats.message(">>> Adding new value to board: " + str(val) + " at " + str((row,col)))
+                    self.set(row, col, val)
+                self.givens[(row,col)] = val
+            else:
+                mask = propagator.cands[i]
+                self.guesses[(row,col)] = [v for v in xrange(1, self.board_size + 1) if mask & (1 << v)]
+        return True
+
+    def solve_board(self, engine = 'backtrack', heuristic = 'mrv', verbose = False, stats = None, timeout = None,
+                    max_nodes = None, cancel = None):
         ''' solve_board sets up the board to be solved, including validating the original board,
-            finding the given values, then passing on a copy of the board to recursive helper
-            function solve_board_helper.'''
+            finding the given values, then passing on a copy of the board to the selected engine:
+              'backtrack' - find_values() then the recursive helper function solve_board_helper
+              'trail'     - find_values() then an in place search that undoes guesses with a trail
+              'propagate' - search that propagates every guess (see Sudoku_Propagator), the cell to
+                            guess is chosen by heuristic (a name in Sudoku_Propagator.HEURISTICS)
+              'dlx'       - exact cover search with dancing links (see Sudoku_DLX)
+            The backtrack and trail engines always guess the key with the fewest valid guesses left.
+            Nothing is printed unless verbose is True.  Pass a Sudoku_Stats.Solver_Stats as stats to get
+            the counters and phase times of the run, or to report to its callback.
+            The search can be bounded by a timeout in seconds, a number of guesses (max_nodes) and a
+            Sudoku_Stats.Cancel_Token set from another thread or process.  A run stopped by one of them
+            returns a Sudoku_Stats.Timed_Out (false, like None) holding the reason and the stats so far.'''
         assert self.__class__ == Sudoku_Board
-        print self
-        s = time.time()
-        if self.valid_board():
+        assert engine in ('backtrack', 'trail', 'propagate', 'dlx')
+        if stats is None:
+            stats = Sudoku_Stats.Solver_Stats(Sudoku_Stats.print_hook if verbose else None)
+        stats.engine = engine
+        if engine == 'propagate':
+            stats.heuristic = heuristic
+        report = stats.callback is not None
+        limits = None
+        if timeout is not None or max_nodes is not None or cancel is not None:
+            deadline = None if timeout is None else time.time() + timeout
+            limits = Sudoku_Stats.Search_Limits(deadline, max_nodes, cancel)
+        if report:
+            stats.message(str(self))
+        stats.start('validation')
+        if self.valid_board(stats):
+            stats.start('givens')
             self.find_givens() # finds givens of board
-            temp = self.copy() # make a new deep copy of board
-            # find logical givens
-            temp.find_values()
-            # starting making guesses to solve the board
-            keys = temp.guesses.keys()
-            #keys.sort() # TODO: try messing with this to see if timing improves
-            keys = sorted(keys, key=lambda key: len(temp.guesses[key]), reverse = True)
-            for key in keys:
-                print str(key) + ': ' + str(temp.guesses[key])
-            solution = temp.solve_board_helper(keys)
-            e = time.time()
-            print 'Time to solve board: ' + str(e - s) + ' seconds.'
-            if solution is None:
-                print '>>> There is no solution for this board'
-            return solution
+            if engine == 'dlx':
+                stats.start('search')
+                solution = self.solve_board_dlx(stats, limits)
+            elif engine == 'propagate':
+                solution = self.solve_board_propagate(heuristic, stats, limits)
+            else:
+                temp = self.copy() # make a new deep copy of board
+                # find logical givens
+                stats.start('propagation')
+                solveable = temp.find_values(stats)
+                # starting making guesses to solve the board
+                stats.start('search')
+                keys = temp.guesses.keys()
+                if not solveable:
+                    solution = None
+                elif engine == 'trail':
+                    solution = temp if temp.solve_board_trail(keys, stats, limits) else None
+                else:
+                    keys = sorted(keys, key=lambda key: len(temp.guesses[key]), reverse = True)
+                    if report:
+                        for key in keys:
+                            stats.message(str(key) + ': ' + str(temp.guesses[key]))
+                    solution = temp.solve_board_helper(keys, stats, 0, limits)
+            stats.stop()
+            if limits is not None and limits.reason is not None:
+                stats.stopped = limits.reason
+                solution = Sudoku_Stats.Timed_Out(limits.reason, stats)
+            if report:
+                stats.message('Time to solve board: ' + str(stats.total_time()) + ' seconds.')
+                if stats.stopped is not None:
+                    stats.message('>>> Stopped before a solution was found: ' + stats.stopped)
+                elif solution is None:
+                    stats.message('>>> There is no solution for this board')
         else:
-            print '>>> This is not a valid board:'
-            print self
+            solution = None
+            if report:
+                stats.message('>>> This is not a valid board:')
+                stats.message(str(self))
+        stats.done(solution)
+        return solution
+
+    # input: a valid board, the name of the heuristic to search with (see Sudoku_Propagator.HEURISTICS) and
+    #        optionally the Solver_Stats to fill and the Search_Limits to stop at
+    # output: a solved copy of the board found by propagating search, or None if the board is not solveable
+    #         (or the limits stopped the search)
+    def solve_board_propagate(self, heuristic = 'mrv', stats = None, limits = None):
+        propagator = Sudoku_Propagator.Propagator(self.board_size, self.block_size, self.board)
+        propagator.limits = limits
+        if stats is not None:
+            stats.start('propagation')
+        values = None
+        if propagator.propagate():
+            if stats is not None:
+                stats.start('search')
+            values = propagator.solve(Sudoku_Propagator.HEURISTICS[heuristic]())
+        if stats is not None:
+            stats.add_search(propagator.nodes, propagator.backtracks, propagator.steps, propagator.max_depth)
+        if values is None:
+            return None
+        return self.copy_with_values(values)
+
+    # input: the number of worker processes (None for one per core) and the depth to split the search tree at
+    #        (None to split it into 4 subtrees per worker)
+    # output: a solved copy of the board found by searching the subtrees in parallel, the first solution stops
+    #         every worker (see Sudoku_Parallel), or None if the board is not solveable
+    def solve_board_parallel(self, workers = None, depth = None):
+        assert self.__class__ == Sudoku_Board
+        if self.conflicts != 0:
+            return None
+        values = Sudoku_Parallel.solve_parallel(self.board_size, self.block_size, self.board, workers, depth = depth)
+        if values is None:
+            return None
+        return self.copy_with_values(values)
+
+    # input: the values of every cell (list, cell order)
+    # output: a copy of the board holding the values, all of them as givens
+    def copy_with_values(self, values):
+        solution = self.copy()
+        for i, value in enumerate(values):
+            row, col = divmod(i, self.board_size)
+            solution.set(row, col, value)
+            solution.givens[(row,col)] = value
+        solution.guesses.clear()
+        return solution
+
+    # input: a valid board, and optionally the Solver_Stats to fill and the Search_Limits to stop at
+    # output: a solved copy of the board found with the dancing links engine, or None if the board is not solveable
+    #         (or the limits stopped the search)
+    def solve_board_dlx(self, stats = None, limits = None):
+        links = Sudoku_DLX.Dancing_Links(self.board_size, self.block_size, self.board)
+        links.limits = limits
+        placements = links.solve()
+        if stats is not None:
+            stats.add_search(links.nodes, links.backtracks, 0, links.max_depth)
+        if placements is None:
             return None
+        solution = self.copy()
+        for row, col, value in placements:
+            solution.set(row, col, value)
+            solution.givens[(row,col)] = value
+        return solution
+
+    # input: assumes that the board's guesses dictionary is already filled out by running find_values(), and
+    #        keys (list of (row, col)) holds the positions to guess, it is reordered as the search goes,
+    #        and optionally the Solver_Stats to fill and the Search_Limits to stop at
+    # output: True if the board was solved in place (all cells are added to givens), otherwise False
+    #         (no solution, or the limits stopped the search) and the board is rolled back to how it started
+    # The search does not copy anything: guesses are placed with place() and taken back with undo(), so
+    # after setup it only allocates the two integer lists below.
+    def solve_board_trail(self, keys, stats = None, limits = None):
+        assert self.__class__ == Sudoku_Board
+        guesses = self.guesses
+        num_keys = len(keys)
+        tried = [0] * (num_keys + 1) # index of the next guess to try at each depth
+        marks = [0] * (num_keys + 1) # length of the trail when each depth was entered
+        marks[0] = self.mark()
+        depth = 0
+        nodes = backtracks = max_depth = 0
+        while 0 <= depth < num_keys:
+            self.undo(marks[depth]) # take back the previous guess made at this depth
+            if tried[depth] == 0: # first visit: move the most constrained key left to this depth
+                best = self.most_constrained_key(keys, depth)
+                keys[depth], keys[best] = keys[best], keys[depth]
+            row, col = keys[depth]
+            options = guesses[keys[depth]]
+            i = tried[depth]
+            while i < len(options) and not self.valid_move(row, col, options[i]):
+                i += 1 # skip guesses that are no longer valid
+            if i < len(options):
+                if limits is not None and limits.exceeded(nodes):
+                    break
+                tried[depth] = i + 1
+                self.place(row, col, options[i])
+                nodes += 1
+                depth += 1
+                if depth > max_depth:
+                    max_depth = depth
+                tried[depth] = 0
+                marks[depth] = self.mark()
+            else:
+                depth -= 1 # out of guesses, backtrack
+                backtracks += 1
+        if stats is not None:
+            stats.add_search(nodes, backtracks, 0, max_depth)
+        if depth == num_keys and self.is_complete():
+            del self.trail[:] # keep the guesses
+            self.find_givens()
+            return True
+        self.undo(marks[0])
+        return False
+
+    # input: a list of keys (row, col) of self.guesses and the index to start looking from
+    # output: the index of the key with the fewest guesses that are still valid moves (keys are empty positions)
+    def most_constrained_key(self, keys, start):
+        n = self.board_size
+        bs = self.block_size
+        masks = self.unit_masks
+        best = start
+        best_count = n + 1
+        for k in xrange(start, len(keys)):
+            row, col = keys[k]
+            used = masks[row] | masks[n + col] | masks[2 * n + (row / bs) * bs + col / bs]
+            count = 0
+            for guess in self.guesses[keys[k]]:
+                if not used & (1 << guess):
+                    count += 1
+            if count < best_count:
+                best = k
+                best_count = count
+                if count == 0:
+                    break # dead end, no need to look further
+        return best
+
+    # input: the number of solutions to stop counting at (0 to count them all) and the number of worker
+    #        processes to split the search across (see Sudoku_Parallel, None for one per core)
+    # output: the number of solutions of the board, at most limit (0 if the board is not valid)
+    def count_solutions(self, limit = 2, workers = 1):
+        assert self.__class__ == Sudoku_Board
+        if self.conflicts != 0:
+            return 0
+        if workers != 1:
+            return Sudoku_Parallel.count_parallel(self.board_size, self.block_size, self.board, limit, workers)
+        propagator = Sudoku_Propagator.Propagator(self.board_size, self.block_size, self.board)
+        return propagator.count_solutions(limit)
+
+    # output: True if the board has exactly one solution, the search stops at the second one
+    def has_unique_solution(self):
+        return self.count_solutions(2) == 1
 
-    # input: assumes that the board's guesses dictionary is already filled out by running find_values()
-    # output: a solved board, or None if the board is not solveable
-    def solve_board_helper(self, keys):
+    # input: the name of the heuristic to guess with (see Sudoku_Propagator.HEURISTICS)
+    # output: a Sudoku_Propagator.Solution_Enumerator of the board, to pass to iter_solutions() when the search
+    #         has to be checkpointed (see Solution_Enumerator.checkpoint)
+    def solution_enumerator(self, heuristic = 'mrv'):
+        return Sudoku_Propagator.Solution_Enumerator(self.board_size, self.block_size, self.board,
+                                                     Sudoku_Propagator.HEURISTICS[heuristic]())
+
+    # input: the name of the heuristic to guess with, or the enumerator to carry on with (the heuristic is
+    #        then ignored)
+    # output: generator of every solution as a solved copy of the board.  The search keeps its own stack
+    #         instead of recursing, so it is not bound by the recursion limit, and it only runs while the
+    #         next solution is asked for.
+    def iter_solutions(self, heuristic = 'mrv', enumerator = None):
+        assert self.__class__ == Sudoku_Board
+        if enumerator is None:
+            enumerator = self.solution_enumerator(heuristic)
+        for values in enumerator:
+            yield self.copy_with_values(values)
+
+    # output: (canonical puzzle line, transform) where the line is the same for every board that is the same
+    #         puzzle up to relabeling digits, permuting rows / cols / bands / stacks and transposing, and the
+    #         transform takes this board to it (see Sudoku_Symmetry)
+    def canonical_form(self):
+        cells = bytearray(value for row in self.board for value in row)
+        canonical, transform = Sudoku_Symmetry.canonical_form(cells, self.board_size, self.block_size)
+        return ''.join(VALUE_CHARS[value] for value in canonical), transform
+
+    # output: dict of heuristic name -> number of guesses the propagate engine makes to solve the board with it
+    def heuristic_nodes(self):
+        nodes = {}
+        for name, heuristic in Sudoku_Propagator.HEURISTICS.iteritems():
+            propagator = Sudoku_Propagator.Propagator(self.board_size, self.block_size, self.board)
+            propagator.solve(heuristic())
+            nodes[name] = propagator.nodes
+        return nodes
+
+    # input: a cell (row, col) and a value
+    # output: none, but will set the cell and record the old value on self.trail so it can be undone
+    def place(self, row, col, value):
+        self.trail.append(row * self.board_size + col)
+        self.trail.append(self.board[row][col])
+        self.set(row, col, value)
+
+    # output: a mark (int) of the current trail position to later pass to undo()
+    def mark(self):
+        return len(self.trail)
+
+    # input: a mark returned by mark()
+    # output: none, but will undo every place() made since the mark, most recent first
+    def undo(self, mark):
+        trail = self.trail
+        while len(trail) > mark:
+            old = trail.pop()
+            index = trail.pop()
+            self.set(index / self.board_size, index % self.board_size, old)
+
+    # input: assumes that the board's guesses dictionary is already filled out by running find_values(),
+    #        optionally the Solver_Stats to fill, the number of guesses already on the board, the
+    #        Search_Limits to stop at and the guesses made by this run so far (a one item list shared by the
+    #        recursive calls, the limits count them and not the totals of a reused stats)
+    # output: a solved board, or None if the board is not solveable (or the limits stopped the search)
+    def solve_board_helper(self, keys, stats = None, depth = 0, limits = None, nodes = None):
         assert self.__class__ == Sudoku_Board
+        if nodes is None:
+            nodes = [0]
+        if stats is not None and depth > stats.max_depth:
+            stats.max_depth = depth
         if len(keys) < 1:
             if self.is_complete():
-                print '---------------------------------------'
-                print '!!! FOUND SOLUTION !!!'
-                print self
+                if stats is not None and stats.callback is not None:
+                    stats.message('---------------------------------------')
+                    stats.message('!!! FOUND SOLUTION !!!')
+                    stats.message(str(self))
                 return self
             else:
                 return None
         else: # assume there are guesses left
-            first_key = keys.pop() # grab first of the set of keys
+            best = self.most_constrained_key(keys, 0)
+            keys[best], keys[-1] = keys[-1], keys[best]
+            first_key = keys.pop() # grab the most constrained of the set of keys
             curr_guesses = copy.deepcopy(self.guesses[first_key])
             temp_row = first_key[0]
             temp_col = first_key[1]
             for guess in curr_guesses:
+                if limits is not None and limits.exceeded(nodes[0]):
+                    break
                 if self.valid_move(temp_row, temp_col, guess):
                     # if the option is still a valid choice add it and try it
                     self.set(temp_row, temp_col, guess)
                     self.givens[first_key] = guess
-                    possible_solution =  self.solve_board_helper(copy.deepcopy(keys))
+                    nodes[0] += 1
+                    if stats is not None:
+                        stats.nodes += 1
+                    possible_solution =  self.solve_board_helper(copy.deepcopy(keys), stats, depth + 1, limits, nodes)
                     if not possible_solution is None:
                         return possible_solution
+                    if stats is not None:
+                        stats.backtracks += 1
                 else:
                     pass # skip adding this guess
             if self.givens.has_key(first_key):
@@ -315,29 +619,182 @@ class Sudoku_Board(object):
         for row in xrange(self.board_size):
             for col in xrange(self.board_size):
                 self.board[row][col] = 0
+        self.reset_units()
 
     def __eq__(self, other):
         return vars(self) == vars(other)
 
     def __repr__(self):
-        result = '    0   1   2   3   4   5   6   7   8\n--|-----------|-----------|-----------|\n'
-        for i in xrange(self.board_size):
+        n = self.board_size
+        width = len(str(n)) # widest number, 1 on a 9x9 board
+        block = (width + 3) * self.block_size - 1
+        border = '-' * (width + 1) + '|' + ('-' * block + '|') * self.block_size
+        inside = ' ' * (width + 1) + '|' + (' ' * block + '|') * self.block_size
+        result = ' ' * (width + 3) + '   '.join(str(col).ljust(width) for col in xrange(n)).rstrip() + '\n'
+        result += border + '\n'
+        for i in xrange(n):
             line = ''
             for num in self.board[i]:
                 if num == 0:
-                    line += '    ' # display a blank (only for display purposes)
+                    line += ' ' * (width + 3) # display a blank (only for display purposes)
                 else:
-                    line += str(num) + '   '
-            result += str(i) + '   ' + line + '\n'
-            if (i+1) % 3 == 0:
-                if i != 8:
-                    result += '--|-----------|-----------|-----------|\n'
+                    line += str(num).ljust(width) + '   '
+            result += str(i).ljust(width) + '   ' + line + '\n'
+            if (i+1) % self.block_size == 0:
+                if i != n - 1:
+                    result += border + '\n'
                 else:
-                    result += '--|-----------|-----------|-----------|'
+                    result += border
             else:
-                result += '  |           |           |           |\n'
+                result += inside + '\n'
         return result
 
+# The Compact Sudoku Board is a memory light board for holding many boards at once (batch jobs).  Cells are
+# stored in a flat bytearray (index = row * board_size + col) and candidates in a parallel array of digit
+# bitmasks, bit v of candidates[i] is set when no peer of cell i holds v.  There are no givens or guesses
+# dictionaries, use to_board() to get a full Sudoku_Board when those are needed.
+class Compact_Sudoku_Board(object):
+    __slots__ = ('board_size', 'block_size', 'cells', 'candidates')
+
+    def __init__(self, board_size = 9, block_size = None):
+        if block_size is None:
+            block_size = int(round(board_size ** 0.5))
+        self.board_size = board_size
+        self.block_size = block_size
+        self.cells = bytearray(board_size * board_size)
+        full = (1 << (board_size + 1)) - 2 # bits 1 .. board_size
+        self.candidates = array('H' if board_size < 16 else 'L', [full]) * (board_size * board_size)
+
+    # input: board_size and block_size
+    # output: a tuple holding, for every cell index, a tuple of the indexes of the cells sharing its row, col
+    #         or sub block (built once per size and shared with Sudoku_Propagator)
+    @staticmethod
+    def peers(board_size, block_size):
+        return Sudoku_Propagator.unit_tables(board_size, block_size)[2]
+
+    def get(self, row, col):
+        return self.cells[row * self.board_size + col]
+
+    # time complexity: O(p) to place a digit on an empty cell, O(p^2) to remove one (p = number of peers)
+    def set(self, row, col, value):
+        i = row * self.board_size + col
+        old = self.cells[i]
+        if old == value:
+            return
+        self.cells[i] = value
+        peers = Compact_Sudoku_Board.peers(self.board_size, self.block_size)[i]
+        candidates = self.candidates
+        if old == 0:
+            not_bit = ~(1 << value)
+            for p in peers:
+                candidates[p] &= not_bit
+        else: # a peer may still hold old, so recompute the peers from scratch
+            for p in peers:
+                self.update_candidates(p)
+
+    # input: a cell index
+    # output: none, but will recompute candidates[i] from the values of the cell's peers
+    def update_candidates(self, i):
+        cells = self.cells
+        used = 0
+        for p in Compact_Sudoku_Board.peers(self.board_size, self.block_size)[i]:
+            used |= 1 << cells[p]
+        self.candidates[i] = ((1 << (self.board_size + 1)) - 2) & ~used
+
+    # output: list of the digits no peer of (row, col) holds
+    def get_candidates(self, row, col):
+        mask = self.candidates[row * self.board_size + col]
+        return [v for v in xrange(1, self.board_size + 1) if mask & (1 << v)]
+
+    # output: True if value does not clash with any peer of (row, col), the value at (row, col) is ignored
+    def valid_move(self, row, col, value):
+        return value == 0 or bool(self.candidates[row * self.board_size + col] & (1 << value))
+
+    def get_row(self, row):
+        n = self.board_size
+        return list(self.cells[row * n:(row + 1) * n])
+
+    def get_col(self, col):
+        return list(self.cells[col::self.board_size])
+
+    # input: a starting x and y value inside of the board
+    # output: list of numbers inside sub_block of size block_size * block_size
+    def get_sub_block(self, start_x, start_y):
+        n = self.board_size
+        block_size = self.block_size
+        start_x = (start_x / block_size) * block_size
+        start_y = (start_y / block_size) * block_size
+        temp = []
+        for row in xrange(start_x, start_x + block_size):
+            temp.extend(self.cells[row * n + start_y:row * n + start_y + block_size])
+        return temp
+
+    # output: a new board holding a copy of the cell and candidate buffers
+    def copy(self):
+        the_copy = Compact_Sudoku_Board.__new__(Compact_Sudoku_Board)
+        the_copy.board_size = self.board_size
+        the_copy.block_size = self.block_size
+        the_copy.cells = self.cells[:]
+        the_copy.candidates = self.candidates[:]
+        return the_copy
+
+    # input: a bytearray of board_size * board_size cell values (taken over by the board, not copied),
+    #        board_size and block_size (the square root of board_size when None)
+    # output: a Compact_Sudoku_Board using cells as its storage, candidates are computed in one pass
+    @staticmethod
+    def from_cells(cells, board_size = 9, block_size = None):
+        if block_size is None:
+            block_size = int(round(board_size ** 0.5))
+        assert len(cells) == board_size * board_size
+        compact = Compact_Sudoku_Board.__new__(Compact_Sudoku_Board)
+        compact.board_size = board_size
+        compact.block_size = block_size
+        compact.cells = cells
+        units, units_of, peers = Sudoku_Propagator.unit_tables(board_size, block_size)
+        used = [0] * len(units)
+        for u in xrange(len(units)):
+            for i in units[u]:
+                used[u] |= 1 << cells[i]
+        full = (1 << (board_size + 1)) - 2
+        compact.candidates = array('H' if board_size < 16 else 'L', [0]) * len(cells)
+        for i in xrange(len(cells)):
+            row, col, block = units_of[i]
+            mask = used[row] | used[col] | used[block]
+            if cells[i]: # the unit masks hold the cell's own value, so scan its peers instead
+                mask = 0
+                for p in peers[i]:
+                    mask |= 1 << cells[p]
+            compact.candidates[i] = full & ~mask
+        return compact
+
+    # input: a Sudoku_Board
+    # output: a Compact_Sudoku_Board with the same values
+    @staticmethod
+    def from_board(board):
+        compact = Compact_Sudoku_Board(board.board_size, board.block_size)
+        for row in xrange(board.board_size):
+            for col in xrange(board.board_size):
+                if board.board[row][col] != 0:
+                    compact.set(row, col, board.board[row][col])
+        return compact
+
+    # output: a Sudoku_Board with the same values (its givens are not filled out)
+    def to_board(self):
+        n = self.board_size
+        board = Sudoku_Board(n, self.block_size)
+        board.fill([self.cells[row * n:(row + 1) * n] for row in xrange(n)])
+        return board
+
+    def __eq__(self, other):
+        return (self.__class__ == other.__class__ and self.board_size == other.board_size
+                and self.block_size == other.block_size and self.cells == other.cells)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return repr(self.to_board())
+
 # Program runs from here
 
 if __name__ == "__main__":
@@ -395,7 +852,7 @@ if __name__ == "__main__":
             if row != 0 and row % board1.block_size == 0:
                 nums_list.insert(0, nums_list.pop()) # increment for the next row
             for col in xrange(board1.board_size):
-                board1.board[row][col] = nums_list[col]
+                board1.set(row, col, nums_list[col])
             for i in xrange(board1.block_size):
                 nums_list.insert(0, nums_list.pop()) # places last value of nums_list in first spot
         print board1
@@ -511,6 +968,33 @@ if __name__ == "__main__":
             if not test_result:
                 break # stop the loop if an invalid board failed to trigger valid_board()
         
+        # TEST: incremental unit masks stay in sync with the board
+        print "Testing unit masks"
+        for count in xrange(LOOP_COUNT):
+            board2 = Sudoku_Board()
+            for x in xrange(40): # random sets and clears, duplicates allowed
+                board2.set(random.randint(0, 8), random.randint(0, 8), random.randint(0, 9))
+            board3 = Sudoku_Board()
+            board3.fill(board2.board) # rebuilt from scratch
+            m = "unit masks match a rebuilt board " + str(count)
+            test_result = (board2.unit_masks == board3.unit_masks and board2.unit_counts == board3.unit_counts
+                           and board2.conflicts == board3.conflicts and board2.filled == board3.filled)
+            test_message(test_result, m)
+
+            # compare valid_move against a scan of the row, col and sub block
+            test_result = True
+            for row in xrange(9):
+                for col in xrange(9):
+                    for val in xrange(1, 10):
+                        peers = [board2.get(row, c) for c in xrange(9) if c != col]
+                        peers += [board2.get(r, col) for r in xrange(9) if r != row]
+                        peers += [board2.get(r, c) for r in xrange((row / 3) * 3, (row / 3) * 3 + 3)
+                                  for c in xrange((col / 3) * 3, (col / 3) * 3 + 3) if (r, c) != (row, col)]
+                        if board2.valid_move(row, col, val) != (val not in peers):
+                            test_result = False
+            m = "valid_move matches a full scan " + str(count)
+            test_message(test_result, m)
+
         # Test: Generate Random Valid Boards
         for x in xrange(LOOP_COUNT):
             board1 = Sudoku_Board.generate_random_board(random.randint(0, board1.board_size * board1.board_size))
@@ -588,6 +1072,428 @@ if __name__ == "__main__":
             test_result = solution != None and solution.valid_board()
             test_message(test_result, m)
 
+        # TEST: solve_board(engine = 'dlx')
+        print 'Testing solve_board(engine = dlx)'
+        # known hard puzzles: Arto Inkala's 2012 puzzle and a 17 clue minimal puzzle
+        HARD_PUZZLES = ['8..........36......7..9.2...5...7.......457.....1...3...1....68..85...1..9....4..',
+                        '.......1.4.........2...........5.4.7..8...3....1.9....3..4..2...5.1........8.6...']
+        for x in xrange(LOOP_COUNT + len(HARD_PUZZLES)):
+            if x < LOOP_COUNT:
+                board_difficulty = random.randint(board1.easy_setting, upper_limit)
+                board1 = Sudoku_Board.generate_random_board(board_difficulty)
+                m = 'solve_board(' + str(board_difficulty) + ', dlx): test #' + str(x)
+            else:
+                board1 = Sudoku_Board()
+                for i, char in enumerate(HARD_PUZZLES[x - LOOP_COUNT]):
+                    if char != '.':
+                        board1.set(i / 9, i % 9, int(char))
+                m = 'solve_board(hard puzzle, dlx): test #' + str(x)
+            solution = board1.solve_board(engine = 'dlx')
+            test_result = solution != None and solution.is_complete()
+            for row in xrange(9):
+                for col in xrange(9):
+                    if board1.get(row, col) != 0 and solution.get(row, col) != board1.get(row, col):
+                        test_result = False # givens must be kept
+            test_message(test_result, m)
+
+        # TEST: solve_board(engine = 'propagate')
+        print 'Testing solve_board(engine = propagate)'
+        for x in xrange(LOOP_COUNT + len(HARD_PUZZLES)):
+            if x < LOOP_COUNT:
+                board_difficulty = random.randint(board1.easy_setting, upper_limit)
+                board1 = Sudoku_Board.generate_random_board(board_difficulty)
+                m = 'solve_board(' + str(board_difficulty) + ', propagate): test #' + str(x)
+            else:
+                board1 = Sudoku_Board()
+                for i, char in enumerate(HARD_PUZZLES[x - LOOP_COUNT]):
+                    if char != '.':
+                        board1.set(i / 9, i % 9, int(char))
+                m = 'solve_board(hard puzzle, propagate): test #' + str(x)
+            solution = board1.solve_board(engine = 'propagate')
+            test_result = solution != None and solution.is_complete()
+            for row in xrange(9):
+                for col in xrange(9):
+                    if board1.get(row, col) != 0 and solution.get(row, col) != board1.get(row, col):
+                        test_result = False # givens must be kept
+            test_message(test_result, m)
+
+        # an easy puzzle is solved by propagation alone (hidden singles are needed)
+        m = 'find_values() solves an easy puzzle without guessing'
+        board1 = Sudoku_Board()
+        for i, char in enumerate('..3.2.6..9..3.5..1..18.64....81.29..7.......8..67.82....26.95..8..2.3..9..5.1.3..'):
+            if char != '.':
+                board1.set(i / 9, i % 9, int(char))
+        test_result = board1.find_values() and board1.is_complete() and board1.guesses == {}
+        test_message(test_result, m)
+
+        # a valid board where (0, 8) has no possible values: propagation reports it instead of searching
+        m = 'find_values() finds a contradiction'
+        board1 = Sudoku_Board()
+        for col in xrange(8):
+            board1.set(0, col, col + 1)
+        board1.set(1, 8, 9)
+        test_result = board1.valid_board() and not board1.find_values() and board1.solve_board() is None
+        test_result = test_result and board1.solve_board(engine = 'propagate') is None
+        test_message(test_result, m)
+
+        # TEST: every search heuristic solves the hard puzzles, node counts are reported per heuristic
+        print 'Testing search heuristics'
+        for puzzle in HARD_PUZZLES:
+            board1 = Sudoku_Board()
+            for i, char in enumerate(puzzle):
+                if char != '.':
+                    board1.set(i / 9, i % 9, int(char))
+            for heuristic in sorted(Sudoku_Propagator.HEURISTICS):
+                solution = board1.solve_board(engine = 'propagate', heuristic = heuristic)
+                m = 'solve_board(hard puzzle, propagate, ' + heuristic + ')'
+                test_result = solution != None and solution.is_complete()
+                test_message(test_result, m)
+            nodes = board1.heuristic_nodes()
+            print nodes
+            m = 'heuristic_nodes() counts guesses for every heuristic'
+            test_result = sorted(nodes) == sorted(Sudoku_Propagator.HEURISTICS)
+            test_result = test_result and board1.heuristic_nodes() == nodes # random restarts are seeded
+            test_message(test_result, m)
+
+        # TEST: solve_board() is quiet by default and fills a Solver_Stats
+        print 'Testing solver statistics'
+        import StringIO
+        board1 = Sudoku_Board()
+        for i, char in enumerate(HARD_PUZZLES[0]):
+            if char != '.':
+                board1.set(i / 9, i % 9, int(char))
+        for engine in ('backtrack', 'trail', 'propagate', 'dlx'):
+            m = 'solve_board(engine = ' + engine + ') prints nothing and counts the search'
+            stdout = sys.stdout
+            sys.stdout = StringIO.StringIO()
+            try:
+                stats = Sudoku_Stats.Solver_Stats()
+                solution = board1.solve_board(engine = engine, stats = stats)
+                printed = sys.stdout.getvalue()
+            finally:
+                sys.stdout = stdout
+            test_result = printed == '' and solution is not None and stats.solved and stats.engine == engine
+            test_result = test_result and stats.nodes > 0 and 0 < stats.max_depth <= stats.nodes
+            test_result = test_result and stats.backtracks < stats.nodes and stats.total_time() > 0
+            test_result = test_result and sorted(stats.times) == sorted(Sudoku_Stats.PHASES)
+            if engine != 'dlx':
+                test_result = test_result and stats.propagations > 0
+            test_message(test_result, m, stats)
+        m = 'solve_board() reports messages, phases and the result to a callback'
+        events = []
+        stats = Sudoku_Stats.Solver_Stats(lambda event, stats, detail: events.append((event, detail)))
+        solution = board1.solve_board(engine = 'propagate', stats = stats)
+        phases = [detail[0] for event, detail in events if event == 'phase']
+        test_result = phases == ['validation', 'givens', 'propagation', 'search']
+        test_result = test_result and events[0][0] == 'message' and events[-1] == ('done', solution)
+        test_message(test_result, m)
+        m = 'solve_board(verbose = True) prints, logging_hook() logs'
+        stdout = sys.stdout
+        sys.stdout = StringIO.StringIO()
+        try:
+            board1.solve_board(engine = 'dlx', verbose = True)
+            printed = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+        import logging
+        log = StringIO.StringIO()
+        logger = logging.getLogger('sudoku_test')
+        logger.addHandler(logging.StreamHandler(log))
+        logger.setLevel(logging.DEBUG)
+        logger.propagate = False
+        board1.solve_board(engine = 'dlx', stats = Sudoku_Stats.Solver_Stats(Sudoku_Stats.logging_hook(logger)))
+        test_result = 'Time to solve board' in printed and 'phase search took' in log.getvalue()
+        test_result = test_result and 'Solver_Stats(engine=dlx, solved=True' in log.getvalue()
+        test_message(test_result, m)
+
+        # TEST: count_solutions() and has_unique_solution()
+        print 'Testing count_solutions()'
+        for puzzle in HARD_PUZZLES:
+            board1 = Sudoku_Board()
+            for i, char in enumerate(puzzle):
+                if char != '.':
+                    board1.set(i / 9, i % 9, int(char))
+            m = 'has_unique_solution(hard puzzle)'
+            test_result = board1.has_unique_solution() and board1.count_solutions(0) == 1
+            test_message(test_result, m)
+        m = 'count_solutions() stops at the limit'
+        board1 = Sudoku_Board()
+        test_result = board1.count_solutions() == 2 and board1.count_solutions(7) == 7
+        test_result = test_result and not board1.has_unique_solution()
+        board1.set(0, 0, 1)
+        board1.set(0, 1, 1)
+        test_result = test_result and board1.count_solutions() == 0 # not a valid board
+        test_message(test_result, m)
+        for x in xrange(LOOP_COUNT):
+            board_difficulty = random.randint(board1.easy_setting, upper_limit)
+            board1 = Sudoku_Board.generate_random_board(board_difficulty)
+            m = 'count_solutions(' + str(board_difficulty) + ') matches a search without deductions: test #' + str(x)
+            # naked / hidden pairs and pointing must not remove any solution
+            plain = Sudoku_Propagator.Propagator(9, 3, board1.board, techniques = ())
+            count = board1.count_solutions(20)
+            test_result = 1 <= count == plain.count_solutions(20)
+            test_result = test_result and board1.has_unique_solution() == (count == 1)
+            test_message(test_result, m)
+
+        # TEST: solve_board(engine = 'trail')
+        print 'Testing solve_board(engine = trail)'
+        for x in xrange(LOOP_COUNT):
+            board_difficulty = random.randint(board1.easy_setting, upper_limit)
+            board1 = Sudoku_Board.generate_random_board(board_difficulty)
+            m = 'solve_board(' + str(board_difficulty) + ', trail): test #' + str(x)
+            board2 = board1.copy()
+            solution = board1.solve_board(engine = 'trail')
+            test_result = solution != None and solution.is_complete() and solution.trail == []
+            for row in xrange(9):
+                for col in xrange(9):
+                    if board1.get(row, col) != 0 and solution.get(row, col) != board1.get(row, col):
+                        test_result = False # givens must be kept
+            test_result = test_result and board1.board == board2.board # the original board is not mutated
+            test_message(test_result, m)
+
+        # TEST: place() and undo() restore the board exactly
+        for x in xrange(LOOP_COUNT):
+            board2 = Sudoku_Board.generate_random_board()
+            board3 = board2.copy()
+            mark = board2.mark()
+            for i in xrange(20):
+                board2.place(random.randint(0, 8), random.randint(0, 8), random.randint(0, 9))
+            board2.undo(mark)
+            m = 'undo() restores the board ' + str(x)
+            test_result = board2 == board3
+            test_message(test_result, m)
+
+        # TEST: Compact_Sudoku_Board
+        print 'Testing Compact_Sudoku_Board'
+        for x in xrange(LOOP_COUNT):
+            board2 = Sudoku_Board.generate_random_board()
+            compact = Compact_Sudoku_Board.from_board(board2)
+            for i in xrange(20): # random sets and clears on both boards
+                row, col, val = random.randint(0, 8), random.randint(0, 8), random.randint(0, 9)
+                if board2.valid_move(row, col, val):
+                    board2.set(row, col, val)
+                    compact.set(row, col, val)
+            test_result = compact.to_board().board == board2.board
+            for i in xrange(9):
+                test_result = (test_result and compact.get_row(i) == board2.get_row(i)
+                               and compact.get_col(i) == board2.get_col(i)
+                               and compact.get_sub_block(i, (i * 3) % 9) == board2.get_sub_block(i, (i * 3) % 9))
+            for row in xrange(9):
+                for col in xrange(9):
+                    for val in xrange(1, 10):
+                        if compact.valid_move(row, col, val) != board2.valid_move(row, col, val):
+                            test_result = False
+            m = 'compact board matches Sudoku_Board ' + str(x)
+            test_message(test_result, m)
+
+            compact2 = compact.copy()
+            test_result = compact2 == compact and compact2.candidates == compact.candidates
+            compact2.set(0, 0, (compact.get(0, 0) % 9) + 1)
+            test_result = test_result and compact2 != compact
+            m = 'compact board copy ' + str(x)
+            test_message(test_result, m)
+
+        # dancing links works for any board_size / block_size
+        m = 'Dancing_Links on a 4x4 board'
+        grid = [[1, 0, 0, 0], [0, 0, 3, 0], [0, 4, 0, 0], [0, 0, 0, 2]]
+        for row, col, value in Sudoku_DLX.Dancing_Links(4, 2, grid).solve():
+            grid[row][col] = value
+        units = grid + [[grid[r][c] for r in xrange(4)] for c in xrange(4)]
+        units += [[grid[r][c] for r in xrange(br, br + 2) for c in xrange(bc, bc + 2)] for br in (0, 2) for bc in (0, 2)]
+        test_result = all(sorted(unit) == [1, 2, 3, 4] for unit in units)
+        test_message(test_result, m)
+
+        # every engine works on 16x16 and 25x25 boards
+        print 'Testing larger boards'
+        for size in (16, 25):
+            board1 = Sudoku_Board.generate_random_board(size * size * 2 / 5, size)
+            test_result = board1.board_size == size and board1.block_size == int(size ** 0.5)
+            test_result = test_result and board1.valid_board() and board1.filled == size * size - size * size * 2 / 5
+            lines = repr(board1).split('\n')
+            test_result = test_result and len(lines) == 2 * size + 2 and lines[0].split()[-1] == str(size - 1)
+            test_result = test_result and len(set(len(line) for line in lines[1::2])) == 1 # the border lines
+            m = 'generate_random_board(board_size = ' + str(size) + ')'
+            test_message(test_result, m)
+            for engine in ('backtrack', 'trail', 'propagate', 'dlx'):
+                board2 = board1.copy()
+                solution = board2.solve_board(engine)
+                test_result = solution is not None and solution.is_complete() and solution.board_size == size
+                test_result = test_result and all(solution.get(row, col) == value
+                                                  for (row, col), value in board1.givens.iteritems())
+                m = 'solve_board(' + engine + ') of a ' + str(size) + 'x' + str(size) + ' board'
+                test_message(test_result, m)
+        compact = Compact_Sudoku_Board.from_board(board1)
+        test_result = compact.to_board().board == board1.board and compact.to_board().board_size == 25
+        test_result = test_result and len(board1.canonical_form()[0]) == 625
+        m = 'a 25x25 board through Compact_Sudoku_Board and canonical_form()'
+        test_message(test_result, m)
+
+        m = 'Compact_Sudoku_Board(16) and from_cells() without a block_size'
+        compact = Compact_Sudoku_Board(16)
+        compact.set(0, 0, 5)
+        compact.set(15, 15, 16)
+        test_result = compact.block_size == 4 and compact.get(0, 0) == 5 and not compact.valid_move(3, 3, 5)
+        test_result = test_result and compact.valid_move(4, 4, 5) and compact.to_board().block_size == 4
+        cells = compact.cells[:]
+        compact = Compact_Sudoku_Board.from_cells(cells, 16)
+        test_result = test_result and compact.block_size == 4 and compact.get_candidates(15, 14) == range(1, 16)
+        test_message(test_result, m)
+
+        # lazy enumeration of every solution
+        print 'Testing iter_solutions'
+        import itertools
+        import json
+        m = 'iter_solutions() of an empty 4x4 board gives all 288 grids'
+        board1 = Sudoku_Board(4)
+        solutions = [solution.board for solution in board1.iter_solutions()]
+        test_result = len(solutions) == 288 and len(set(str(grid) for grid in solutions)) == 288
+        test_result = test_result and board1.count_solutions(0) == 288 and board1.filled == 0
+        test_message(test_result, m)
+
+        for x in xrange(LOOP_COUNT):
+            count = 200
+            while count == 200: # keep the enumeration short
+                board1 = Sudoku_Board.generate_random_board(random.randint(45, 55))
+                count = board1.count_solutions(200)
+            solutions = [solution for solution in board1.iter_solutions(random.choice(Sudoku_Propagator.HEURISTICS.keys()))]
+            test_result = len(solutions) == count and len(set(str(solution.board) for solution in solutions)) == count
+            test_result = test_result and all(solution.is_complete() and all(solution.get(row, col) == value
+                                                                             for (row, col), value in board1.givens.iteritems())
+                                               for solution in solutions)
+            m = 'iter_solutions() gives every solution once (' + str(count) + ')'
+            test_message(test_result, m)
+
+            m = 'iter_solutions() resumes from a json checkpoint'
+            enumerator = board1.solution_enumerator()
+            first = [solution.board for solution in itertools.islice(board1.iter_solutions(enumerator = enumerator), count / 2)]
+            data = json.loads(json.dumps(enumerator.checkpoint()))
+            resumed = Sudoku_Propagator.Solution_Enumerator.from_checkpoint(data)
+            rest = [solution.board for solution in board1.iter_solutions(enumerator = resumed)]
+            test_result = first + rest == [solution.board for solution in board1.iter_solutions('mrv')]
+            test_result = test_result and resumed.found == count and data['found'] == count / 2
+            test_message(test_result, m)
+
+            m = 'iter_solutions(random_restarts) resumes on the same path'
+            enumerator = board1.solution_enumerator('random_restarts')
+            first = [solution.board for solution in itertools.islice(board1.iter_solutions(enumerator = enumerator), count / 2)]
+            data = json.loads(json.dumps(enumerator.checkpoint()))
+            resumed = Sudoku_Propagator.Solution_Enumerator.from_checkpoint(data)
+            rest = [solution.board for solution in board1.iter_solutions(enumerator = resumed)]
+            whole = board1.solution_enumerator('random_restarts')
+            test_result = first + rest == [solution.board for solution in board1.iter_solutions(enumerator = whole)]
+            test_result = test_result and resumed.nodes == whole.nodes
+            test_message(test_result, m)
+
+        m = 'iter_solutions() is not bound by the recursion limit'
+        board1 = Sudoku_Board(16)
+        limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(100) # the first solution of an empty 16x16 board takes over 100 nested guesses
+        try:
+            solutions = list(itertools.islice(board1.iter_solutions(), 3))
+        finally:
+            sys.setrecursionlimit(limit)
+        test_result = len(solutions) == 3 and all(solution.is_complete() for solution in solutions)
+        test_message(test_result, m)
+
+        m = 'Solution_Enumerator stops at its limits and keeps the work left'
+        enumerator = Sudoku_Board(9).solution_enumerator()
+        enumerator.limits = Sudoku_Stats.Search_Limits(max_nodes = 20)
+        test_result = list(enumerator) == [] and enumerator.stopped == 'nodes' and enumerator.nodes == 20
+        enumerator.limits = None
+        test_result = test_result and len(list(itertools.islice(enumerator, 5))) == 5 and enumerator.nodes > 20
+        test_message(test_result, m)
+
+        # timeouts, node budgets and cancellation
+        print 'Testing search limits'
+        board1 = Sudoku_Board()
+        for i, char in enumerate(HARD_PUZZLES[0]):
+            if char != '.':
+                board1.set(i / 9, i % 9, int(char))
+        for engine in ('backtrack', 'trail', 'propagate', 'dlx'):
+            stats = Sudoku_Stats.Solver_Stats()
+            result = board1.copy().solve_board(engine, max_nodes = 5, stats = stats)
+            test_result = isinstance(result, Sudoku_Stats.Timed_Out) and not result and result.reason == 'nodes'
+            test_result = test_result and result.stats is stats and stats.stopped == 'nodes' and not stats.solved
+            test_result = test_result and 0 < stats.nodes <= 5 and stats.as_dict()['stopped'] == 'nodes'
+            m = 'solve_board(' + engine + ', max_nodes = 5) stops with the partial stats'
+            test_message(test_result, m)
+
+            result = board1.copy().solve_board(engine, timeout = 0)
+            test_result = isinstance(result, Sudoku_Stats.Timed_Out) and result.reason == 'deadline'
+            token = Sudoku_Stats.Cancel_Token()
+            token.cancel()
+            result = board1.copy().solve_board(engine, cancel = token)
+            test_result = test_result and isinstance(result, Sudoku_Stats.Timed_Out) and result.reason == 'cancelled'
+            solution = board1.copy().solve_board(engine, timeout = 60, max_nodes = 10 ** 6, cancel = Sudoku_Stats.Cancel_Token())
+            test_result = test_result and isinstance(solution, Sudoku_Board) and solution.is_complete()
+            m = 'solve_board(' + engine + ') with a deadline and a cancel token'
+            test_message(test_result, m)
+
+        m = 'max_nodes counts the guesses of this solve when the stats are reused'
+        test_result = True
+        for engine in ('backtrack', 'trail', 'propagate', 'dlx'):
+            stats = Sudoku_Stats.Solver_Stats()
+            board1.copy().solve_board(engine, stats = stats)
+            needed = stats.nodes
+            solution = board1.copy().solve_board(engine, stats = stats, max_nodes = needed + 1)
+            test_result = test_result and needed > 0 and isinstance(solution, Sudoku_Board) and solution.is_complete()
+        test_message(test_result, m)
+
+        m = 'solve_board_helper() with limits and no stats'
+        temp = board1.copy()
+        temp.find_values()
+        result = temp.solve_board_helper(temp.guesses.keys(), None, 0, Sudoku_Stats.Search_Limits(max_nodes = 3))
+        test_result = result is None
+        temp = board1.copy()
+        temp.find_values()
+        result = temp.solve_board_helper(temp.guesses.keys(), None, 0, Sudoku_Stats.Search_Limits(max_nodes = 10 ** 6))
+        test_result = test_result and result is not None and result.is_complete()
+        test_message(test_result, m)
+
+        m = 'Search_Limits looks at the clock every guess when the guesses are slow'
+        start = time.time()
+        limits = Sudoku_Stats.Search_Limits(deadline = start + 0.05)
+        nodes = 0
+        while not limits.exceeded(nodes) and nodes < 100:
+            time.sleep(0.01) # a guess on a big board
+            nodes += 1
+        test_result = limits.reason == 'deadline' and time.time() - start < 0.2
+        limits = Sudoku_Stats.Search_Limits(deadline = time.time() + 60)
+        for nodes in xrange(1000):
+            limits.exceeded(nodes)
+        test_result = test_result and limits.mask == limits.max_mask
+        test_message(test_result, m)
+
+        m = 'a Cancel_Token stops a solve running in another thread'
+        import threading
+        token = Sudoku_Stats.Cancel_Token()
+        results = []
+        worker = threading.Thread(target = lambda: results.append(board1.copy().solve_board('backtrack', cancel = token)))
+        time_cancel = time.time()
+        worker.start()
+        time.sleep(0.02)
+        token.cancel()
+        worker.join()
+        test_result = isinstance(results[0], Sudoku_Stats.Timed_Out) and results[0].reason == 'cancelled'
+        test_result = test_result and time.time() - time_cancel < 0.2
+        test_message(test_result, m)
+
+        m = 'a Cancel_Token stops a solve running in another process'
+        import multiprocessing
+        def solve_in_process(board, token, queue):
+            result = board.solve_board('backtrack', cancel = token)
+            queue.put((result.reason, result.stats.nodes) if isinstance(result, Sudoku_Stats.Timed_Out) else None)
+        token = Sudoku_Stats.Cancel_Token()
+        queue = multiprocessing.Queue()
+        worker = multiprocessing.Process(target = solve_in_process, args = (board1.copy(), token, queue))
+        worker.start()
+        time.sleep(0.1)
+        token.cancel()
+        found = queue.get(timeout = 10)
+        worker.join()
+        test_result = found is not None and found[0] == 'cancelled' and found[1] > 0
+        test_message(test_result, m)
+
         # displays test result summary:
         time_end = time.time()
         print "ran a total of " + str(test_count) + " tests."
@@ -0,0 +1,509 @@
+import os
+import sys
+import time
+import random
+import sqlite3
+import collections
+import Sudoku_IO
+import Sudoku_Batch
+import Sudoku_Symmetry
+from Sudoku_Board import Sudoku_Board
+
+# Caches of solutions
+#
+# Solution_Cache is an in memory cache keyed on the canonical form of a puzzle (see Sudoku_Symmetry).
+# Puzzles that only differ by relabeled digits, permuted rows / cols / bands / stacks or a transpose share
+# one entry.  The cache stores the solution of the canonical puzzle, a hit maps it back to the puzzle that
+# was asked for through the inverse of its transform.  Puzzles without a solution are cached too.
+#
+# Solution_Store keeps solutions on disk in a SQLite file, so they survive a restart and are shared by every
+# process that opens the same file.  Puzzles are keyed by their cells packed 4 bits each (see
+# Sudoku_IO.pack_cells), lookups and inserts go in batches of one transaction, and the entries used the
+# longest ago are evicted once the store holds max_entries.  Lookups only read: the time each hit was used
+# and the hit / miss counts are kept in memory and written with the next put_many(), by flush(), or by a
+# lookup once they are FLUSH_INTERVAL seconds old, so processes reading the same file do not wait for each
+# other on the write lock.
+
+POLICIES = ('lru', 'fifo')
+BATCH_SIZE = 500 # puzzles per sql statement, sqlite allows 999 parameters
+FLUSH_INTERVAL = 5.0 # seconds lookups may keep their used times and counts before writing them
+
+class Solution_Cache(object):
+    # input: the number of entries to keep (None for no limit), the eviction policy ('lru' evicts the entry
+    #        used the longest ago, 'fifo' the one stored first) and the engine solving misses (see
+    #        Sudoku_Batch.ENGINES)
+    # output: an empty cache
+    def __init__(self, max_size = 1024, policy = 'lru', engine = 'propagate'):
+        assert policy in POLICIES
+        assert engine in Sudoku_Batch.ENGINES
+        self.max_size = max_size
+        self.policy = policy
+        self.engine = engine
+        self.entries = collections.OrderedDict() # canonical cells (str) -> canonical solution (str) or None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    # input: a canonical key and its solution (or None)
+    # output: none, but will store the entry and evict the oldest ones while the cache is over max_size
+    def store(self, key, solution):
+        self.entries[key] = solution
+        while self.max_size is not None and len(self.entries) > self.max_size:
+            self.entries.popitem(last = False)
+            self.evictions += 1
+
+    # input: a puzzle line
+    # output: the solution line, or None if the puzzle is not valid or not solveable
+    def solve_line(self, line):
+        cells = Sudoku_IO.parse_cells(line.strip())
+        assert cells is not None
+        n = int(round(len(cells) ** 0.5))
+        canonical, transform = Sudoku_Symmetry.canonical_form(cells, n, int(round(n ** 0.5)))
+        key = str(canonical)
+        if key in self.entries:
+            self.hits += 1
+            solution = self.entries[key]
+            if self.policy == 'lru':
+                del self.entries[key]
+                self.entries[key] = solution # most recently used entries are at the end
+        else:
+            self.misses += 1
+            solution = Sudoku_Batch.solve_line(Sudoku_IO.format_cells(canonical), self.engine)
+            if solution is not None:
+                solution = str(Sudoku_IO.parse_cells(solution))
+            self.store(key, solution)
+        if solution is None:
+            return None
+        return Sudoku_IO.format_cells(Sudoku_Symmetry.invert_transform(bytearray(solution), n, transform))
+
+    # input: a Sudoku_Board
+    # output: a solved copy of the board (all cells added to givens), or None if it is not solveable
+    def solve(self, board):
+        solution = self.solve_line(Sudoku_IO.format_board(board))
+        if solution is None:
+            return None
+        result = board.copy()
+        n = board.board_size
+        for i, value in enumerate(Sudoku_IO.parse_cells(solution)):
+            result.set(i / n, i % n, value)
+            result.givens[(i / n, i % n)] = value
+        result.guesses.clear()
+        return result
+
+    # output: the fraction of lookups that were hits
+    def hit_rate(self):
+        return self.hits / float(max(self.hits + self.misses, 1))
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = self.misses = self.evictions = 0
+
+class Solution_Store(object):
+    # input: the path of the SQLite file (created when missing), the number of entries to keep (None for no
+    #        limit) and how long to wait for another process holding the lock, in seconds
+    # output: a store, every process opens its own connection the first time it uses the store
+    def __init__(self, path, max_entries = 1000000, timeout = 30.0):
+        self.path = path
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.hits = 0 # lookups of this instance
+        self.misses = 0
+        self.evictions = 0
+        self.connection = None
+        self.pid = None
+        self.used = {} # packed cells of the hits not written yet -> when they were used
+        self.pending = {'hits': 0, 'misses': 0} # counts not written yet
+        self.since = None # when the oldest of them was taken
+        self.connect()
+
+    # output: the sqlite3 connection of this process, opened (and the tables created) when needed
+    def connect(self):
+        if self.connection is None or self.pid != os.getpid(): # a forked worker must not share the parent's
+            self.connection = sqlite3.connect(self.path, timeout = self.timeout, isolation_level = None)
+            self.pid = os.getpid()
+            self.used = {} # what the parent had not written is the parent's to write
+            self.pending = {'hits': 0, 'misses': 0}
+            self.since = None
+            self.connection.text_factory = str
+            self.connection.execute('PRAGMA journal_mode = WAL') # readers do not block the writer
+            self.connection.execute('PRAGMA synchronous = NORMAL')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS solutions (puzzle BLOB PRIMARY KEY, '
+                                    'solution BLOB, used REAL NOT NULL)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS solutions_used ON solutions (used)')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, '
+                                    'value INTEGER NOT NULL)')
+        return self.connection
+
+    def close(self):
+        if self.connection is not None and self.pid == os.getpid():
+            self.flush()
+            self.connection.close()
+        self.connection = None
+
+    # input: a function taking the connection, run inside one transaction, and whether it writes
+    # output: what the function returns, the transaction is rolled back if it raises
+    def transaction(self, work, write = True):
+        connection = self.connect()
+        # a writer takes the write lock up front, waiting up to timeout for it, a reader takes none
+        connection.execute('BEGIN IMMEDIATE' if write else 'BEGIN')
+        try:
+            result = work(connection)
+        except:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return result
+
+    def add_counters(self, connection, counts):
+        for name, value in counts.iteritems():
+            if value:
+                connection.execute('INSERT OR IGNORE INTO counters VALUES (?, 0)', (name,))
+                connection.execute('UPDATE counters SET value = value + ? WHERE name = ?', (value, name))
+
+    # input: the connection, inside a write transaction
+    # output: none, but will write the used times and the counts the lookups kept in memory
+    def write_pending(self, connection):
+        used = sorted((when, sqlite3.Binary(key)) for key, when in self.used.iteritems())
+        connection.executemany('UPDATE solutions SET used = ? WHERE puzzle = ? AND used < ?',
+                               [(when, key, when) for when, key in used])
+        self.add_counters(connection, self.pending)
+
+    def clear_pending(self):
+        self.used = {}
+        self.pending = {'hits': 0, 'misses': 0}
+        self.since = None
+
+    # output: none, but will write what the lookups kept in memory in one write transaction
+    def flush(self):
+        if self.since is not None:
+            self.transaction(self.write_pending)
+            self.clear_pending()
+
+    # input: an iterable of puzzle lines
+    # output: dict of the puzzles found -> solution line (None for a puzzle without a solution), puzzles that
+    #         are not in the store (and lines that are not puzzles) are left out.  Hits are marked as used
+    #         for eviction.
+    def get_many(self, puzzles):
+        keys = {} # packed cells -> (number of cells, puzzles)
+        for puzzle in puzzles:
+            cells = Sudoku_IO.parse_cells(puzzle.strip())
+            if cells is None:
+                continue # header or junk line
+            keys.setdefault(Sudoku_IO.pack_cells(cells), (len(cells), []))[1].append(puzzle)
+        key_list = [sqlite3.Binary(key) for key in keys]
+        def work(connection):
+            rows = []
+            for start in xrange(0, len(key_list), BATCH_SIZE):
+                batch = key_list[start:start + BATCH_SIZE]
+                marks = ','.join('?' * len(batch))
+                rows += connection.execute('SELECT puzzle, solution FROM solutions WHERE puzzle IN (' + marks + ')',
+                                           batch).fetchall()
+            return rows
+        rows = self.transaction(work, write = False) # one snapshot for every batch, without the write lock
+        found = {}
+        now = time.time()
+        for key, solution in rows:
+            key = str(key)
+            count, same = keys[key]
+            if solution is not None:
+                solution = Sudoku_IO.format_cells(Sudoku_IO.unpack_cells(str(solution), count))
+            for puzzle in same:
+                found[puzzle] = solution
+            self.used[key] = now
+        self.hits += len(rows)
+        self.misses += len(key_list) - len(rows)
+        self.pending['hits'] += len(rows)
+        self.pending['misses'] += len(key_list) - len(rows)
+        if self.since is None:
+            self.since = now
+        elif now - self.since >= FLUSH_INTERVAL:
+            self.flush()
+        return found
+
+    # input: a puzzle line
+    # output: (found, solution line or None)
+    def get(self, puzzle):
+        found = self.get_many([puzzle])
+        return (puzzle in found), found.get(puzzle)
+
+    # input: an iterable of (puzzle, solution or None) pairs, as lines or bytearrays of cells
+    # output: the number of entries written, all in one transaction, then the store is evicted down to
+    #         max_entries if it grew past it
+    def put_many(self, items):
+        rows = []
+        now = time.time()
+        for puzzle, solution in items:
+            if isinstance(puzzle, basestring):
+                puzzle = Sudoku_IO.parse_cells(puzzle.strip())
+            if isinstance(solution, basestring):
+                solution = Sudoku_IO.parse_cells(solution.strip())
+            packed = None if solution is None else sqlite3.Binary(Sudoku_IO.pack_cells(solution))
+            rows.append((sqlite3.Binary(Sudoku_IO.pack_cells(puzzle)), packed, now))
+        def work(connection):
+            self.write_pending(connection) # before evicting, so the entries looked up are kept
+            connection.executemany('INSERT OR REPLACE INTO solutions VALUES (?, ?, ?)', rows)
+            evicted = 0
+            if self.max_entries is not None:
+                size = connection.execute('SELECT COUNT(*) FROM solutions').fetchone()[0]
+                if size > self.max_entries:
+                    # evict down to 90% so the next inserts do not evict again right away
+                    evicted = size - int(self.max_entries * 0.9)
+                    connection.execute('DELETE FROM solutions WHERE puzzle IN '
+                                       '(SELECT puzzle FROM solutions ORDER BY used LIMIT ?)', (evicted,))
+            self.add_counters(connection, {'evictions': evicted})
+            return evicted
+        self.evictions += self.transaction(work)
+        self.clear_pending()
+        return len(rows)
+
+    def put(self, puzzle, solution):
+        self.put_many([(puzzle, solution)])
+
+    # input: a Sudoku_Board and the engine to solve it with on a miss (see Sudoku_Board.solve_board)
+    # output: the solution of solve_board, from the store when it holds the board
+    def solve(self, board, engine = 'propagate'):
+        found, solution = self.get(Sudoku_IO.format_board(board))
+        if not found:
+            result = board.solve_board(engine)
+            if board.valid_board():
+                self.put(Sudoku_IO.format_board(board), result and Sudoku_IO.format_board(result))
+            return result
+        if solution is None:
+            return None
+        result = board.copy()
+        n = board.board_size
+        for i, value in enumerate(Sudoku_IO.parse_cells(solution)):
+            result.set(i / n, i % n, value)
+            result.givens[(i / n, i % n)] = value
+        result.guesses.clear()
+        return result
+
+    def __len__(self):
+        return self.connect().execute('SELECT COUNT(*) FROM solutions').fetchone()[0]
+
+    # output: dict of the hits, misses and evictions of every process that used the store file (what other
+    #         processes have not flushed yet is not counted)
+    def counters(self):
+        self.flush()
+        totals = {'hits': 0, 'misses': 0, 'evictions': 0}
+        totals.update(self.connect().execute('SELECT name, value FROM counters').fetchall())
+        return totals
+
+# Program runs from here
+
+if __name__ == "__main__":
+    print "Running sudoku cache tests.\n"
+    TEST = True
+    if TEST:
+        import Sudoku_Benchmark
+        test_count = 0
+        pass_count = 0
+        fail_count = 0
+        time_start = time.time()
+
+        def test_message(passed_test, message):
+            global pass_count
+            global fail_count
+            global test_count
+            test_count += 1
+            if passed_test:
+                print ">>> PASSED TEST: " + message + "\n"
+                pass_count += 1
+            else:
+                print "!!! FAILED TEST: " + message + " !!!\n"
+                fail_count += 1
+
+        # output: True if solution is a complete valid board that keeps the values of puzzle
+        def solves(puzzle, solution):
+            if solution is None or '.' in solution or len(solution) != len(puzzle):
+                return False
+            n, block_size, grid = Sudoku_Batch.parse_line(solution)
+            keeps = all(p == '.' or p == s for p, s in zip(puzzle, solution))
+            return keeps and Sudoku_Batch.grid_is_valid(n, block_size, grid)
+
+        rng = random.Random(12)
+        puzzles = Sudoku_Benchmark.build_corpus('hard', 0, 4) + Sudoku_Benchmark.build_corpus('17clue', 0, 5)
+        puzzles += Sudoku_Benchmark.build_corpus('easy', 0, 5)
+
+        # TEST: isomorphic puzzles have the same canonical form, the transform takes the puzzle to it
+        m = 'canonical_form() is the same for isomorphic puzzles'
+        test_result = True
+        for line in puzzles:
+            cells = Sudoku_IO.parse_cells(line)
+            canonical, transform = Sudoku_Symmetry.canonical_form(cells)
+            test_result = test_result and Sudoku_Symmetry.apply_transform(cells, 9, transform) == canonical
+            test_result = test_result and Sudoku_Symmetry.invert_transform(canonical, 9, transform) == cells
+            for x in xrange(3):
+                variant = Sudoku_Benchmark.transform_line(line, 3, rng)
+                test_result = test_result and Sudoku_Symmetry.canonical_form(Sudoku_IO.parse_cells(variant))[0] == canonical
+        board = Sudoku_Board()
+        board.fill(Sudoku_Batch.parse_line(puzzles[0])[2])
+        test_result = test_result and board.canonical_form()[0] == Sudoku_IO.format_cells(
+            Sudoku_Symmetry.canonical_form(Sudoku_IO.parse_cells(puzzles[0]))[0])
+        test_message(test_result, m)
+
+        # TEST: variants of a puzzle hit the cache and get their own solution back
+        m = 'Solution_Cache hits on isomorphic puzzles and maps the solution back'
+        cache = Solution_Cache()
+        test_result = True
+        for line in puzzles:
+            test_result = test_result and solves(line, cache.solve_line(line))
+            for x in xrange(3):
+                variant = Sudoku_Benchmark.transform_line(line, 3, rng)
+                test_result = test_result and solves(variant, cache.solve_line(variant))
+        test_result = test_result and cache.misses == len(puzzles) and cache.hits == 3 * len(puzzles)
+        test_result = test_result and len(cache) == len(puzzles)
+        test_message(test_result, m)
+
+        m = 'Solution_Cache.solve() returns a solved board and caches puzzles without a solution'
+        board = Sudoku_Board()
+        board.fill(Sudoku_Batch.parse_line(puzzles[0])[2])
+        solution = cache.solve(board)
+        test_result = solution is not None and solution.is_complete() and board.filled < 81
+        bad = Sudoku_Board()
+        for col in xrange(8):
+            bad.set(0, col, col + 1)
+        bad.set(1, 8, 9) # (0, 8) has no possible value
+        misses = cache.misses
+        test_result = test_result and cache.solve(bad) is None and cache.solve(bad) is None
+        test_result = test_result and cache.misses == misses + 1
+        test_message(test_result, m)
+
+        # TEST: eviction
+        m = 'Solution_Cache evicts the least recently used entry'
+        cache = Solution_Cache(max_size = 2)
+        a, b, c = puzzles[:3]
+        cache.solve_line(a)
+        cache.solve_line(b)
+        cache.solve_line(a) # a is now the most recently used
+        cache.solve_line(c) # evicts b
+        hits = cache.hits
+        cache.solve_line(a)
+        test_result = cache.hits == hits + 1 and cache.evictions == 1 and len(cache) == 2
+        cache.solve_line(b)
+        test_result = test_result and cache.hits == hits + 1 # b was evicted
+        test_message(test_result, m)
+
+        m = 'Solution_Cache(policy = fifo) evicts the oldest entry'
+        cache = Solution_Cache(max_size = 2, policy = 'fifo')
+        cache.solve_line(a)
+        cache.solve_line(b)
+        cache.solve_line(a)
+        cache.solve_line(c) # evicts a even though it was just used
+        cache.solve_line(b)
+        test_result = cache.hits == 2 and cache.evictions == 1
+        cache.solve_line(a)
+        test_result = test_result and cache.hits == 2 and cache.misses == 4
+        test_message(test_result, m)
+
+        # TEST: canonicalization is much cheaper than solving
+        m = 'canonical_form() is cheaper than a solve'
+        hard = Sudoku_Benchmark.build_corpus('hard', 0, 4) + Sudoku_Benchmark.build_corpus('17clue', 0, 5)
+        start = time.time()
+        for line in hard:
+            Sudoku_Symmetry.canonical_form(Sudoku_IO.parse_cells(line))
+        canonical_time = time.time() - start
+        start = time.time()
+        for line in hard:
+            Sudoku_Batch.solve_line(line)
+        solve_time = time.time() - start
+        print 'canonical_form: ' + str(canonical_time) + ' seconds, solve: ' + str(solve_time) + ' seconds'
+        test_result = canonical_time < solve_time
+        test_message(test_result, m)
+
+        # TEST: persistent store
+        import tempfile
+        import multiprocessing
+        path = tempfile.mktemp(suffix = '.sqlite')
+        lines = Sudoku_Benchmark.build_corpus('easy', 0, 40)
+        solutions = [Sudoku_Batch.solve_line(line) for line in lines]
+        bad_line = Sudoku_IO.format_board(bad)
+
+        m = 'Solution_Store keeps solutions across instances and counts hits and misses'
+        store = Solution_Store(path)
+        test_result = store.get_many(lines) == {} and store.misses == len(lines)
+        test_result = test_result and store.put_many(zip(lines[:30], solutions[:30])) == 30
+        store.put(bad_line, None)
+        store.close()
+        store = Solution_Store(path)
+        found = store.get_many(lines + [bad_line])
+        test_result = test_result and found == dict(zip(lines[:30], solutions[:30]) + [(bad_line, None)])
+        test_result = test_result and store.hits == 31 and store.misses == 10 and len(store) == 31
+        test_result = test_result and store.get(bad_line) == (True, None) and store.get(lines[35]) == (False, None)
+        test_result = test_result and store.counters() == {'hits': 32, 'misses': 51, 'evictions': 0}
+        test_message(test_result, m)
+
+        m = 'Solution_Store.get_many() reads without the write lock and skips lines that are not puzzles'
+        writer = sqlite3.connect(path, isolation_level = None)
+        writer.execute('BEGIN IMMEDIATE') # another process is writing
+        reader = Solution_Store(path, timeout = 0.1)
+        found = reader.get_many(lines[:3] + ['quizzes', ''])
+        test_result = found == dict(zip(lines[:3], solutions[:3])) and reader.hits == 3 and reader.misses == 0
+        writer.execute('COMMIT')
+        writer.close()
+        reader.close()
+        test_result = test_result and store.counters()['hits'] == 35
+        test_message(test_result, m)
+
+        m = 'Solution_Store.solve() solves a board once'
+        board = Sudoku_Board()
+        board.fill(Sudoku_Batch.parse_line(lines[35])[2])
+        solution = store.solve(board)
+        misses = store.misses
+        again = store.solve(board)
+        test_result = solution is not None and solution.is_complete() and again.board == solution.board
+        test_result = test_result and store.misses == misses and store.hits > 0
+        test_message(test_result, m)
+        store.close()
+        os.remove(path)
+
+        m = 'Solution_Store evicts the entries used the longest ago'
+        store = Solution_Store(path, max_entries = 20)
+        store.put_many(zip(lines[:10], solutions[:10]))
+        time.sleep(0.01)
+        store.put_many(zip(lines[10:20], solutions[10:20]))
+        time.sleep(0.01)
+        store.get_many(lines[:5]) # the first five are used again
+        time.sleep(0.01)
+        store.put_many(zip(lines[20:25], solutions[20:25])) # 25 entries, evicted down to 18
+        found = store.get_many(lines[:25])
+        test_result = len(store) == 18 and store.evictions == 7
+        test_result = test_result and all(line in found for line in lines[:5] + lines[12:25])
+        test_result = test_result and not any(line in found for line in lines[5:10])
+        test_message(test_result, m)
+        store.close()
+        os.remove(path)
+
+        # writes from several processes at once
+        def store_worker(task):
+            path, items = task
+            store = Solution_Store(path)
+            for x in xrange(0, len(items), 5):
+                store.put_many(items[x:x + 5])
+                store.get_many([line for line, solution in items])
+            store.close()
+            return store.hits
+
+        m = 'Solution_Store is safe to share between worker processes'
+        items = zip(lines, solutions)
+        store = Solution_Store(path)
+        pool = multiprocessing.Pool(4)
+        hits = pool.map(store_worker, [(path, items[x::4]) for x in xrange(4)])
+        pool.close()
+        pool.join()
+        test_result = len(store) == len(lines) and store.get_many(lines) == dict(items)
+        test_result = test_result and store.counters()['hits'] == sum(hits) + len(lines)
+        test_message(test_result, m)
+        store.close()
+        os.remove(path)
+
+        # displays test result summary:
+        time_end = time.time()
+        print "ran a total of " + str(test_count) + " tests."
+        print "test runtime: " + str(time_end - time_start) + " seconds"
+        print "total tests passed: " + str(pass_count)
+        print "total tests failed: " + str(fail_count)
+        print "\n"
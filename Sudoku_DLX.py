@@ -0,0 +1,178 @@
+# Exact cover solver for sudoku using Knuth's Dancing Links (Algorithm X)
+#
+# A board of size n with sub blocks of size b has 4 * n * n constraints:
+#   cell      (row, col) holds a value
+#   row-digit  row holds digit v
+#   col-digit  col holds digit v
+#   box-digit  sub block holds digit v
+# and one matrix row per candidate placement (row, col, v).  Constraints already satisfied by
+# the givens are left out of the matrix, as are placements that clash with a given, so the
+# search only ever sees the open part of the puzzle.
+
+class Dancing_Links(object):
+    # input: board_size, block_size and a 2d list of the board (0 for an empty cell), the givens are
+    #        assumed to be valid (see Sudoku_Board.valid_board)
+    # output: a matrix ready to be searched with solve()
+    def __init__(self, board_size, block_size, grid):
+        n = board_size
+        self.board_size = n
+        self.block_size = block_size
+        cells = n * n
+
+        # digits already used in every row, col and sub block
+        used = [0] * (3 * n)
+        for row in xrange(n):
+            for col in xrange(n):
+                value = grid[row][col]
+                if value != 0:
+                    bit = 1 << value
+                    used[row] |= bit
+                    used[n + col] |= bit
+                    used[2 * n + (row / block_size) * block_size + col / block_size] |= bit
+
+        # node 0 is the root, nodes 1 .. columns are column headers
+        self.L = L = [0]
+        self.R = R = [0]
+        self.U = U = [0]
+        self.D = D = [0]
+        self.C = C = [0]
+        self.S = S = [0] # number of nodes in each column
+        self.placements = [] # matrix row id -> (row, col, value)
+        self.row_of = row_of = [-1] # node -> matrix row id
+
+        column_of = [0] * (4 * cells) # constraint -> header node, 0 when the givens already satisfy it
+        for constraint in xrange(4 * cells):
+            kind, rest = divmod(constraint, cells)
+            unit, value = divmod(rest, n) # for a cell constraint this is (row, col)
+            if kind == 0:
+                open_constraint = grid[unit][value] == 0
+            else:
+                open_constraint = not used[(kind - 1) * n + unit] & (1 << (value + 1))
+            if open_constraint:
+                node = len(L)
+                column_of[constraint] = node
+                L.append(node - 1)
+                R.append(0)
+                R[node - 1] = node
+                L[0] = node
+                U.append(node)
+                D.append(node)
+                C.append(node)
+                S.append(0)
+                row_of.append(-1)
+
+        for row in xrange(n):
+            for col in xrange(n):
+                if grid[row][col] != 0:
+                    continue
+                block = (row / block_size) * block_size + col / block_size
+                taken = used[row] | used[n + col] | used[2 * n + block]
+                for value in xrange(1, n + 1):
+                    if taken & (1 << value):
+                        continue
+                    row_id = len(self.placements)
+                    self.placements.append((row, col, value))
+                    first = len(L)
+                    constraints = (row * n + col, cells + row * n + value - 1,
+                                   2 * cells + col * n + value - 1, 3 * cells + block * n + value - 1)
+                    for k in xrange(4):
+                        header = column_of[constraints[k]]
+                        node = len(L)
+                        # link vertically at the bottom of the column
+                        U.append(U[header])
+                        D.append(header)
+                        D[U[header]] = node
+                        U[header] = node
+                        C.append(header)
+                        S[header] += 1
+                        row_of.append(row_id)
+                        # link horizontally into the (circular) matrix row
+                        L.append(node - 1 if k > 0 else first + 3)
+                        R.append(node + 1 if k < 3 else first)
+        self.solution = []
+        self.nodes = 0 # matrix rows tried by search()
+        self.backtracks = 0 # matrix rows taken back
+        self.max_depth = 0 # deepest number of rows chosen at once
+        self.limits = None # Sudoku_Stats.Search_Limits asked before every row tried, or None
+        self.stopped = None # the reason the limits gave when they stopped the search
+
+    def cover(self, column):
+        L, R, U, D, C, S = self.L, self.R, self.U, self.D, self.C, self.S
+        R[L[column]] = R[column]
+        L[R[column]] = L[column]
+        i = D[column]
+        while i != column:
+            j = R[i]
+            while j != i:
+                D[U[j]] = D[j]
+                U[D[j]] = U[j]
+                S[C[j]] -= 1
+                j = R[j]
+            i = D[i]
+
+    def uncover(self, column):
+        L, R, U, D, C, S = self.L, self.R, self.U, self.D, self.C, self.S
+        i = U[column]
+        while i != column:
+            j = L[i]
+            while j != i:
+                S[C[j]] += 1
+                D[U[j]] = j
+                U[D[j]] = j
+                j = L[j]
+            i = U[i]
+        R[L[column]] = column
+        L[R[column]] = column
+
+    # input: none
+    # output: True if an exact cover was found, self.solution then holds the chosen matrix row ids
+    def search(self):
+        R, D, S = self.R, self.D, self.S
+        if R[0] == 0:
+            return True # every constraint is covered
+        # choose the column with the fewest remaining candidates (Knuth's S heuristic)
+        column = R[0]
+        best = column
+        best_size = S[column]
+        while column != 0 and best_size > 0:
+            if S[column] < best_size:
+                best = column
+                best_size = S[column]
+            column = R[column]
+        if best_size == 0:
+            return False # a constraint can no longer be satisfied
+        self.cover(best)
+        r = D[best]
+        limits = self.limits
+        while r != best:
+            if limits is not None and limits.exceeded(self.nodes):
+                self.stopped = limits.reason
+                break
+            self.nodes += 1
+            self.solution.append(self.row_of[r])
+            if len(self.solution) > self.max_depth:
+                self.max_depth = len(self.solution)
+            j = R[r]
+            while j != r:
+                self.cover(self.C[j])
+                j = R[j]
+            if self.search():
+                return True
+            self.solution.pop()
+            self.backtracks += 1
+            j = self.L[r]
+            while j != r:
+                self.uncover(self.C[j])
+                j = self.L[j]
+            r = D[r]
+        self.uncover(best)
+        return False
+
+    # input: none
+    # output: a list of (row, col, value) placements that complete the board, or None if there is no solution
+    #         or self.limits stopped the search (self.stopped then holds the reason)
+    def solve(self):
+        self.solution = []
+        if self.search():
+            return [self.placements[row_id] for row_id in self.solution]
+        return None
@@ -0,0 +1,329 @@
+import sys
+import time
+import random
+import multiprocessing
+import Sudoku_Propagator
+import Sudoku_Symmetry
+
+# Generator of puzzles with exactly one solution
+#
+# A full grid is filled by placing random digits in the sub blocks on the diagonal (they share no unit) and
+# letting the propagator finish the board, then a random transform of the symmetry group is applied.  Clues
+# are then taken away one cell at a time in a random order, and a removal is kept only when the puzzle still
+# has one solution.  As the puzzle had one solution before the removal, only the removed cell can differ in
+# a second solution, so the check is a single search with the removed value forbidden in that cell.  Most
+# early removals do not even need it: a cell whose peers hold every other digit is forced.
+#
+# The checks share one propagator instead of building the board again for each of them.  When removal k is
+# decided the clues are the cells kept among the first k of the order and every cell after k, so the order
+# is split in halves: the cells of the second half are assigned (and propagated) once while the first half
+# is decided, then taken back with undo and replaced by the cells the first half kept, and so on down to a
+# single removal.  A clue is assigned about log2(cells) times instead of once per check.
+#
+# Puzzles are rated by the techniques needed to solve them without guessing:
+#   easy      naked and hidden singles
+#   medium    also naked pairs, hidden pairs and pointing / claiming
+#   hard      guessing
+# For easy and medium a removal is kept only when those techniques still solve the puzzle, which also
+# proves it has one solution.
+
+DIFFICULTIES = ('easy', 'medium', 'hard')
+DIFFICULTY_TECHNIQUES = {'easy': ('hidden_singles',), 'medium': Sudoku_Propagator.ALL_TECHNIQUES}
+CHECK_TECHNIQUES = ('hidden_singles',) # the pair techniques cost more than the guesses they save here
+
+# input: board_size
+# output: block_size
+def block_size_of(board_size):
+    return int(round(board_size ** 0.5))
+
+# input: cells (bytearray, row * board_size + col) and board_size
+# output: 2d list of the values
+def to_grid(cells, board_size):
+    n = board_size
+    return [list(cells[row * n:(row + 1) * n]) for row in xrange(n)]
+
+# input: cells
+# output: the number of cells holding a value
+def clue_count(cells):
+    return len(cells) - bytearray(cells).count('\0')
+
+# input: board_size, block_size and a random.Random (or the random module)
+# output: bytearray of the cells of a random complete board
+def full_grid(board_size, block_size, rng):
+    n, bs = board_size, block_size
+    grid = [[0] * n for row in xrange(n)]
+    for block in xrange(bs):
+        digits = range(1, n + 1)
+        rng.shuffle(digits)
+        for k, value in enumerate(digits):
+            grid[block * bs + k / bs][block * bs + k % bs] = value
+    values = Sudoku_Propagator.Propagator(n, bs, grid, CHECK_TECHNIQUES).solve()
+    transform = Sudoku_Symmetry.random_transform(n, bs, rng)
+    return Sudoku_Symmetry.apply_transform(bytearray(values), n, transform)
+
+# input: cells, board_size, block_size and the techniques to apply
+# output: True if the techniques fill the whole board without guessing
+def solved_by(cells, board_size, block_size, techniques):
+    propagator = Sudoku_Propagator.Propagator(board_size, block_size, to_grid(cells, board_size), techniques)
+    return propagator.propagate() and propagator.is_complete()
+
+# input: cells of a puzzle with one solution, board_size and block_size
+# output: the difficulty (see DIFFICULTIES)
+def rate(cells, board_size = 9, block_size = 3):
+    for difficulty in DIFFICULTIES[:-1]:
+        if solved_by(cells, board_size, block_size, DIFFICULTY_TECHNIQUES[difficulty]):
+            return difficulty
+    return DIFFICULTIES[-1]
+
+# input: cells where cell i was just emptied, i, the value it held, the peers table and board_size
+# output: True if the peers of i hold every digit but value, so the removal keeps the puzzle unique
+def forced(cells, i, value, peers, board_size):
+    seen = 1 | (1 << value) # bit 0 is a blank
+    for p in peers[i]:
+        seen |= 1 << cells[p]
+    return seen == (1 << (board_size + 1)) - 1
+
+# input: a propagator holding a puzzle that had one solution before cell i was emptied, i and the value it held
+# output: True if value is still the only possible value of cell i, the propagator is left as it was
+def unique_without(propagator, i, value):
+    mark = propagator.mark()
+    unique = not propagator.eliminate(i, 1 << value) or propagator.solve() is None
+    propagator.undo(mark)
+    return unique
+
+# input: a propagator, the cells and the indexes into cells to assign
+# output: none, but will assign the values of those cells and propagate them
+def assign_cells(propagator, cells, indexes):
+    for i in indexes:
+        propagator.assign(i, cells[i])
+    propagator.propagate()
+
+# input: the cells of a full board, board_size, block_size, a random.Random, the number of clues to stop at
+#        and the difficulty not to go above (None for any)
+# output: bytearray of the puzzle, clues are removed until clues are left or none can be removed
+def remove_clues(solution, board_size, block_size, rng, clues = 0, difficulty = None):
+    n = board_size
+    units, units_of, peers = Sudoku_Propagator.unit_tables(n, block_size)
+    techniques = DIFFICULTY_TECHNIQUES.get(difficulty)
+    propagator = Sudoku_Propagator.Propagator(n, block_size, [[0] * n for row in xrange(n)],
+                                              techniques or CHECK_TECHNIQUES)
+    cells = bytearray(solution)
+    order = range(n * n)
+    rng.shuffle(order)
+    count = [n * n]
+
+    # decides the removals order[start:stop], the propagator holds every other clue
+    def decide(start, stop):
+        if count[0] <= clues:
+            return # every clue left is kept
+        if stop - start > 1:
+            middle = (start + stop) / 2
+            mark = propagator.mark()
+            assign_cells(propagator, cells, order[middle:stop])
+            decide(start, middle)
+            propagator.undo(mark)
+            assign_cells(propagator, cells, [i for i in order[start:middle] if cells[i]])
+            decide(middle, stop)
+            propagator.undo(mark)
+            return
+        i = order[start]
+        value = cells[i]
+        cells[i] = 0
+        if forced(cells, i, value, peers, n):
+            keep = True
+        elif techniques is not None:
+            keep = propagator.is_complete() # the propagator holds the puzzle, propagated with the techniques
+        else:
+            keep = unique_without(propagator, i, value)
+        if keep:
+            count[0] -= 1
+        else:
+            cells[i] = value
+
+    decide(0, n * n)
+    return cells
+
+# input: board_size, the exact number of clues wanted (None for as few as the removal reaches), the difficulty
+#        wanted (None for any), a random.Random (the random module when None) and how many full grids to try
+# output: (puzzle cells, solution cells) as bytearrays, or None if no grid gave the clues and difficulty asked
+def generate(board_size = 9, clues = None, difficulty = None, rng = None, attempts = 100):
+    assert difficulty is None or difficulty in DIFFICULTIES
+    if rng is None:
+        rng = random
+    n, bs = board_size, block_size_of(board_size)
+    for attempt in xrange(attempts):
+        solution = full_grid(n, bs, rng)
+        puzzle = remove_clues(solution, n, bs, rng, clues or 0, difficulty)
+        if clues is not None and clue_count(puzzle) != clues:
+            continue
+        if difficulty is not None and rate(puzzle, n, bs) != difficulty:
+            continue
+        return puzzle, solution
+    return None
+
+# input: (seed, start, stop, board_size, clues, difficulty, attempts)
+# output: list of (puzzle cells, solution cells) for the puzzles start .. stop - 1 of the seed, runs inside a
+#         worker process.  Every puzzle has its own random.Random, so the output does not depend on the workers.
+def generate_chunk(task):
+    seed, start, stop, board_size, clues, difficulty, attempts = task
+    results = []
+    for index in xrange(start, stop):
+        found = generate(board_size, clues, difficulty, random.Random('%s-%d' % (seed, index)), attempts)
+        if found is not None:
+            results.append(found)
+    return results
+
+# input: the number of puzzles, the seed, the options of generate(), the number of worker processes (None for
+#        one per core, 1 to generate in this process) and puzzles per message to a worker
+# output: generator of (puzzle cells, solution cells), the same for the same seed and options.  A puzzle that
+#         missed the clues or difficulty asked in every attempt is left out.
+def generate_many(count, seed = 0, board_size = 9, clues = None, difficulty = None, attempts = 100,
+                  workers = 1, chunksize = 16):
+    tasks = ((seed, start, min(start + chunksize, count), board_size, clues, difficulty, attempts)
+             for start in xrange(0, count, chunksize))
+    if workers == 1:
+        for task in tasks:
+            for result in generate_chunk(task):
+                yield result
+        return
+    pool = multiprocessing.Pool(workers)
+    try:
+        for results in pool.imap(generate_chunk, tasks):
+            for result in results:
+                yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+# Program runs from here
+#
+# usage: python Sudoku_Generator.py [--count N] [--seed S] [--size N] [--clues K] [--difficulty D]
+#                                   [--attempts A] [--workers W] [output]
+# writes "puzzle,solution" lines to output (or stdout).  With no arguments the self tests are run.
+
+if __name__ == "__main__":
+    import Sudoku_IO
+    TEST = len(sys.argv) == 1
+    if not TEST:
+        import argparse
+        parser = argparse.ArgumentParser(description = 'Generate sudoku puzzles with one solution.')
+        parser.add_argument('output', nargs = '?', default = '-', help = 'puzzle file, - for stdout')
+        parser.add_argument('--count', type = int, default = 1, help = 'number of puzzles')
+        parser.add_argument('--seed', default = 0, help = 'the same seed gives the same puzzles')
+        parser.add_argument('--size', type = int, default = 9, help = 'board size (9, 16 or 25)')
+        parser.add_argument('--clues', type = int, default = None, help = 'exact number of clues')
+        parser.add_argument('--difficulty', choices = DIFFICULTIES, default = None)
+        parser.add_argument('--attempts', type = int, default = 100, help = 'full grids to try per puzzle')
+        parser.add_argument('--workers', type = int, default = 1, help = 'worker processes (0 for one per core)')
+        args = parser.parse_args()
+        destination = sys.stdout if args.output == '-' else args.output
+        start = time.time()
+        puzzles = generate_many(args.count, args.seed, args.size, args.clues, args.difficulty, args.attempts,
+                                args.workers or None)
+        count = Sudoku_IO.write_puzzles(destination, ((Sudoku_IO.format_cells(puzzle), Sudoku_IO.format_cells(solution))
+                                                      for puzzle, solution in puzzles))
+        elapsed = time.time() - start
+        sys.stderr.write('generated ' + str(count) + ' puzzles in ' + str(elapsed) + ' seconds ('
+                         + str(count / max(elapsed, 1e-9)) + ' puzzles / second)\n')
+    else:
+        test_count = 0
+        pass_count = 0
+        fail_count = 0
+        time_start = time.time()
+
+        def test_message(passed_test, message):
+            global pass_count
+            global fail_count
+            global test_count
+            test_count += 1
+            if passed_test:
+                print ">>> PASSED TEST: " + message + "\n"
+                pass_count += 1
+            else:
+                print "!!! FAILED TEST: " + message + " !!!\n"
+                fail_count += 1
+
+        # output: True if puzzle has solution as its only solution
+        def unique(puzzle, solution, board_size = 9):
+            keeps = all(p == 0 or p == s for p, s in zip(puzzle, solution))
+            propagator = Sudoku_Propagator.Propagator(board_size, block_size_of(board_size),
+                                                      to_grid(puzzle, board_size))
+            return keeps and 0 not in solution and propagator.count_solutions(2) == 1 and \
+                Sudoku_Propagator.Propagator(board_size, block_size_of(board_size), to_grid(solution, board_size)).propagate()
+
+        print "TESTING GENERATOR\n"
+
+        m = 'full_grid() gives valid boards that are not all the same grid relabeled'
+        rng = random.Random(1)
+        grids = [full_grid(9, 3, rng) for x in xrange(10)]
+        test_result = all(unique(grid, grid) for grid in grids)
+        forms = set(str(Sudoku_Symmetry.canonical_form(grid)[0]) for grid in grids)
+        test_result = test_result and len(forms) == 10
+        test_message(test_result, m)
+
+        m = 'generate() gives puzzles with one solution'
+        test_result = True
+        for x in xrange(10):
+            puzzle, solution = generate()
+            test_result = test_result and unique(puzzle, solution)
+        test_message(test_result, m)
+
+        m = 'generate() takes away every clue it can, each clue left is needed'
+        test_result = True
+        for x in xrange(3):
+            puzzle, solution = generate(rng = random.Random(x))
+            for i in xrange(81):
+                if puzzle[i]:
+                    fewer = bytearray(puzzle)
+                    fewer[i] = 0
+                    propagator = Sudoku_Propagator.Propagator(9, 3, to_grid(fewer, 9))
+                    test_result = test_result and propagator.count_solutions(2) == 2
+        test_message(test_result, m)
+
+        m = 'generate(clues = K) gives exactly K clues'
+        test_result = True
+        for clues in (25, 30, 40):
+            puzzle, solution = generate(clues = clues)
+            test_result = test_result and clue_count(puzzle) == clues and unique(puzzle, solution)
+        test_message(test_result, m)
+
+        m = 'generate(difficulty = D) gives puzzles of that difficulty'
+        test_result = True
+        for difficulty in DIFFICULTIES:
+            for x in xrange(3):
+                puzzle, solution = generate(difficulty = difficulty)
+                test_result = test_result and rate(puzzle) == difficulty and unique(puzzle, solution)
+        test_result = test_result and rate(Sudoku_IO.parse_cells('8..........36......7..9.2...5...7.......457.....1'
+                                                                 '...3...1....68..85...1..9....4..')) == 'hard'
+        test_message(test_result, m)
+
+        m = 'generate() of a 16x16 puzzle'
+        puzzle, solution = generate(16, clues = 200)
+        test_result = clue_count(puzzle) == 200 and unique(puzzle, solution, 16)
+        test_message(test_result, m)
+
+        m = 'generate_many() is the same for the same seed, whatever the workers'
+        first = list(generate_many(20, seed = 7, chunksize = 3))
+        second = list(generate_many(20, seed = 7, workers = 2, chunksize = 5))
+        other = list(generate_many(20, seed = 8))
+        test_result = len(first) == 20 and first == second and first != other
+        test_result = test_result and all(unique(puzzle, solution) for puzzle, solution in first)
+        test_message(test_result, m)
+
+        m = 'generate_many() throughput'
+        for clues, difficulty in ((None, None), (None, 'easy'), (30, None)):
+            start = time.time()
+            count = len(list(generate_many(100, seed = 1, clues = clues, difficulty = difficulty)))
+            elapsed = time.time() - start
+            print 'clues = ' + str(clues) + ', difficulty = ' + str(difficulty) + ': ' + \
+                str(count / elapsed) + ' puzzles / second'
+        test_message(count == 100, m)
+
+        # displays test result summary:
+        time_end = time.time()
+        print "ran a total of " + str(test_count) + " tests."
+        print "test runtime: " + str(time_end - time_start) + " seconds"
+        print "total tests passed: " + str(pass_count)
+        print "total tests failed: " + str(fail_count)
+        print "\n"
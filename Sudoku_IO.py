@@ -0,0 +1,255 @@
+import sys
+import os
+import mmap
+import time
+import random
+import binascii
+import tempfile
+from Sudoku_Board import Sudoku_Board, Compact_Sudoku_Board
+
+# Streaming reader and writer for the one puzzle per line text format
+#
+#   puzzle[,solution]
+#
+# A puzzle is board_size * board_size characters, '.' or '0' for a blank, '1' - '9' then 'A' - 'P' for
+# the values 1 - 25.  The optional solution column may be separated by a comma, a space or a tab.
+# Blank lines, lines starting with '#' and header lines (such as "quizzes,solutions") are skipped.
+# Files are read one line at a time through a large buffer (or a memory map), so memory use does not
+# grow with the size of the file.
+
+ALPHABET = '123456789ABCDEFGHIJKLMNOP'
+
+# 256 character translation tables between text and cell values
+CHAR_TO_VALUE = [chr(255)] * 256 # 255 marks a character that is not part of a puzzle
+CHAR_TO_VALUE[ord('.')] = CHAR_TO_VALUE[ord('0')] = chr(0)
+for value, char in enumerate(ALPHABET):
+    CHAR_TO_VALUE[ord(char)] = CHAR_TO_VALUE[ord(char.lower())] = chr(value + 1)
+CHAR_TO_VALUE = ''.join(CHAR_TO_VALUE)
+VALUE_TO_CHAR = ('.' + ALPHABET).ljust(256, '?')
+
+# translation tables between cell values and hex digits, to pack two cells per byte through binascii
+VALUE_TO_HEX = '0123456789abcdef'.ljust(256, '?')
+HEX_TO_VALUE = [chr(0)] * 256
+for value, char in enumerate('0123456789abcdef'):
+    HEX_TO_VALUE[ord(char)] = chr(value)
+HEX_TO_VALUE = ''.join(HEX_TO_VALUE)
+
+BUFFER_SIZE = 1 << 20
+
+# input: a puzzle line
+# output: bytearray of the cell values, or None if the line is not a puzzle (wrong length or characters)
+def parse_cells(line):
+    length = len(line)
+    n = int(round(length ** 0.5))
+    if n * n != length or length == 0:
+        return None
+    cells = bytearray(line.translate(CHAR_TO_VALUE))
+    if 255 in cells or max(cells) > n:
+        return None
+    return cells
+
+# input: a bytearray (or list) of cell values
+# output: the puzzle line
+def format_cells(cells):
+    return str(bytearray(cells)).translate(VALUE_TO_CHAR)
+
+# input: a Compact_Sudoku_Board, a Sudoku_Board or a puzzle line
+# output: the puzzle line
+def format_board(board):
+    if isinstance(board, basestring):
+        return board
+    if hasattr(board, 'cells'):
+        return format_cells(board.cells)
+    return format_cells(bytearray(value for row in board.board for value in row))
+
+# input: a bytearray of cell values
+# output: str of the cells packed two per byte (4 bits each, the first cell in the high bits), 41 bytes for a
+#         9x9 board.  Values above 15 do not fit, boards of 16x16 and up keep one byte per cell.
+def pack_cells(cells):
+    if len(cells) >= 256:
+        return str(cells)
+    digits = str(cells).translate(VALUE_TO_HEX)
+    return binascii.unhexlify(digits + '0' if len(cells) % 2 else digits)
+
+# input: a str made by pack_cells and the number of cells
+# output: bytearray of the cell values
+def unpack_cells(data, count):
+    if count >= 256:
+        return bytearray(data)
+    return bytearray(binascii.hexlify(data).translate(HEX_TO_VALUE)[:count])
+
+# input: a path or an open file, and whether to read it through a memory map
+# output: generator of the raw lines of the file
+def iter_raw_lines(source, use_mmap = False):
+    if isinstance(source, basestring):
+        the_file = open(source, 'rb', BUFFER_SIZE)
+    else:
+        the_file = source
+    try:
+        if use_mmap and os.fstat(the_file.fileno()).st_size > 0:
+            mapped = mmap.mmap(the_file.fileno(), 0, access = mmap.ACCESS_READ)
+            try:
+                line = mapped.readline()
+                while line:
+                    yield line
+                    line = mapped.readline()
+            finally:
+                mapped.close()
+        else:
+            for line in the_file:
+                yield line
+    finally:
+        if the_file is not source:
+            the_file.close()
+
+# input: a path or an open file, and whether to read it through a memory map
+# output: generator of (puzzle line, cells, solution line or None), lines that are not puzzles are skipped
+def read_records(source, use_mmap = False):
+    for line in iter_raw_lines(source, use_mmap):
+        line = line.strip()
+        if not line or line[0] == '#':
+            continue
+        if ',' in line:
+            puzzle, solution = line.split(',', 1)
+        else:
+            fields = line.split(None, 1)
+            puzzle, solution = fields[0], (fields[1] if len(fields) > 1 else '')
+        cells = parse_cells(puzzle)
+        if cells is None:
+            continue # header or junk line
+        yield puzzle, cells, (solution.strip() or None)
+
+# input: a path or an open file, and whether to read it through a memory map
+# output: generator of (puzzle line, solution line or None)
+def read_lines(source, use_mmap = False):
+    for puzzle, cells, solution in read_records(source, use_mmap):
+        yield puzzle, solution
+
+# input: a path or an open file, whether to read it through a memory map and whether to yield solutions too
+# output: generator of Compact_Sudoku_Boards, or of (puzzle, solution or None) board pairs when with_solutions
+#         is True.  The cells of each board are the translated line itself, no list is built per puzzle.
+def read_puzzles(source, use_mmap = False, with_solutions = False):
+    sizes = {} # number of cells -> (board_size, block_size)
+    for puzzle, cells, solution in read_records(source, use_mmap):
+        if len(cells) not in sizes:
+            n = int(round(len(cells) ** 0.5))
+            sizes[len(cells)] = (n, int(round(n ** 0.5)))
+        board_size, block_size = sizes[len(cells)]
+        board = Compact_Sudoku_Board.from_cells(cells, board_size, block_size)
+        if with_solutions:
+            solved = None
+            if solution is not None and len(solution) == len(puzzle):
+                solution_cells = parse_cells(solution)
+                if solution_cells is not None:
+                    solved = Compact_Sudoku_Board.from_cells(solution_cells, board_size, block_size)
+            yield board, solved
+        else:
+            yield board
+
+# input: a path or an open file, and an iterable of boards / puzzle lines, or of (puzzle, solution) pairs
+#        (a solution of None is written as an empty column)
+# output: the number of lines written, items are consumed one at a time
+def write_puzzles(destination, items):
+    if isinstance(destination, basestring):
+        the_file = open(destination, 'wb', BUFFER_SIZE)
+    else:
+        the_file = destination
+    count = 0
+    try:
+        write = the_file.write
+        for item in items:
+            if isinstance(item, tuple):
+                puzzle, solution = item
+                line = format_board(puzzle) + ',' + ('' if solution is None else format_board(solution))
+            else:
+                line = format_board(item)
+            write(line + '\n')
+            count += 1
+    finally:
+        if the_file is not destination:
+            the_file.close()
+    return count
+
+# Program runs from here
+
+if __name__ == "__main__":
+    print "Running sudoku IO tests.\n"
+    TEST = True
+    if TEST:
+        test_count = 0
+        pass_count = 0
+        fail_count = 0
+        time_start = time.time()
+
+        def test_message(passed_test, message):
+            global pass_count
+            global fail_count
+            global test_count
+            test_count += 1
+            if passed_test:
+                print ">>> PASSED TEST: " + message + "\n"
+                pass_count += 1
+            else:
+                print "!!! FAILED TEST: " + message + " !!!\n"
+                fail_count += 1
+
+        boards = [Sudoku_Board.generate_random_board(random.randint(0, 81)) for x in xrange(50)]
+        path = tempfile.mktemp(suffix = '.txt')
+
+        # TEST: write then read back, buffered and memory mapped
+        m = 'write_puzzles() then read_puzzles() round trip'
+        test_result = write_puzzles(path, boards) == len(boards)
+        for use_mmap in (False, True):
+            read_back = list(read_puzzles(path, use_mmap = use_mmap))
+            test_result = test_result and len(read_back) == len(boards)
+            for board, compact in zip(boards, read_back):
+                test_result = test_result and compact.to_board().board == board.board
+                # candidates computed from the cells match those built with set()
+                test_result = test_result and compact.candidates == Compact_Sudoku_Board.from_board(board).candidates
+        test_message(test_result, m)
+
+        # TEST: header, comments, '0' blanks and a solution column
+        m = 'read_lines() skips headers and reads the solution column'
+        puzzle = '8..........36......7..9.2...5...7.......457.....1...3...1....68..85...1..9....4..'
+        solution = '812753649943682175675491283154237896369845721287169534521974368438526917796318452'
+        the_file = open(path, 'wb')
+        the_file.write('quizzes,solutions\n# a comment\n\n')
+        the_file.write(puzzle.replace('.', '0') + ',' + solution + '\n')
+        the_file.write(puzzle + '\t' + solution + '\n')
+        the_file.write(puzzle + '\n')
+        the_file.close()
+        lines = list(read_lines(path))
+        test_result = lines == [(puzzle.replace('.', '0'), solution), (puzzle, solution), (puzzle, None)]
+        pairs = list(read_puzzles(path, with_solutions = True))
+        test_result = test_result and [format_board(p) for p, s in pairs] == [puzzle] * 3
+        test_result = test_result and format_board(pairs[0][1]) == solution and pairs[2][1] is None
+        test_message(test_result, m)
+
+        # TEST: 16x16 puzzles use the letters after 9
+        m = '16x16 puzzle line'
+        line = '123456789ABCDEFG' + '.' * 240
+        board = list(read_puzzles([line + '\n']))[0]
+        test_result = board.board_size == 16 and board.block_size == 4 and board.get(0, 15) == 16
+        test_result = test_result and format_board(board) == line
+        test_message(test_result, m)
+
+        # TEST: packed cells
+        m = 'pack_cells() then unpack_cells() round trip'
+        test_result = True
+        for board in boards[:10]:
+            cells = bytearray(value for row in board.board for value in row)
+            packed = pack_cells(cells)
+            test_result = test_result and len(packed) == 41 and unpack_cells(packed, 81) == cells
+        cells = parse_cells(line)
+        test_result = test_result and unpack_cells(pack_cells(cells), 256) == cells
+        test_message(test_result, m)
+
+        os.remove(path)
+
+        # displays test result summary:
+        time_end = time.time()
+        print "ran a total of " + str(test_count) + " tests."
+        print "test runtime: " + str(time_end - time_start) + " seconds"
+        print "total tests passed: " + str(pass_count)
+        print "total tests failed: " + str(fail_count)
+        print "\n"
@@ -0,0 +1,356 @@
+import sys
+import time
+import random
+import collections
+import numpy
+import Sudoku_IO
+import Sudoku_Propagator
+from Sudoku_Board import Sudoku_Board
+
+# Vectorized operations on many boards at once with NumPy
+#
+# A batch is an integer array of shape (N, n, n) holding N boards of board_size n, 0 for an empty cell.
+# Every operation works on whole arrays, the only Python loop is over chunks of chunk_size boards, which
+# bounds the memory of the temporaries when N is in the millions.  solve_batch() propagates singles over a
+# (N, n * n, n) candidate array the same way, and only the boards it cannot finish go through the scalar search.
+
+CHUNK_SIZE = 1 << 16
+PROPAGATE_CHUNK_SIZE = 1 << 12 # propagation keeps a few (N, 3n, n, n) temporaries
+
+# status of a puzzle after solve_batch()
+NO_SOLUTION = -1
+OPEN = 0 # propagation alone did not finish it
+PROPAGATED = 1 # solved by propagation alone
+SEARCHED = 2 # solved by the scalar search
+
+# Result of validate(), every field is a boolean array:
+#   row_conflicts, col_conflicts, box_conflicts  (N, n)  True where the unit holds a digit twice
+#   bad_values                                   (N,)    True when a cell is below 0 or above n
+#   complete                                     (N,)    True when every cell holds a digit and nothing clashes
+class Batch_Validation(collections.namedtuple('Batch_Validation',
+                                              'row_conflicts col_conflicts box_conflicts bad_values complete')):
+    __slots__ = ()
+
+    # output: (N,) boolean array, True for the boards without a conflict (what Sudoku_Board.valid_board checks)
+    def valid(self):
+        return ~(self.row_conflicts.any(axis = 1) | self.col_conflicts.any(axis = 1) |
+                 self.box_conflicts.any(axis = 1) | self.bad_values)
+
+# input: board_size
+# output: block_size, the boards must be square with square sub blocks
+def block_size_of(board_size):
+    block_size = int(round(board_size ** 0.5))
+    assert block_size * block_size == board_size
+    return block_size
+
+# input: (N, n, n) array
+# output: (N, n, n) array of the same boards with the cells of each sub block laid out as a row
+def boxes_of(grids):
+    count, n = grids.shape[0], grids.shape[1]
+    bs = block_size_of(n)
+    return grids.reshape(count, bs, bs, bs, bs).transpose(0, 1, 3, 2, 4).reshape(count, n, n)
+
+# input: (N, n, n) array of bitmasks (bit v for digit v, 0 for a blank)
+# output: (N, n) boolean array, True where a row holds a bit twice: the bits of distinct digits add up to
+#         their or, a repeated digit makes the sum larger
+def repeated(bits):
+    return bits.sum(axis = 2) != numpy.bitwise_or.reduce(bits, axis = 2)
+
+# input: (N, n, n) integer array, the number of boards to check at once
+# output: Batch_Validation of the boards
+def validate(grids, chunk_size = CHUNK_SIZE):
+    grids = numpy.asarray(grids)
+    assert grids.ndim == 3 and grids.shape[1] == grids.shape[2]
+    count, n = grids.shape[0], grids.shape[1]
+    block_size_of(n)
+    rows = numpy.zeros((count, n), dtype = bool)
+    cols = numpy.zeros((count, n), dtype = bool)
+    boxes = numpy.zeros((count, n), dtype = bool)
+    bad = numpy.zeros(count, dtype = bool)
+    filled = numpy.zeros(count, dtype = bool)
+    for start in xrange(0, count, chunk_size):
+        chunk = grids[start:start + chunk_size].astype(numpy.int64)
+        in_range = (chunk >= 0) & (chunk <= n)
+        bits = numpy.where(in_range & (chunk > 0), numpy.left_shift(1, numpy.clip(chunk, 0, n)), 0)
+        stop = start + len(chunk)
+        rows[start:stop] = repeated(bits)
+        cols[start:stop] = repeated(bits.transpose(0, 2, 1))
+        boxes[start:stop] = repeated(boxes_of(bits))
+        bad[start:stop] = ~in_range.all(axis = (1, 2))
+        filled[start:stop] = (chunk > 0).all(axis = (1, 2))
+    complete = filled & ~(rows.any(axis = 1) | cols.any(axis = 1) | boxes.any(axis = 1) | bad)
+    return Batch_Validation(rows, cols, boxes, bad, complete)
+
+# input: an iterable of Sudoku_Boards, Compact_Sudoku_Boards or puzzle lines, all of the same size
+# output: (N, n, n) uint8 array of the boards
+def to_array(boards):
+    cells = bytearray()
+    count = 0
+    for board in boards:
+        if isinstance(board, basestring):
+            cells += Sudoku_IO.parse_cells(board.strip())
+        elif hasattr(board, 'cells'):
+            cells += board.cells
+        else:
+            cells += bytearray(value for row in board.board for value in row)
+        count += 1
+    if count == 0:
+        return numpy.zeros((0, 9, 9), dtype = numpy.uint8)
+    n = int(round((len(cells) / count) ** 0.5))
+    return numpy.frombuffer(bytes(cells), dtype = numpy.uint8).reshape(count, n, n).copy()
+
+# input: an iterable of puzzle lines, all of the same size
+# output: (N, n, n) uint8 array, the lines are translated as one string instead of line by line
+def lines_to_array(lines):
+    lines = [line.strip() for line in lines]
+    if not lines:
+        return numpy.zeros((0, 9, 9), dtype = numpy.uint8)
+    n = int(round(len(lines[0]) ** 0.5))
+    cells = numpy.frombuffer(''.join(lines).translate(Sudoku_IO.CHAR_TO_VALUE), dtype = numpy.uint8)
+    assert len(cells) == len(lines) * n * n and not (cells > n).any()
+    return cells.reshape(len(lines), n, n).copy()
+
+# input: (N, n, n) array
+# output: list of the puzzle lines of the boards
+def array_to_lines(grids):
+    grids = numpy.asarray(grids, dtype = numpy.uint8)
+    n = grids.shape[1]
+    text = grids.tostring().translate(Sudoku_IO.VALUE_TO_CHAR)
+    return [text[i:i + n * n] for i in xrange(0, len(text), n * n)]
+
+# input: (N, n, n) array
+# output: list of Sudoku_Boards holding the boards (with their givens found)
+def from_array(grids):
+    boards = []
+    for grid in numpy.asarray(grids).tolist():
+        board = Sudoku_Board(len(grid))
+        board.fill(grid)
+        if board.valid_board():
+            board.find_givens()
+        boards.append(board)
+    return boards
+
+# input: board_size
+# output: (units, cell_units) as arrays, units is (3n, n) of the cells of every row, col and sub block and
+#         cell_units is (n * n, 3) of the units of every cell (see Sudoku_Propagator.unit_tables)
+def unit_arrays(board_size):
+    units, units_of, peers = Sudoku_Propagator.unit_tables(board_size, block_size_of(board_size))
+    return numpy.array(units), numpy.array(units_of)
+
+# input: (N, n, n) array
+# output: (N, n * n, n) boolean array of the candidates, cand[k, i, v - 1] is True when digit v is still
+#         possible in cell i of board k.  A given has only its own digit.
+def candidates_of(grids):
+    grids = numpy.asarray(grids)
+    count, n = grids.shape[0], grids.shape[1]
+    flat = grids.reshape(count, n * n)
+    single = flat[:, :, None] == numpy.arange(1, n + 1)
+    return numpy.where((flat > 0)[:, :, None], single, True)
+
+# input: (N, n * n, n) candidates, changed in place, and the unit arrays of the board size
+# output: (N,) boolean array, True for the boards found to have no solution
+# Both rules are applied to every board of the batch at once, the boards that changed go around again until
+# none is left:
+#   naked singles   a digit that is the only candidate of a cell is removed from the cell's peers
+#   hidden singles  a digit that has only one possible cell in a unit is placed there
+def propagate_chunk(cand, units, cell_units):
+    dead = numpy.zeros(len(cand), dtype = bool)
+    active = numpy.arange(len(cand))
+    while active.size:
+        before = cand[active]
+        counts = before.sum(axis = 2)
+        single = counts == 1
+        # naked singles: digits held by a solved cell, per unit, are taken away from the open cells of the unit
+        placed = (before & single[:, :, None])[:, units].sum(axis = 2) # (A, 3n, n) solved cells per digit
+        bad = (counts == 0).any(axis = 1) | (placed > 1).any(axis = (1, 2))
+        taken = (placed > 0)[:, cell_units].any(axis = 2)
+        after = numpy.where(single[:, :, None], before, before & ~taken)
+        # hidden singles: a digit with one possible cell in a unit
+        holders = after[:, units].sum(axis = 2) # (A, 3n, n) cells per digit
+        bad |= (holders == 0).any(axis = (1, 2))
+        only = (holders == 1)[:, cell_units].any(axis = 2) & after
+        hidden = only.any(axis = 2)
+        bad |= (only.sum(axis = 2) > 1).any(axis = 1) # a cell that must hold two digits
+        after = numpy.where(hidden[:, :, None], only, after)
+        changed = (after != before).any(axis = (1, 2))
+        cand[active] = after
+        dead[active[bad]] = True
+        active = active[changed & ~bad]
+    return dead
+
+# input: (N, n, n) array of puzzles and the number of puzzles to propagate at once
+# output: (candidates, status) where candidates is the (N, n * n, n) array left by propagation and status
+#         is (N,) of NO_SOLUTION, OPEN or PROPAGATED
+def propagate_batch(grids, chunk_size = PROPAGATE_CHUNK_SIZE):
+    grids = numpy.asarray(grids)
+    count, n = grids.shape[0], grids.shape[1]
+    units, cell_units = unit_arrays(n)
+    cand = candidates_of(grids)
+    status = numpy.zeros(count, dtype = numpy.int8)
+    for start in xrange(0, count, chunk_size):
+        chunk = cand[start:start + chunk_size] # a view, propagated in place
+        dead = propagate_chunk(chunk, units, cell_units)
+        solved = (chunk.sum(axis = 2) == 1).all(axis = 1)
+        status[start:start + len(chunk)] = numpy.where(dead, NO_SOLUTION, numpy.where(solved, PROPAGATED, OPEN))
+    return cand, status
+
+# input: (N, n, n) array of puzzles and the number of puzzles to propagate at once
+# output: (solutions, status) where solutions is (N, n, n) uint8 (all 0 for a puzzle without a solution) and
+#         status is (N,) of NO_SOLUTION, PROPAGATED or SEARCHED.  The whole batch is propagated with array
+#         operations, only the puzzles left open are handed to Sudoku_Propagator one at a time.
+def solve_batch(grids, chunk_size = PROPAGATE_CHUNK_SIZE):
+    grids = numpy.asarray(grids)
+    count, n = grids.shape[0], grids.shape[1]
+    cand, status = propagate_batch(grids, chunk_size)
+    single = cand.sum(axis = 2) == 1
+    values = numpy.where(single, cand.argmax(axis = 2) + 1, 0).astype(numpy.uint8)
+    values[status == NO_SOLUTION] = 0
+    solutions = values.reshape(count, n, n)
+    for k in numpy.nonzero(status == OPEN)[0]:
+        result = Sudoku_Propagator.Propagator(n, block_size_of(n), solutions[k].tolist()).solve()
+        if result is None:
+            status[k] = NO_SOLUTION
+            solutions[k] = 0
+        else:
+            status[k] = SEARCHED
+            solutions[k] = numpy.array(result, dtype = numpy.uint8).reshape(n, n)
+    return solutions, status
+
+# Program runs from here
+
+if __name__ == "__main__":
+    print "Running sudoku numpy tests.\n"
+    TEST = True
+    if TEST:
+        import Sudoku_Benchmark
+        test_count = 0
+        pass_count = 0
+        fail_count = 0
+        time_start = time.time()
+
+        def test_message(passed_test, message):
+            global pass_count
+            global fail_count
+            global test_count
+            test_count += 1
+            if passed_test:
+                print ">>> PASSED TEST: " + message + "\n"
+                pass_count += 1
+            else:
+                print "!!! FAILED TEST: " + message + " !!!\n"
+                fail_count += 1
+
+        # TEST: the masks agree with valid_board() and is_complete() one board at a time
+        m = 'validate() agrees with Sudoku_Board.valid_board() and is_complete()'
+        boards = []
+        for x in xrange(300):
+            board = Sudoku_Board.generate_random_board(random.choice([0, 0, random.randint(0, 81)]))
+            for y in xrange(random.choice([0, 0, 1, 2])): # some boards get a random (possibly clashing) value
+                board.set(random.randint(0, 8), random.randint(0, 8), random.randint(0, 9))
+            boards.append(board)
+        grids = to_array(boards)
+        result = validate(grids, chunk_size = 64)
+        test_result = grids.shape == (300, 9, 9) and result.row_conflicts.shape == (300, 9)
+        test_result = test_result and list(result.valid()) == [board.valid_board() for board in boards]
+        test_result = test_result and list(result.complete) == [board.is_complete() for board in boards]
+        test_result = test_result and 0 < result.valid().sum() < 300 and 0 < result.complete.sum()
+        test_message(test_result, m)
+
+        m = 'validate() reports the unit that holds the duplicate'
+        grids = to_array([Sudoku_Board.generate_random_board(0) for x in xrange(3)])
+        grids[0, 4, 2] = grids[0, 4, 7] # the digit is now twice in row 4, col 2 and box 3
+        grids[1, 8, 8] = 0
+        grids[2, 0, 0] = 10
+        result = validate(grids)
+        test_result = list(result.row_conflicts[0].nonzero()[0]) == [4]
+        test_result = test_result and list(result.col_conflicts[0].nonzero()[0]) == [2]
+        test_result = test_result and list(result.box_conflicts[0].nonzero()[0]) == [3]
+        test_result = test_result and list(result.valid()) == [False, True, False]
+        test_result = test_result and list(result.complete) == [False, False, False]
+        test_result = test_result and list(result.bad_values) == [False, False, True]
+        test_message(test_result, m)
+
+        m = 'validate() handles 16x16 boards'
+        rng = random.Random(3)
+        grids = numpy.array([Sudoku_Benchmark.pattern_grid(16, 4, rng) for x in xrange(5)])
+        grids[1, 0, 0], grids[1, 0, 1] = grids[1, 0, 1], grids[1, 0, 0] # swapping breaks two cols
+        result = validate(grids)
+        test_result = list(result.complete) == [True, False, True, True, True]
+        test_result = test_result and sorted(result.col_conflicts[1].nonzero()[0]) == [0, 1]
+        test_message(test_result, m)
+
+        # TEST: conversions
+        m = 'to_array(), lines_to_array(), array_to_lines() and from_array() round trip'
+        boards = [Sudoku_Board.generate_random_board(random.randint(0, 81)) for x in xrange(20)]
+        lines = [Sudoku_IO.format_board(board) for board in boards]
+        grids = to_array(boards)
+        test_result = (lines_to_array(lines) == grids).all() and (to_array(lines) == grids).all()
+        test_result = test_result and array_to_lines(grids) == lines
+        test_result = test_result and [board.board for board in from_array(grids)] == [board.board for board in boards]
+        test_result = test_result and from_array(grids)[0].givens == boards[0].givens
+        test_message(test_result, m)
+
+        m = 'validate() checks 200000 boards without a loop per board'
+        grids = numpy.tile(to_array([Sudoku_Board.generate_random_board(0)]), (200000, 1, 1))
+        grids[12345, 3, 3] = grids[12345, 3, 4]
+        start = time.time()
+        result = validate(grids)
+        elapsed = time.time() - start
+        print 'validate(200000 boards): ' + str(elapsed) + ' seconds'
+        test_result = list((~result.valid()).nonzero()[0]) == [12345] and result.complete.sum() == 199999
+        test_message(test_result, m)
+
+        # TEST: batch propagation
+        m = 'solve_batch() solves easy puzzles by propagation and keeps the givens'
+        # 30 blanks taken from a full board, most of these fall to singles alone
+        easy = [Sudoku_IO.format_board(Sudoku_Board.generate_random_board(30)) for x in xrange(2000)]
+        lines = easy[:300]
+        grids = lines_to_array(lines)
+        solutions, status = solve_batch(grids, chunk_size = 128)
+        result = validate(solutions)
+        test_result = result.complete.all() and ((grids == 0) | (grids == solutions)).all()
+        test_result = test_result and (status == PROPAGATED).sum() > 150 and (status > 0).all()
+        print 'propagated: ' + str((status == PROPAGATED).sum()) + ', searched: ' + str((status == SEARCHED).sum())
+        test_message(test_result, m)
+
+        m = 'solve_batch() hands the hard puzzles to the search and finds contradictions'
+        lines = Sudoku_Benchmark.build_corpus('hard', 0, 6) + Sudoku_Benchmark.build_corpus('17clue', 0, 6)
+        no_value = '12345678.' + '.' * 8 + '9' + '.' * 63 # (0, 8) has no possible value
+        twice = '11' + '.' * 79
+        grids = lines_to_array(lines + [no_value, twice])
+        solutions, status = solve_batch(grids)
+        result = validate(solutions[:-2])
+        test_result = result.complete.all() and ((grids[:-2] == 0) | (grids[:-2] == solutions[:-2])).all()
+        test_result = test_result and (status[:6] == SEARCHED).all() and list(status[-2:]) == [NO_SOLUTION] * 2
+        test_result = test_result and not solutions[-2:].any()
+        test_message(test_result, m)
+
+        m = 'solve_batch() handles 16x16 puzzles'
+        lines = Sudoku_Benchmark.build_corpus('16x16', 0, 4)
+        grids = lines_to_array(lines)
+        solutions, status = solve_batch(grids)
+        test_result = validate(solutions).complete.all() and ((grids == 0) | (grids == solutions)).all()
+        test_message(test_result, m)
+
+        m = 'solve_batch() is faster than solving one puzzle at a time'
+        import Sudoku_Batch
+        grids = lines_to_array(easy)
+        start = time.time()
+        solutions, status = solve_batch(grids)
+        batch_time = time.time() - start
+        start = time.time()
+        scalar = [Sudoku_Batch.solve_line(line) for line in easy]
+        scalar_time = time.time() - start
+        print 'solve_batch(2000 easy puzzles): ' + str(batch_time) + ' seconds, one at a time: ' + str(scalar_time)
+        # puzzles with more than one solution may get a different one, compare validity instead
+        test_result = validate(solutions).complete.all() and ((grids == 0) | (grids == solutions)).all()
+        test_result = test_result and None not in scalar and batch_time * 2 < scalar_time
+        test_message(test_result, m)
+
+        # displays test result summary:
+        time_end = time.time()
+        print "ran a total of " + str(test_count) + " tests."
+        print "test runtime: " + str(time_end - time_start) + " seconds"
+        print "total tests passed: " + str(pass_count)
+        print "total tests failed: " + str(fail_count)
+        print "\n"
@@ -0,0 +1,291 @@
+import time
+import Queue
+import traceback
+import multiprocessing
+import Sudoku_Propagator
+import Sudoku_Stats
+
+# Parallel search of one puzzle
+#
+# The search tree is expanded breadth first from the root down to a frontier of subtrees, each one the path
+# of (cell, value) guesses from the root (see Sudoku_Propagator.Solution_Enumerator).  The subtrees are
+# handed to a pool of worker processes.  A worker searches its subtree for at most budget guesses, and if it
+# is not done by then it sends back what it found so far together with the frontier of what is left.  The
+# frontier is cut in two and both halves go back to the queue, the half holding the next path first, so an
+# idle worker takes over the other half.  Big subtrees are therefore split as they turn out to be big, and
+# no worker stays busy with a tree the others could share.  The queue is kept in this process as a stack, so
+# the search goes depth first like a single process would, and a worker is handed one subtree at a time, so
+# the pool never holds more tasks than it has workers.
+#
+#   first   stop at the first solution, the other workers are cancelled through a shared Cancel_Token
+#   count   the number of solutions of every subtree, added up (up to limit)
+#   all     every solution, in the order the subtrees finish
+
+MODES = ('first', 'count', 'all')
+
+cancel_token = None # the Cancel_Token of the run, set in every worker by init_worker
+
+# input: the Cancel_Token of the run
+# output: none, runs once in every worker process
+def init_worker(token):
+    global cancel_token
+    cancel_token = token
+
+# input: board_size, block_size, a 2d list of the board, the heuristic name and the least number of subtrees
+#        wanted, or the exact depth to expand to
+# output: (paths of the subtrees, solutions found above the frontier), subtrees that fail to propagate are
+#         left out
+def expand(board_size, block_size, grid, heuristic = 'mrv', subtrees = 1, depth = None):
+    enumerator = Sudoku_Propagator.Solution_Enumerator(board_size, block_size, grid,
+                                                       Sudoku_Propagator.HEURISTICS[heuristic]())
+    if not enumerator.consistent:
+        return [], []
+    propagator, select = enumerator.propagator, enumerator.heuristic
+    paths, solutions = [()], []
+    level = 0
+    while paths and (len(paths) < subtrees if depth is None else level < depth):
+        children = []
+        for path in paths:
+            if not enumerator.replay(path):
+                continue
+            i = select.select_cell(propagator)
+            if i < 0:
+                solutions.append(propagator.values[:])
+                continue
+            children.extend(path + ((i, value),) for value in select.order_values(propagator, i))
+        paths = children
+        level += 1
+    return paths, solutions
+
+# input: (board_size, block_size, grid, heuristic name, paths, mode, guesses allowed, solutions still wanted or 0)
+# output: (solutions (values lists, empty when counting), number found, frontier left or [], guesses made),
+#         runs inside a worker process
+def search_subtree(task):
+    board_size, block_size, grid, heuristic, paths, mode, budget, wanted = task
+    enumerator = Sudoku_Propagator.Solution_Enumerator(board_size, block_size, grid,
+                                                       Sudoku_Propagator.HEURISTICS[heuristic](), paths)
+    enumerator.limits = Sudoku_Stats.Search_Limits(max_nodes = budget, cancel = cancel_token)
+    solutions = []
+    for values in enumerator:
+        if mode != 'count':
+            solutions.append(values)
+        if mode == 'first' or (wanted and enumerator.found >= wanted):
+            break
+    left = enumerator.frontier() if enumerator.stopped == 'nodes' else []
+    return solutions, enumerator.found, left, enumerator.nodes
+
+# input: the task of search_subtree()
+# output: (its result, None), or (None, the traceback) if it raised.  Pool.apply_async in Python 2 has no
+#         error callback, so run() would otherwise wait for ever on a task that failed.
+def search_task(task):
+    try:
+        return search_subtree(task), None
+    except Exception:
+        return None, traceback.format_exc()
+
+# input: the frontier left by search_subtree(), the next path last
+# output: list of up to two path lists to queue, the one holding the next path first
+def split(left):
+    half = len(left) / 2
+    return [part for part in (left[half:], left[:half]) if part]
+
+# input: board_size, block_size, a 2d list of the board, the mode (see MODES), the number of worker processes
+#        (None for one per core, 1 to search in this process), the heuristic name, the depth to expand to
+#        (None to expand until there are 4 subtrees per worker), guesses a worker makes before giving back
+#        the rest of its subtree, and the solutions to stop at when counting or enumerating (0 for all)
+# output: generator of (solutions, number found, guesses made) as subtrees finish
+def run(board_size, block_size, grid, mode = 'first', workers = None, heuristic = 'mrv', depth = None,
+        budget = 2000, limit = 0):
+    assert mode in MODES
+    workers = workers or multiprocessing.cpu_count()
+    paths, solutions = expand(board_size, block_size, grid, heuristic, 4 * workers, depth)
+    if solutions:
+        yield solutions[:1] if mode == 'first' else solutions, len(solutions), 0
+    wanted = 1 if mode == 'first' else limit
+    found = len(solutions)
+    if not paths or (wanted and found >= wanted):
+        return
+    def task(path_list):
+        return (board_size, block_size, grid, heuristic, path_list, mode, budget, (wanted - found) if wanted else 0)
+    if workers == 1:
+        pending = [[list(path)] for path in reversed(paths)] # the next task last
+        while pending:
+            result_solutions, count, left, nodes = search_subtree(task(pending.pop()))
+            found += count
+            yield result_solutions, count, nodes
+            if wanted and found >= wanted:
+                return
+            pending.extend(reversed(split(left)))
+        return
+    token = Sudoku_Stats.Cancel_Token()
+    pool = multiprocessing.Pool(workers, init_worker, (token,))
+    results = Queue.Queue()
+    waiting = [[list(path)] for path in reversed(paths)] # subtrees no worker has taken yet, the next one last
+    try:
+        outstanding = 0
+        while waiting or outstanding:
+            while waiting and outstanding < workers:
+                pool.apply_async(search_task, (task(waiting.pop()),), callback = results.put)
+                outstanding += 1
+            result, error = results.get()
+            if error is not None:
+                raise RuntimeError('a subtree search failed in a worker:\n' + error)
+            result_solutions, count, left, nodes = result
+            outstanding -= 1
+            found += count
+            done = wanted and found >= wanted
+            if done:
+                token.cancel() # every worker stops at its next check, even if the caller stops here
+            yield result_solutions, count, nodes
+            if done:
+                return
+            waiting.extend(reversed(split(left))) # the rest of a big subtree, for any idle worker to take
+    finally:
+        # terminate() can deadlock in Python 2 while tasks are still being sent to the workers, so the
+        # workers are cancelled and left to return instead
+        token.cancel()
+        pool.close()
+        pool.join()
+
+# input: board_size, block_size, a 2d list of the board and the options of run()
+# output: the values of a solution (list, cell order), or None if there is none
+def solve_parallel(board_size, block_size, grid, workers = None, heuristic = 'mrv', depth = None, budget = 2000):
+    for solutions, count, nodes in run(board_size, block_size, grid, 'first', workers, heuristic, depth, budget):
+        if solutions:
+            return solutions[0]
+    return None
+
+# input: board_size, block_size, a 2d list of the board, the number to stop at (0 to count them all) and the
+#        options of run()
+# output: the number of solutions, at most limit
+def count_parallel(board_size, block_size, grid, limit = 0, workers = None, heuristic = 'mrv', depth = None,
+                   budget = 2000):
+    total = 0
+    for solutions, count, nodes in run(board_size, block_size, grid, 'count', workers, heuristic, depth, budget,
+                                       limit):
+        total += count
+    return min(total, limit) if limit else total
+
+# input: board_size, block_size, a 2d list of the board, the number to stop at (0 for all) and the options
+#        of run()
+# output: generator of the values of the solutions, in the order the subtrees finish
+def iter_parallel(board_size, block_size, grid, limit = 0, workers = None, heuristic = 'mrv', depth = None,
+                  budget = 2000):
+    returned = 0
+    for solutions, count, nodes in run(board_size, block_size, grid, 'all', workers, heuristic, depth, budget,
+                                       limit):
+        for values in solutions:
+            if limit and returned >= limit:
+                return
+            returned += 1
+            yield values
+
+# Program runs from here
+
+if __name__ == "__main__":
+    TEST = True
+    if TEST:
+        import Sudoku_IO
+        from Sudoku_Board import Sudoku_Board
+        test_count = 0
+        pass_count = 0
+        fail_count = 0
+        time_start = time.time()
+
+        def test_message(passed_test, message):
+            global pass_count
+            global fail_count
+            global test_count
+            test_count += 1
+            if passed_test:
+                print ">>> PASSED TEST: " + message + "\n"
+                pass_count += 1
+            else:
+                print "!!! FAILED TEST: " + message + " !!!\n"
+                fail_count += 1
+
+        # output: 2d list of the board of a puzzle line
+        def to_grid(line):
+            cells = Sudoku_IO.parse_cells(line)
+            n = int(round(len(cells) ** 0.5))
+            return [list(cells[row * n:(row + 1) * n]) for row in xrange(n)]
+
+        print "TESTING PARALLEL SEARCH\n"
+        hard = ['8..........36......7..9.2...5...7.......457.....1...3...1....68..85...1..9....4..',
+                '1....7.9..3..2...8..96..5....53..9...1..8...26....4...3......1..4......7..7...3..',
+                '1.......2.9.4...5...6...7...5.9.3.......7.......85..4.7.....6...3...9.8...2.....1']
+        for workers in (1, 2):
+            m = 'solve_parallel(workers = ' + str(workers) + ') of hard puzzles'
+            test_result = True
+            for line in hard:
+                expected = Sudoku_Propagator.Propagator(9, 3, to_grid(line)).solve()
+                test_result = test_result and solve_parallel(9, 3, to_grid(line), workers, budget = 50) == expected
+            test_message(test_result, m)
+
+        # a board with a few hundred solutions
+        count = 0
+        while not 300 < count < 3000:
+            board = Sudoku_Board.generate_random_board(55)
+            count = board.count_solutions(3000)
+        expected = set(tuple(values) for values in Sudoku_Propagator.Solution_Enumerator(9, 3, board.board))
+        for workers, depth in ((1, None), (2, None), (2, 0), (3, 4)):
+            m = 'count_parallel() and iter_parallel() merge every subtree (workers = ' + str(workers) + \
+                ', depth = ' + str(depth) + ')'
+            test_result = count_parallel(9, 3, board.board, 0, workers, depth = depth, budget = 100) == count
+            test_result = test_result and count_parallel(9, 3, board.board, 100, workers, depth = depth, budget = 100) == 100
+            found = list(iter_parallel(9, 3, board.board, 0, workers, depth = depth, budget = 100))
+            test_result = test_result and len(found) == count and set(tuple(values) for values in found) == expected
+            test_result = test_result and len(list(iter_parallel(9, 3, board.board, 10, workers, depth = depth))) == 10
+            test_message(test_result, m)
+
+        m = 'a subtree search that raises in a worker is raised by run()'
+        searcher = search_subtree
+        def search_subtree(task): # the workers are forked after this, they see it too
+            raise ValueError('broken subtree')
+        try:
+            count_parallel(9, 3, board.board, 0, 2)
+            test_result = False
+        except RuntimeError as error:
+            test_result = 'broken subtree' in str(error)
+        search_subtree = searcher
+        test_result = test_result and count_parallel(9, 3, board.board, 0, 2) == count
+        test_message(test_result, m)
+
+        m = 'no solution'
+        grid = to_grid('12345678.' + '.' * 8 + '9' + '.' * 63) # (0, 8) has no possible value
+        test_result = solve_parallel(9, 3, grid, 2) is None and count_parallel(9, 3, grid, 0, 2) == 0
+        test_message(test_result, m)
+
+        m = 'the first solution of an empty 16x16 board stops every worker'
+        start = time.time()
+        values = solve_parallel(16, 4, [[0] * 16 for row in xrange(16)], 2, budget = 100)
+        board = Sudoku_Board(16)
+        board.fill([values[row * 16:(row + 1) * 16] for row in xrange(16)])
+        print 'solved in ' + str(time.time() - start) + ' seconds'
+        test_result = board.is_complete()
+        test_message(test_result, m)
+
+        m = 'solve_parallel() returns and stops its pool every time'
+        test_result = True
+        empty = [[0] * 16 for row in xrange(16)]
+        for x in xrange(30):
+            values = solve_parallel(16, 4, empty, 2, budget = 100)
+            test_result = test_result and values is not None and 0 not in values
+        test_result = test_result and not multiprocessing.active_children()
+        test_message(test_result, m)
+
+        m = 'Sudoku_Board.solve_board_parallel() and count_solutions(workers = 2)'
+        board = Sudoku_Board()
+        board.fill(to_grid(hard[0]))
+        solution = board.solve_board_parallel(2)
+        test_result = solution is not None and solution.is_complete() and solution.board == board.solve_board('dlx').board
+        test_result = test_result and board.count_solutions(2, workers = 2) == 1
+        test_message(test_result, m)
+
+        # displays test result summary:
+        time_end = time.time()
+        print "ran a total of " + str(test_count) + " tests."
+        print "test runtime: " + str(time_end - time_start) + " seconds"
+        print "total tests passed: " + str(pass_count)
+        print "total tests failed: " + str(fail_count)
+        print "\n"
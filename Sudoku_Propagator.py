@@ -0,0 +1,620 @@
+# Event driven constraint propagation for sudoku boards of any size
+#
+# Cells are numbered row * board_size + col and units follow the Sudoku_Board layout: rows are
+# 0 .. n-1, cols are n .. 2n-1 and sub blocks are 2n .. 3n-1.  Candidates are digit bitmasks
+# (bit v set when v is still possible).  Nothing is rescanned: placing a digit queues the cell so
+# the digit is removed from its peers only, and a unit is only re-examined (hidden singles, pairs,
+# pointing / claiming) after one of its cells lost a candidate.  Every change is written to an undo
+# trail so a search can take back a failed guess with undo(mark).
+
+import random
+
+ALL_TECHNIQUES = ('hidden_singles', 'naked_pairs', 'hidden_pairs', 'pointing')
+
+unit_table = {} # (board_size, block_size) -> (units, units_of, peers), shared by every propagator
+
+# input: board_size and block_size
+# output: (units, units_of, peers) where units[u] is a tuple of the cells in unit u, units_of[i] is
+#         (row, col, sub block) unit of cell i and peers[i] the cells sharing a unit with i
+def unit_tables(board_size, block_size):
+    key = (board_size, block_size)
+    if key not in unit_table:
+        n = board_size
+        units = [()] * (3 * n)
+        for r in xrange(n):
+            units[r] = tuple(r * n + c for c in xrange(n))
+            units[n + r] = tuple(c * n + r for c in xrange(n))
+        for b in xrange(n):
+            start_row = (b / block_size) * block_size
+            start_col = (b % block_size) * block_size
+            units[2 * n + b] = tuple(r * n + c for r in xrange(start_row, start_row + block_size)
+                                     for c in xrange(start_col, start_col + block_size))
+        units_of = []
+        peers = []
+        for i in xrange(n * n):
+            row, col = divmod(i, n)
+            block = (row / block_size) * block_size + col / block_size
+            units_of.append((row, n + col, 2 * n + block))
+            cells = set(units[row]) | set(units[n + col]) | set(units[2 * n + block])
+            cells.discard(i)
+            peers.append(tuple(sorted(cells)))
+        unit_table[key] = (tuple(units), tuple(units_of), tuple(peers))
+    return unit_table[key]
+
+class Propagator(object):
+    # input: board_size, block_size, a 2d list of the board (0 for an empty cell) and the techniques
+    #        to apply besides naked singles (see ALL_TECHNIQUES)
+    # output: a propagator with the givens assigned, call propagate() to run it
+    def __init__(self, board_size, block_size, grid, techniques = ALL_TECHNIQUES):
+        n = board_size
+        self.board_size = n
+        self.block_size = block_size
+        self.full = (1 << (n + 1)) - 2 # bits 1 .. board_size
+        self.units, self.units_of, self.peers = unit_tables(n, block_size)
+        self.hidden_singles = 'hidden_singles' in techniques
+        self.naked_pairs = 'naked_pairs' in techniques
+        self.hidden_pairs = 'hidden_pairs' in techniques
+        self.pointing = 'pointing' in techniques
+        self.values = [0] * (n * n)
+        self.cands = [self.full] * (n * n)
+        self.trail = [] # undo log of (cell, old candidates, old value) triples
+        self.queue = [] # cells whose value still has to be removed from their peers
+        self.dirty = [] # units that lost a candidate since they were last examined
+        self.is_dirty = [False] * (3 * n)
+        self.contradiction = None # cell found with no candidates, or None
+        self.nodes = 0 # guesses made by solve()
+        self.backtracks = 0 # guesses taken back by solve()
+        self.max_depth = 0 # deepest number of guesses on the board at once
+        self.steps = 0 # propagation steps: cells pushed to their peers and units examined
+        self.node_limit = 0 # guesses allowed before a restart, 0 for no limit
+        self.aborted = False # True when the search stopped at the node limit
+        self.limits = None # Sudoku_Stats.Search_Limits asked before every guess, or None
+        self.stopped = None # the reason the limits gave when they stopped the search
+        for row in xrange(n):
+            for col in xrange(n):
+                if grid[row][col] != 0:
+                    self.assign(row * n + col, grid[row][col]) # clashing givens are caught by propagate()
+        for u in xrange(3 * n):
+            self.touch(u)
+
+    # output: a mark (int) of the current trail position to later pass to undo()
+    def mark(self):
+        return len(self.trail)
+
+    # input: a mark returned by mark()
+    # output: none, but will restore every cell changed since the mark and drop pending work
+    def undo(self, mark):
+        trail, cands, values = self.trail, self.cands, self.values
+        while len(trail) > mark:
+            value = trail.pop()
+            cand = trail.pop()
+            i = trail.pop()
+            cands[i] = cand
+            values[i] = value
+        del self.queue[:]
+        for u in self.dirty:
+            self.is_dirty[u] = False
+        del self.dirty[:]
+        self.contradiction = None
+
+    # input: a unit
+    # output: none, but will queue the unit to be examined
+    def touch(self, u):
+        if not self.is_dirty[u]:
+            self.is_dirty[u] = True
+            self.dirty.append(u)
+
+    # input: a cell and a digit
+    # output: False if value is not a candidate of cell i, otherwise True and the cell is queued
+    def assign(self, i, value):
+        bit = 1 << value
+        cand = self.cands[i]
+        if not cand & bit:
+            return False
+        if self.values[i] == value:
+            return True
+        self.trail.append(i)
+        self.trail.append(cand)
+        self.trail.append(self.values[i])
+        self.cands[i] = bit
+        self.values[i] = value
+        self.queue.append(i)
+        if cand != bit:
+            for u in self.units_of[i]:
+                self.touch(u)
+        return True
+
+    # input: a cell and a mask of digits
+    # output: False if removing the digits leaves cell i with no candidates, otherwise True
+    def eliminate(self, i, mask):
+        cand = self.cands[i]
+        if not cand & mask:
+            return True
+        new = cand & ~mask
+        if new == 0:
+            self.contradiction = i
+            return False
+        self.trail.append(i)
+        self.trail.append(cand)
+        self.trail.append(self.values[i])
+        self.cands[i] = new
+        if self.values[i] == 0 and not new & (new - 1): # naked single
+            self.values[i] = new.bit_length() - 1
+            self.queue.append(i)
+        for u in self.units_of[i]:
+            self.touch(u)
+        return True
+
+    # output: True when nothing is left to deduce, False as soon as a contradiction is found
+    def propagate(self):
+        queue, dirty = self.queue, self.dirty
+        cands, peers = self.cands, self.peers
+        while queue or dirty:
+            while queue:
+                self.steps += 1
+                i = queue.pop()
+                bit = cands[i]
+                for p in peers[i]:
+                    if cands[p] & bit and not self.eliminate(p, bit):
+                        return False
+            if dirty:
+                self.steps += 1
+                u = dirty.pop()
+                self.is_dirty[u] = False
+                if not self.check_unit(u):
+                    return False
+        return True
+
+    # input: a unit
+    # output: False if the unit can no longer be completed, otherwise True after applying the unit techniques
+    def check_unit(self, u):
+        cands, values = self.cands, self.values
+        cells = self.units[u]
+        once = twice = placed = 0
+        for c in cells:
+            m = cands[c]
+            twice |= once & m
+            once |= m
+            if values[c]:
+                placed |= m
+        if once != self.full:
+            self.contradiction = cells[0] # a digit has no place left in this unit
+            return False
+        if self.hidden_singles:
+            singles = once & ~twice & ~placed
+            while singles:
+                bit = singles & -singles
+                singles ^= bit
+                for c in cells:
+                    if cands[c] & bit:
+                        if not self.assign(c, bit.bit_length() - 1):
+                            return False
+                        break
+        if self.naked_pairs and not self.check_naked_pairs(cells):
+            return False
+        if self.hidden_pairs and not self.check_hidden_pairs(cells):
+            return False
+        if self.pointing and not self.check_pointing(u, once & ~placed):
+            return False
+        return True
+
+    # two open cells of a unit with the same two candidates take those digits from the rest of the unit
+    def check_naked_pairs(self, cells):
+        cands, values = self.cands, self.values
+        for a in xrange(len(cells)):
+            m = cands[cells[a]]
+            rest = m & (m - 1)
+            if values[cells[a]] or not rest or rest & (rest - 1):
+                continue # not exactly two candidates
+            for b in xrange(a + 1, len(cells)):
+                if cands[cells[b]] == m and not values[cells[b]]:
+                    for c in cells:
+                        if c != cells[a] and c != cells[b] and not values[c] and cands[c] & m:
+                            if not self.eliminate(c, m):
+                                return False
+                    break
+        return True
+
+    # two digits that can only go in the same two cells of a unit take every other candidate from those cells
+    def check_hidden_pairs(self, cells):
+        cands = self.cands
+        # digit -> bitmask of positions in the unit.  Assigned cells are counted too: a value placed by this
+        # round is not removed from its peers yet, so leaving it out would undercount the positions of a digit.
+        where = [0] * (self.board_size + 1)
+        for pos in xrange(len(cells)):
+            m = cands[cells[pos]]
+            while m:
+                bit = m & -m
+                m ^= bit
+                where[bit.bit_length() - 1] |= 1 << pos
+        for d1 in xrange(1, self.board_size + 1):
+            positions = where[d1]
+            rest = positions & (positions - 1)
+            if not rest or rest & (rest - 1):
+                continue # not exactly two positions
+            for d2 in xrange(d1 + 1, self.board_size + 1):
+                if where[d2] == positions:
+                    pair = (1 << d1) | (1 << d2)
+                    for pos in ((positions & -positions).bit_length() - 1, rest.bit_length() - 1):
+                        if not self.eliminate(cells[pos], cands[cells[pos]] & ~pair):
+                            return False
+                    break
+        return True
+
+    # pointing: a digit confined to one row / col inside a sub block is removed from the rest of that row / col
+    # claiming: a digit confined to one sub block inside a row / col is removed from the rest of that sub block
+    def check_pointing(self, u, open_digits):
+        n = self.board_size
+        cands, units_of = self.cands, self.units_of
+        cells = self.units[u]
+        while open_digits:
+            bit = open_digits & -open_digits
+            open_digits ^= bit
+            first = -1
+            same = [True, True, True] # all cells holding bit share this row / col / sub block
+            for c in cells:
+                if cands[c] & bit: # assigned cells count, see check_hidden_pairs
+                    if first < 0:
+                        first = c
+                    else:
+                        for k in xrange(3):
+                            if units_of[c][k] != units_of[first][k]:
+                                same[k] = False
+            if first < 0:
+                continue
+            if u >= 2 * n: # pointing, u is a sub block
+                for k in (0, 1):
+                    if same[k] and not self.eliminate_outside(units_of[first][k], 2, u, bit):
+                        return False
+            elif same[2]: # claiming, u is a row or a col
+                if not self.eliminate_outside(units_of[first][2], 0 if u < n else 1, u, bit):
+                    return False
+        return True
+
+    # input: a target unit, which of a cell's units (0 row, 1 col, 2 sub block) to compare with u, and a digit bit
+    # output: False on a contradiction, otherwise True after removing bit from the open cells of target outside u
+    def eliminate_outside(self, target, k, u, bit):
+        cands, values, units_of = self.cands, self.values, self.units_of
+        for c in self.units[target]:
+            if units_of[c][k] != u and not values[c] and cands[c] & bit:
+                if not self.eliminate(c, bit):
+                    return False
+        return True
+
+    # output: True if the board is complete, all cells have a value
+    def is_complete(self):
+        return 0 not in self.values
+
+    # input: a heuristic (see HEURISTICS), MRV_Heuristic when None
+    # output: the values of the solved board (list, cell order) or None if it cannot be solved or self.limits
+    #         stopped the search (self.stopped then holds the reason)
+    # The heuristic picks the cell to guess at every node from the current state, and each guess is
+    # propagated before going deeper so a dead end is found as soon as possible.  self.nodes counts the
+    # guesses made.
+    def solve(self, heuristic = None):
+        if heuristic is None:
+            heuristic = MRV_Heuristic()
+        self.nodes = 0
+        self.backtracks = 0
+        self.max_depth = 0
+        if not self.propagate():
+            return None
+        root = self.mark()
+        for limit in heuristic.restart_limits():
+            self.node_limit = self.nodes + limit if limit else 0
+            self.aborted = False
+            if self.search(heuristic, 0):
+                return self.values[:]
+            if not self.aborted or self.stopped is not None:
+                return None # the whole tree was searched, or the limits stopped the search
+            self.undo(root) # node limit reached, restart
+        return None
+
+    # input: the number of solutions to stop at (0 to count them all) and the heuristic to guess with
+    # output: the number of solutions, at most limit.  Every guess is propagated and the search stops as soon
+    #         as limit solutions are found, so telling a unique puzzle from one with many costs about one solve.
+    def count_solutions(self, limit = 2, heuristic = None):
+        if heuristic is None:
+            heuristic = MRV_Heuristic()
+        self.nodes = 0
+        self.backtracks = 0
+        self.max_depth = 0
+        self.node_limit = 0
+        if not self.propagate():
+            return 0
+        return self.count_search(heuristic, limit, 0)
+
+    def count_search(self, heuristic, limit, depth):
+        i = heuristic.select_cell(self)
+        if i < 0:
+            return 1
+        depth += 1
+        if depth > self.max_depth:
+            self.max_depth = depth
+        count = 0
+        for value in heuristic.order_values(self, i):
+            self.nodes += 1
+            mark = self.mark()
+            if self.assign(i, value) and self.propagate():
+                count += self.count_search(heuristic, limit - count if limit else 0, depth)
+            self.backtracks += 1
+            self.undo(mark)
+            if limit and count >= limit:
+                break
+        return count
+
+    def search(self, heuristic, depth):
+        i = heuristic.select_cell(self)
+        if i < 0:
+            return True # every cell has a value
+        depth += 1
+        if depth > self.max_depth:
+            self.max_depth = depth
+        limits = self.limits
+        for value in heuristic.order_values(self, i):
+            if self.node_limit and self.nodes >= self.node_limit:
+                self.aborted = True
+                return False
+            if limits is not None and limits.exceeded(self.nodes):
+                self.stopped = limits.reason
+                self.aborted = True
+                return False
+            self.nodes += 1
+            mark = self.mark()
+            if self.assign(i, value) and self.propagate() and self.search(heuristic, depth):
+                return True
+            self.backtracks += 1
+            self.undo(mark)
+            if self.aborted:
+                return False
+        return False
+
+# Lazy enumeration of every solution with an explicit stack instead of recursion
+#
+# The work left is a list of subproblems, each one the path of (cell, value) guesses from the root.  A
+# subproblem is replayed on the propagator and searched depth first, every frame of the stack holding the
+# cell guessed at that depth, the values still to try and the trail mark to undo to.  Stopping between two
+# solutions costs nothing, and frontier() turns the stack back into subproblems, so a checkpoint can be
+# written as json and continued by another enumerator, in another process or much later.
+class Solution_Enumerator(object):
+    # input: board_size, block_size, a 2d list of the board, the heuristic to guess with (MRV_Heuristic when
+    #        None) and the subproblems to search (the whole board when None), as given by frontier()
+    # output: an iterator of the values of every solution (lists, cell order)
+    def __init__(self, board_size, block_size, grid, heuristic = None, frontier = None):
+        self.grid = [list(row) for row in grid]
+        self.heuristic = heuristic if heuristic is not None else MRV_Heuristic()
+        self.propagator = Propagator(board_size, block_size, self.grid)
+        self.consistent = self.propagator.propagate()
+        self.root = self.propagator.mark()
+        self.pending = [()] if frontier is None else [tuple(tuple(guess) for guess in path) for path in frontier]
+        self.stack = [] # frames of [cell, values left to try, trail mark, depth]
+        self.path = [] # the guesses on the board
+        self.limits = None # Sudoku_Stats.Search_Limits asked before every guess, or None
+        self.stopped = None # the reason the limits gave when they stopped the enumeration
+        self.nodes = 0 # guesses made
+        self.found = 0 # solutions returned
+
+    def __iter__(self):
+        return self
+
+    # input: a path of guesses
+    # output: True if replaying the guesses from the root leaves no contradiction
+    def replay(self, path):
+        propagator = self.propagator
+        propagator.undo(self.root)
+        for i, value in path:
+            if not (propagator.assign(i, value) and propagator.propagate()):
+                return False
+        return True
+
+    # input: a state with no contradiction
+    # output: True if the board is solved, otherwise False after pushing a frame for the next cell to guess
+    def push_frame(self):
+        propagator = self.propagator
+        i = self.heuristic.select_cell(propagator)
+        if i < 0:
+            return True
+        self.stack.append([i, list(self.heuristic.order_values(propagator, i)), propagator.mark(), len(self.path)])
+        return False
+
+    # output: the values of the next solution, StopIteration when there are none left or self.limits stopped
+    #         the enumeration (self.stopped then holds the reason, and frontier() still holds the work left)
+    def next(self):
+        propagator, stack, path = self.propagator, self.stack, self.path
+        while self.consistent:
+            if not stack:
+                if not self.pending:
+                    break
+                path[:] = self.pending.pop()
+                if path:
+                    self.nodes += 1 # the last guess of a path left to search has not been tried yet
+                if self.replay(path) and self.push_frame():
+                    self.found += 1
+                    return propagator.values[:]
+                continue
+            frame = stack[-1]
+            i, options, mark, depth = frame
+            propagator.undo(mark) # take back the last value tried here
+            del path[depth:]
+            if not options:
+                stack.pop()
+                continue
+            if self.limits is not None and self.limits.exceeded(self.nodes):
+                self.stopped = self.limits.reason
+                break
+            value = options.pop(0)
+            self.nodes += 1
+            path.append((i, value))
+            if propagator.assign(i, value) and propagator.propagate() and self.push_frame():
+                self.found += 1
+                return propagator.values[:]
+        raise StopIteration
+
+    # output: list of the paths of guesses (lists of [cell, value]) still to search, the next one last
+    def frontier(self):
+        paths = [list(path) for path in self.pending]
+        for i, options, mark, depth in self.stack:
+            for value in reversed(options):
+                paths.append(self.path[:depth] + [(i, value)])
+        return [[[i, value] for i, value in path] for path in paths]
+
+    # output: dict of everything needed to carry on later, it can be dumped as json
+    def checkpoint(self):
+        n = self.propagator.board_size
+        return {'board_size': n, 'block_size': self.propagator.block_size, 'grid': self.grid,
+                'heuristic': self.heuristic.name, 'heuristic_state': self.heuristic.state(),
+                'frontier': self.frontier(), 'nodes': self.nodes, 'found': self.found}
+
+    # input: a dict made by checkpoint()
+    # output: an enumerator that carries on with the work left, the counters and the state of the heuristic
+    #         included, so it takes the same path as one that was never stopped
+    @staticmethod
+    def from_checkpoint(data):
+        heuristic = HEURISTICS[data['heuristic']]()
+        heuristic.set_state(data.get('heuristic_state'))
+        enumerator = Solution_Enumerator(data['board_size'], data['block_size'], data['grid'], heuristic,
+                                         data['frontier'])
+        enumerator.nodes = data['nodes']
+        enumerator.found = data['found']
+        return enumerator
+
+# input: a bitmask
+# output: number of bits set
+def count_bits(mask):
+    return bin(mask).count('1')
+
+# input: a bitmask
+# output: list of the digits set in the mask, lowest first
+def digits_of(mask):
+    digits = []
+    while mask:
+        bit = mask & -mask
+        mask ^= bit
+        digits.append(bit.bit_length() - 1)
+    return digits
+
+# Search heuristics for Propagator.solve().  A heuristic picks which open cell to guess next
+# (select_cell), the order to try its candidates in (order_values) and how many guesses a run may
+# take before the search restarts from the root (restart_limits, 0 = no limit).  state() and
+# set_state() carry what a heuristic has to remember between guesses through a json checkpoint.
+
+class MRV_Heuristic(object):
+    name = 'mrv'
+
+    def restart_limits(self):
+        return (0,)
+
+    # output: what the heuristic needs to go on as it would have (json compatible), None when it keeps nothing
+    def state(self):
+        return None
+
+    # input: a value returned by state()
+    def set_state(self, state):
+        pass
+
+    # minimum remaining values: the open cell with the fewest candidates, -1 when every cell has a value
+    def select_cell(self, propagator):
+        values, cands = propagator.values, propagator.cands
+        best = -1
+        best_count = propagator.board_size + 1
+        for i in xrange(len(values)):
+            if not values[i]:
+                count = count_bits(cands[i])
+                if count < best_count:
+                    best = i
+                    best_count = count
+                    if count <= 2:
+                        break # open cells always have at least 2 candidates
+        return best
+
+    def order_values(self, propagator, i):
+        return digits_of(propagator.cands[i])
+
+    # output: list of the open cells that have the fewest candidates
+    def most_constrained(self, propagator):
+        values, cands = propagator.values, propagator.cands
+        cells = []
+        best_count = propagator.board_size + 1
+        for i in xrange(len(values)):
+            if not values[i]:
+                count = count_bits(cands[i])
+                if count < best_count:
+                    cells = [i]
+                    best_count = count
+                elif count == best_count:
+                    cells.append(i)
+        return cells
+
+class MRV_Degree_Heuristic(MRV_Heuristic):
+    name = 'mrv_degree'
+
+    # ties on the fewest candidates go to the cell with the most open peers
+    def select_cell(self, propagator):
+        values, peers = propagator.values, propagator.peers
+        best = -1
+        best_degree = -1
+        for i in self.most_constrained(propagator):
+            degree = 0
+            for p in peers[i]:
+                if not values[p]:
+                    degree += 1
+            if degree > best_degree:
+                best = i
+                best_degree = degree
+        return best
+
+class LCV_Heuristic(MRV_Heuristic):
+    name = 'lcv'
+
+    # least constraining value: try first the digits that the fewest open peers would lose
+    def order_values(self, propagator, i):
+        values, cands = propagator.values, propagator.cands
+        open_peers = [p for p in propagator.peers[i] if not values[p]]
+        scored = []
+        for value in digits_of(cands[i]):
+            bit = 1 << value
+            scored.append((sum(1 for p in open_peers if cands[p] & bit), value))
+        scored.sort()
+        return [value for score, value in scored]
+
+class Random_Restart_Heuristic(MRV_Heuristic):
+    name = 'random_restarts'
+
+    # input: seed for the random tie breaks, guesses allowed in the first run and the growth of that limit
+    #        for every following run (the limit keeps growing, so the search is still complete)
+    def __init__(self, seed = 0, first_limit = 50, growth = 2):
+        self.random = random.Random(seed)
+        self.first_limit = first_limit
+        self.growth = growth
+
+    def restart_limits(self):
+        limit = self.first_limit
+        while True:
+            yield limit
+            limit *= self.growth
+
+    def state(self):
+        version, internal, gauss = self.random.getstate()
+        return {'random': [version, list(internal), gauss], 'first_limit': self.first_limit,
+                'growth': self.growth}
+
+    def set_state(self, state):
+        if state is not None:
+            version, internal, gauss = state['random']
+            self.random.setstate((version, tuple(internal), gauss)) # json gives lists back
+            self.first_limit = state['first_limit']
+            self.growth = state['growth']
+
+    def select_cell(self, propagator):
+        cells = self.most_constrained(propagator)
+        if not cells:
+            return -1
+        return self.random.choice(cells)
+
+    def order_values(self, propagator, i):
+        digits = digits_of(propagator.cands[i])
+        self.random.shuffle(digits)
+        return digits
+
+HEURISTICS = {'mrv': MRV_Heuristic, 'mrv_degree': MRV_Degree_Heuristic, 'lcv': LCV_Heuristic,
+              'random_restarts': Random_Restart_Heuristic}
@@ -0,0 +1,601 @@
+import os
+import sys
+import json
+import time
+import Queue
+import socket
+import traceback
+import threading
+import collections
+import SocketServer
+import multiprocessing
+import Sudoku_IO
+import Sudoku_Batch
+import Sudoku_Stats
+
+# Local solving service speaking JSON lines over TCP or a Unix socket
+#
+#   request    {"id": 7, "puzzle": "8..........36....", "timeout": 2.5}     timeout (seconds) is optional
+#              {"id": 8, "stats": true}                                    the counters of the service
+#   response   {"id": 7, "status": "solved", "solution": "812753649..."}
+#
+# A status is one of STATUSES, "error" when the worker solving the batch of the request failed.  A request
+# whose puzzle is not a puzzle line or whose timeout is not a number of seconds is "invalid".  Requests on
+# one connection may be sent without waiting for the responses, which then come back as they are done,
+# matched by id.
+#
+# Every connection has a thread reading its requests into one bounded queue.  A batcher thread takes what
+# has arrived, waiting at most batch_wait for up to batch_size requests, and sends the batch to a pool of
+# worker processes as one message.  At most 2 batches per worker are in flight, so once the workers fall
+# behind the queue fills up, and a request arriving at a full queue is answered "busy" at once instead of
+# waiting for ever.  A request past its deadline is answered "timeout", whether it is still queued or its
+# search is stopped by the deadline (see Sudoku_Stats.Search_Limits).
+
+STATUSES = ('solved', 'unsolvable', 'timeout', 'busy', 'invalid', 'error')
+LATENCY_SAMPLES = 10000 # latencies kept for the percentiles, the most recent ones
+
+# input: (engine, list of (key, puzzle line, deadline time or None))
+# output: list of (key, status, solution line or None), runs inside a worker process
+def solve_requests(task):
+    engine, requests = task
+    results = []
+    for key, line, deadline in requests:
+        if deadline is not None and time.time() >= deadline:
+            results.append((key, 'timeout', None))
+            continue
+        limits = Sudoku_Stats.Search_Limits(deadline = deadline)
+        solution = Sudoku_Batch.solve_line(line, engine, limits)
+        if solution is not None:
+            results.append((key, 'solved', solution))
+        else:
+            results.append((key, 'timeout' if limits.reason is not None else 'unsolvable', None))
+    return results
+
+# input: the task of solve_requests()
+# output: (its results, None), or (None, the traceback) if it raised.  Pool.apply_async in Python 2 has no
+#         error callback, so a batch that failed would otherwise never be answered.
+def solve_batch(task):
+    try:
+        return solve_requests(task), None
+    except Exception:
+        return None, traceback.format_exc()
+
+# input: the timeout of a request
+# output: True if it is None or a number of seconds
+def valid_timeout(timeout):
+    if timeout is None:
+        return True
+    if isinstance(timeout, bool) or not isinstance(timeout, (int, long, float)):
+        return False
+    return timeout == timeout and timeout >= 0 # NaN is not equal to itself
+
+# input: a sorted list and a fraction
+# output: the value at that fraction of the list, 0 for an empty list
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+# The counters of a service, updated from the connection, batcher and pool threads
+class Service_Counters(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start = time.time()
+        self.statuses = dict((status, 0) for status in STATUSES)
+        self.requests = 0
+        self.batches = 0
+        self.batched = 0 # requests sent to the workers
+        self.max_queue_depth = 0
+        self.latencies = collections.deque(maxlen = LATENCY_SAMPLES)
+
+    # input: the status of a finished request and the seconds from its arrival to its response
+    def add(self, status, latency):
+        with self.lock:
+            self.statuses[status] += 1
+            self.latencies.append(latency)
+
+    # input: the queue depth and the number of requests queued
+    def add_queued(self, depth):
+        with self.lock:
+            self.requests += 1
+            if depth > self.max_queue_depth:
+                self.max_queue_depth = depth
+
+    def add_batch(self, size):
+        with self.lock:
+            self.batches += 1
+            self.batched += size
+
+    # input: the current queue depth and batches in flight
+    # output: dict of the counters, latencies in milliseconds
+    def as_dict(self, queue_depth = 0, in_flight = 0):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            elapsed = time.time() - self.start
+            done = sum(self.statuses.values())
+            counters = {'requests': self.requests + self.statuses['busy'] + self.statuses['invalid'],
+                        'done': done, 'uptime': elapsed, 'throughput': done / max(elapsed, 1e-9),
+                        'batches': self.batches,
+                        'mean_batch': float(self.batched) / self.batches if self.batches else 0.0,
+                        'queue_depth': queue_depth, 'max_queue_depth': self.max_queue_depth,
+                        'batches_in_flight': in_flight,
+                        'latency_ms': {'mean': 1000 * sum(latencies) / len(latencies) if latencies else 0.0,
+                                       'p50': 1000 * percentile(latencies, 0.5),
+                                       'p90': 1000 * percentile(latencies, 0.9),
+                                       'p99': 1000 * percentile(latencies, 0.99),
+                                       'max': 1000 * latencies[-1] if latencies else 0.0}}
+            counters.update(self.statuses)
+        return counters
+
+class Solving_Service(object):
+    # input: the number of worker processes (None for one per core), the engine (see Sudoku_Batch.ENGINES),
+    #        the most requests per batch, the longest time in seconds to wait for a batch to fill, the most
+    #        requests queued and the timeout of a request that does not give one (None for no timeout)
+    # output: a running service, requests are passed to submit()
+    def __init__(self, workers = None, engine = 'propagate', batch_size = 64, batch_wait = 0.002,
+                 queue_size = 1024, default_timeout = 10.0):
+        assert engine in Sudoku_Batch.ENGINES
+        self.engine = engine
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.default_timeout = default_timeout
+        self.workers = workers or multiprocessing.cpu_count()
+        self.pool = multiprocessing.Pool(self.workers)
+        self.queue = Queue.Queue(queue_size)
+        self.window = threading.Semaphore(2 * self.workers) # batches in flight
+        self.in_flight = 0
+        self.lock = threading.Lock() # guards in_flight
+        self.counters = Service_Counters()
+        self.batcher = threading.Thread(target = self.run_batches)
+        self.batcher.daemon = True
+        self.batcher.start()
+
+    # input: a puzzle line, the timeout in seconds (None for the default) and reply(status, solution or
+    #        None), called once from another thread when the request is done
+    # output: False if the request was answered at once (not a puzzle or not a timeout, or the queue is full)
+    def submit(self, line, timeout, reply):
+        arrival = time.time()
+        if isinstance(line, unicode):
+            try:
+                line = line.encode('ascii')
+            except UnicodeError:
+                line = None
+        cells = Sudoku_IO.parse_cells(line) if isinstance(line, str) else None
+        if cells is None or not valid_timeout(timeout):
+            self.finish(reply, arrival, 'invalid', None)
+            return False
+        if timeout is None:
+            timeout = self.default_timeout
+        deadline = arrival + timeout if timeout is not None else None
+        try:
+            self.queue.put_nowait((str(line), deadline, arrival, reply))
+        except Queue.Full:
+            self.finish(reply, arrival, 'busy', None)
+            return False
+        self.counters.add_queued(self.queue.qsize())
+        return True
+
+    # output: none, but will call reply and count the request
+    def finish(self, reply, arrival, status, solution):
+        self.counters.add(status, time.time() - arrival)
+        reply(status, solution)
+
+    # output: list of the requests of the next batch, None once the service is closed
+    def next_batch(self):
+        first = self.queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        end = time.time() + self.batch_wait
+        while len(batch) < self.batch_size:
+            left = end - time.time()
+            try:
+                item = self.queue.get(True, left) if left > 0 else self.queue.get_nowait()
+            except Queue.Empty:
+                break
+            if item is None:
+                self.queue.put(None) # close once this batch is sent
+                break
+            batch.append(item)
+        return batch
+
+    # output: none, runs in the batcher thread until close()
+    def run_batches(self):
+        while True:
+            batch = self.next_batch()
+            if batch is None:
+                return
+            now = time.time()
+            live = []
+            for item in batch:
+                if item[1] is not None and now >= item[1]:
+                    self.finish(item[3], item[2], 'timeout', None)
+                else:
+                    live.append(item)
+            if not live:
+                continue
+            self.window.acquire()
+            with self.lock:
+                self.in_flight += 1
+            self.counters.add_batch(len(live))
+            task = (self.engine, [(key, line, deadline) for key, (line, deadline, arrival, reply) in enumerate(live)])
+            self.pool.apply_async(solve_batch, (task,), callback = self.batch_done(live))
+
+    # input: the requests of a batch
+    # output: the callback answering them once the pool is done with the batch.  It runs in the result thread
+    #         of the pool, which must not die, so nothing it calls may raise out of it.
+    def batch_done(self, batch):
+        def callback(outcome):
+            with self.lock:
+                self.in_flight -= 1
+            self.window.release()
+            results, error = outcome
+            if error is not None:
+                results = [(key, 'error', None) for key in xrange(len(batch))]
+            for key, status, solution in results:
+                line, deadline, arrival, reply = batch[key]
+                try:
+                    self.finish(reply, arrival, status, solution)
+                except Exception:
+                    pass # the reply of one request must not keep the others from theirs
+        return callback
+
+    # output: dict of the counters (see Service_Counters.as_dict)
+    def stats(self):
+        return self.counters.as_dict(self.queue.qsize(), self.in_flight)
+
+    def close(self):
+        self.queue.put(None)
+        self.batcher.join()
+        self.pool.terminate()
+        self.pool.join()
+
+# The connection of one client, in its own thread
+class Request_Handler(SocketServer.StreamRequestHandler):
+    def handle(self):
+        service = self.server.service
+        lock = threading.Lock()
+        done = threading.Condition(lock)
+        pending = [0] # requests not answered yet
+        def send(response):
+            try:
+                self.wfile.write(json.dumps(response, separators = (',', ':')) + '\n')
+                self.wfile.flush()
+            except Exception:
+                pass # the client is gone, and so may be the file
+        def make_reply(request_id):
+            def reply(status, solution):
+                with lock:
+                    send({'id': request_id, 'status': status, 'solution': solution})
+                    pending[0] -= 1
+                    done.notify()
+            return reply
+        for line in iter(self.rfile.readline, ''): # file iteration would read ahead and wait for more
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                request = json.loads(line)
+                assert isinstance(request, dict)
+            except (ValueError, AssertionError):
+                with lock:
+                    send({'id': None, 'status': 'invalid', 'solution': None})
+                continue
+            if request.get('stats'):
+                with lock:
+                    send({'id': request.get('id'), 'stats': service.stats()})
+                continue
+            with lock:
+                pending[0] += 1
+            service.submit(request.get('puzzle'), request.get('timeout'), make_reply(request.get('id')))
+        with lock: # the client closed its side, answer what is left before closing ours
+            while pending[0]:
+                done.wait()
+
+class TCP_Server(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+class Unix_Server(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+# input: a (host, port) pair or the path of a Unix socket, and a Solving_Service
+# output: a server to run with serve_forever(), server_address holds the port bound when port 0 was asked
+def make_server(address, service):
+    if isinstance(address, basestring):
+        if os.path.exists(address):
+            os.remove(address)
+        server = Unix_Server(address, Request_Handler)
+    else:
+        server = TCP_Server(address, Request_Handler)
+    server.service = service
+    return server
+
+# input: a (host, port) pair or the path of a Unix socket
+# output: a connected socket
+def connect(address):
+    if isinstance(address, basestring):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    else:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.connect(address)
+    return sock
+
+# A blocking client, one request at a time
+class Sudoku_Client(object):
+    def __init__(self, address):
+        self.sock = connect(address)
+        self.reader = self.sock.makefile('rb')
+        self.next_id = 0
+
+    # input: a dict of the request, its id is added
+    # output: the dict of the response
+    def request(self, request):
+        self.next_id += 1
+        request['id'] = self.next_id
+        self.sock.sendall(json.dumps(request) + '\n')
+        return json.loads(self.reader.readline())
+
+    # input: a puzzle line (or a board) and the timeout in seconds (None for the server's default)
+    # output: (status, solution line or None)
+    def solve(self, puzzle, timeout = None):
+        request = {'puzzle': Sudoku_Batch.to_line(puzzle)}
+        if timeout is not None:
+            request['timeout'] = timeout
+        response = self.request(request)
+        solution = response['solution']
+        return str(response['status']), (str(solution) if solution is not None else None) # json gives unicode
+
+    # output: dict of the counters of the service
+    def stats(self):
+        return self.request({'stats': True})['stats']
+
+    def close(self):
+        self.reader.close()
+        self.sock.close()
+
+# input: a (host, port) pair or the path of a Unix socket, the puzzle lines to send, the number of
+#        connections, the requests per second to send over all of them (None to send as fast as the server
+#        reads) and the timeout of every request (None for the server's default)
+# output: dict of the results: the count of each status, the time taken, the responses per second and the
+#         latency percentiles seen by the client in milliseconds
+# Every connection sends its share of the puzzles from one thread and reads the responses from another.
+def load_test(address, puzzles, connections = 4, rate = None, timeout = None):
+    statuses = collections.defaultdict(int)
+    latencies = []
+    lock = threading.Lock()
+    start = time.time()
+    def run(share, offset):
+        sock = connect(address)
+        sent = {}
+        def writer():
+            for k, line in enumerate(share):
+                if rate:
+                    delay = start + (offset + k * connections) / float(rate) - time.time()
+                    if delay > 0:
+                        time.sleep(delay)
+                request = {'id': k, 'puzzle': line}
+                if timeout is not None:
+                    request['timeout'] = timeout
+                sent[k] = time.time()
+                sock.sendall(json.dumps(request) + '\n')
+            sock.shutdown(socket.SHUT_WR)
+        thread = threading.Thread(target = writer)
+        thread.start()
+        for line in iter(sock.makefile('rb').readline, ''):
+            response = json.loads(line)
+            with lock:
+                statuses[response['status']] += 1
+                latencies.append(time.time() - sent[response['id']])
+        thread.join()
+        sock.close()
+    threads = [threading.Thread(target = run, args = (puzzles[c::connections], c)) for c in xrange(connections)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+    latencies.sort()
+    results = dict(statuses)
+    results.update({'requests': len(puzzles), 'responses': len(latencies), 'seconds': elapsed,
+                    'throughput': len(latencies) / max(elapsed, 1e-9),
+                    'latency_ms': {'p50': 1000 * percentile(latencies, 0.5), 'p90': 1000 * percentile(latencies, 0.9),
+                                   'p99': 1000 * percentile(latencies, 0.99),
+                                   'max': 1000 * latencies[-1] if latencies else 0.0}})
+    return results
+
+# input: the options of the command line
+# output: the address to serve on or to connect to
+def address_of(args):
+    return args.unix if args.unix else (args.host, args.port)
+
+# Program runs from here
+#
+# usage: python Sudoku_Server.py serve [--host H] [--port P | --unix PATH] [--workers N] [--engine E]
+#                                      [--batch-size B] [--batch-wait S] [--queue-size Q] [--timeout S]
+#        python Sudoku_Server.py load [--host H] [--port P | --unix PATH] [--corpus C] [--count N]
+#                                     [--connections K] [--rate R] [--timeout S]
+# serve runs the service until interrupted, load sends puzzles of a benchmark corpus and prints what it
+# measured and the counters of the server as json.  With no arguments the self tests are run.
+
+if __name__ == "__main__":
+    TEST = len(sys.argv) == 1
+    if not TEST:
+        import argparse
+        import Sudoku_Benchmark
+        parser = argparse.ArgumentParser(description = 'Sudoku solving service speaking json lines.')
+        parser.add_argument('command', choices = ('serve', 'load'))
+        parser.add_argument('--host', default = '127.0.0.1')
+        parser.add_argument('--port', type = int, default = 7349)
+        parser.add_argument('--unix', default = None, help = 'path of a unix socket, instead of tcp')
+        parser.add_argument('--workers', type = int, default = None, help = 'worker processes (default: cores)')
+        parser.add_argument('--engine', choices = Sudoku_Batch.ENGINES, default = 'propagate')
+        parser.add_argument('--batch-size', type = int, default = 64, help = 'most requests per batch')
+        parser.add_argument('--batch-wait', type = float, default = 0.002, help = 'seconds to wait for a batch')
+        parser.add_argument('--queue-size', type = int, default = 1024, help = 'requests queued before "busy"')
+        parser.add_argument('--timeout', type = float, default = None, help = 'seconds per request')
+        parser.add_argument('--corpus', choices = Sudoku_Benchmark.CORPORA, default = 'easy')
+        parser.add_argument('--count', type = int, default = 1000, help = 'requests to send')
+        parser.add_argument('--connections', type = int, default = 4)
+        parser.add_argument('--rate', type = float, default = None, help = 'requests per second to send')
+        args = parser.parse_args()
+        if args.command == 'serve':
+            service = Solving_Service(args.workers, args.engine, args.batch_size, args.batch_wait, args.queue_size,
+                                      args.timeout if args.timeout is not None else 10.0)
+            server = make_server(address_of(args), service)
+            sys.stderr.write('serving on %s\n' % (server.server_address,))
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            server.server_close()
+            service.close()
+        else:
+            corpus = Sudoku_Benchmark.build_corpus(args.corpus)
+            puzzles = [corpus[k % len(corpus)] for k in xrange(args.count)]
+            results = load_test(address_of(args), puzzles, args.connections, args.rate, args.timeout)
+            client = Sudoku_Client(address_of(args))
+            results['server'] = client.stats()
+            client.close()
+            print json.dumps(results, indent = 2, sort_keys = True)
+    else:
+        import tempfile
+        import Sudoku_Benchmark
+        print "Running sudoku server tests.\n"
+        test_count = 0
+        pass_count = 0
+        fail_count = 0
+        time_start = time.time()
+
+        def test_message(passed_test, message):
+            global pass_count
+            global fail_count
+            global test_count
+            test_count += 1
+            if passed_test:
+                print ">>> PASSED TEST: " + message + "\n"
+                pass_count += 1
+            else:
+                print "!!! FAILED TEST: " + message + " !!!\n"
+                fail_count += 1
+
+        # input: a Solving_Service and an address
+        # output: the server, running in a thread
+        def start_server(service, address):
+            server = make_server(address, service)
+            thread = threading.Thread(target = server.serve_forever)
+            thread.daemon = True
+            thread.start()
+            return server
+
+        # output: True if solution solves puzzle
+        def solves(puzzle, solution):
+            if solution is None or '.' in solution or len(solution) != len(puzzle):
+                return False
+            n, block_size, grid = Sudoku_Batch.parse_line(solution)
+            keeps = all(p == '.' or p == s for p, s in zip(puzzle, solution))
+            return keeps and Sudoku_Batch.grid_is_valid(n, block_size, grid)
+
+        hard = Sudoku_Benchmark.build_corpus('hard')
+        easy = Sudoku_Benchmark.build_corpus('easy', 0, 40)
+        service = Solving_Service(2, batch_wait = 0.005)
+        server = start_server(service, ('127.0.0.1', 0))
+        address = server.server_address
+
+        m = 'Sudoku_Client.solve() over tcp'
+        client = Sudoku_Client(address)
+        test_result = True
+        for line in hard[:4]:
+            status, solution = client.solve(line)
+            test_result = test_result and status == 'solved' and solves(line, solution)
+        test_result = test_result and client.solve('.' * 80) == ('invalid', None)
+        test_result = test_result and client.solve('11' + '.' * 79) == ('unsolvable', None)
+        test_result = test_result and client.solve(hard[0].replace('.', '0'))[0] == 'solved'
+        response = client.request({'puzzle': 17})
+        test_result = test_result and response['status'] == 'invalid' and response['id'] == client.next_id
+        test_message(test_result, m)
+
+        m = 'load_test() gets an answer for every request and batches them'
+        puzzles = [easy[k % len(easy)] for k in xrange(400)]
+        results = load_test(address, puzzles, 4)
+        print json.dumps(results, sort_keys = True)
+        stats = client.stats()
+        print json.dumps(stats, sort_keys = True)
+        test_result = results['responses'] == 400 and results.get('solved', 0) + results.get('unsolvable', 0) == 400
+        test_result = test_result and stats['batches'] < stats['requests'] and stats['mean_batch'] > 1
+        test_result = test_result and stats['latency_ms']['p99'] >= stats['latency_ms']['p50'] > 0
+        test_result = test_result and stats['queue_depth'] == 0 and stats['batches_in_flight'] == 0
+        test_message(test_result, m)
+
+        m = 'a deadline stops the search'
+        start = time.time()
+        status, solution = client.solve('.' * 625, 0.2) # an empty 25x25 board takes seconds
+        test_result = status == 'timeout' and time.time() - start < 1
+        test_message(test_result, m)
+
+        m = 'malformed requests are answered "invalid" and the service goes on'
+        sock = connect(address)
+        requests = [{'id': 1, 'puzzle': hard[0], 'timeout': 'x'}, {'id': 2, 'puzzle': u'\u00e9' * 81},
+                    {'id': 3, 'puzzle': [1]}, {'id': 4, 'puzzle': hard[0], 'timeout': -1},
+                    {'id': 5, 'puzzle': hard[0], 'timeout': float('nan')}, {'id': 6, 'puzzle': hard[0], 'timeout': True},
+                    {'id': 7, 'puzzle': hard[0], 'timeout': 5}]
+        sock.sendall(''.join(json.dumps(request) + '\n' for request in requests) + '[]\n')
+        sock.shutdown(socket.SHUT_WR)
+        responses = [json.loads(line) for line in iter(sock.makefile('rb').readline, '')]
+        sock.close()
+        statuses = dict((response['id'], response['status']) for response in responses)
+        test_result = len(responses) == 8 and statuses == {1: 'invalid', 2: 'invalid', 3: 'invalid', 4: 'invalid',
+                                                           5: 'invalid', 6: 'invalid', 7: 'solved', None: 'invalid'}
+        other = Sudoku_Client(address)
+        test_result = test_result and other.solve(hard[1])[0] == 'solved' and client.solve(hard[2])[0] == 'solved'
+        other.close()
+        test_message(test_result, m)
+        client.close()
+        server.shutdown()
+        server.server_close()
+        service.close()
+
+        m = 'a batch whose worker raises is answered "error"'
+        solver = solve_requests
+        def solve_requests(task): # the workers are forked after this, they see it too
+            raise ValueError('broken batch')
+        service = Solving_Service(1)
+        solve_requests = solver
+        server = start_server(service, ('127.0.0.1', 0))
+        client = Sudoku_Client(server.server_address)
+        test_result = client.solve(hard[0]) == ('error', None) and client.solve(hard[1]) == ('error', None)
+        stats = client.stats()
+        test_result = test_result and stats['error'] == 2 and stats['batches_in_flight'] == 0
+        client.close()
+        server.shutdown()
+        server.server_close()
+        service.close()
+        test_message(test_result, m)
+
+        m = 'a full queue answers "busy" over a unix socket'
+        path = os.path.join(tempfile.mkdtemp(), 'sudoku.sock')
+        service = Solving_Service(1, batch_size = 4, queue_size = 8)
+        server = start_server(service, path)
+        results = load_test(path, [hard[k % len(hard)] for k in xrange(200)], 2)
+        print json.dumps(results, sort_keys = True)
+        test_result = results['responses'] == 200 and results.get('busy', 0) > 0 and results.get('solved', 0) > 0
+        test_result = test_result and service.stats()['max_queue_depth'] <= 8
+        test_message(test_result, m)
+
+        m = 'requests that wait past their deadline in the queue'
+        results = load_test(path, [hard[k % len(hard)] for k in xrange(8)], 1, timeout = 0.0)
+        test_result = results.get('timeout') == 8 and results['responses'] == 8
+        test_message(test_result, m)
+        server.shutdown()
+        server.server_close()
+        service.close()
+        os.remove(path)
+        os.rmdir(os.path.dirname(path))
+
+        # displays test result summary:
+        time_end = time.time()
+        print "ran a total of " + str(test_count) + " tests."
+        print "test runtime: " + str(time_end - time_start) + " seconds"
+        print "total tests passed: " + str(pass_count)
+        print "total tests failed: " + str(fail_count)
+        print "\n"
@@ -0,0 +1,329 @@
+import time
+import random
+import Sudoku_Propagator
+
+# Incremental editing session around a Sudoku_Board
+#
+# A front end edits the board one cell at a time through Sudoku_Session.set().  The session keeps a
+# Sudoku_Propagator.Propagator holding the propagated candidates of the values on the board, and the edits
+# in the order they were made, each with the trail mark taken before it.  Placing a value only propagates
+# that value to its peers.  Clearing one undoes the trail back to its mark and places the edits made after
+# it again, so clearing the last value entered costs no more than entering it did.
+#
+# The last solution found is kept together with the number of values on the board that differ from it.
+# While there are none the board is still solvable without searching again, and a board that could not be
+# solved stays so until a value is cleared.  Duplicates are read from the unit counts of the board.
+
+HINT_TECHNIQUES = ('naked_single', 'hidden_single', 'propagation', 'search')
+
+class Sudoku_Session(object):
+    # input: a Sudoku_Board, which is then only to be changed through the session, and the heuristic to
+    #        search with (a name in Sudoku_Propagator.HEURISTICS)
+    # output: a session holding the propagated state of the board
+    def __init__(self, board, heuristic = 'mrv'):
+        n = board.board_size
+        self.board = board
+        self.heuristic = heuristic
+        self.propagator = Sudoku_Propagator.Propagator(n, board.block_size, [[0] * n for row in xrange(n)])
+        self.propagator.propagate()
+        self.edits = [] # [cell, value, trail mark before it or None] of every value on the board, oldest first
+        self.dead = None # index in self.edits of the value propagation found a contradiction at, or None
+        self.solution = None # values of the last solution found (list, cell order), or None
+        self.mismatches = 0 # values on the board that differ from self.solution
+        self.unsolvable = False # True when the last search found no solution and no value was cleared since
+        self.solves = 0 # searches run
+        self.replays = 0 # edits placed again after an older one was cleared
+        for row in xrange(n):
+            for col in xrange(n):
+                if board.board[row][col] != 0:
+                    self.place(row * n + col, board.board[row][col])
+
+    # input: a cell index and a value
+    # output: none, but will add the edit and propagate it unless the state already has a contradiction
+    def place(self, i, value):
+        if self.dead is not None:
+            self.edits.append([i, value, None])
+            return
+        propagator = self.propagator
+        self.edits.append([i, value, propagator.mark()])
+        if not (propagator.assign(i, value) and propagator.propagate()):
+            self.dead = len(self.edits) - 1
+
+    # input: a cell index
+    # output: none, but will take back the edit of cell i and place the edits made after it again
+    def remove(self, i):
+        k = 0
+        while self.edits[k][0] != i:
+            k += 1
+        if self.dead is not None and k > self.dead:
+            del self.edits[k] # never propagated
+            return
+        later = self.edits[k + 1:]
+        self.propagator.undo(self.edits[k][2])
+        del self.edits[k:]
+        self.dead = None
+        for j, value, mark in later:
+            self.replays += 1
+            self.place(j, value)
+
+    # input: a cell (row, col) and a value, 0 to clear the cell
+    # output: none, but will set the cell on the board and update the propagated state
+    def set(self, row, col, value):
+        board = self.board
+        old = board.board[row][col]
+        if old == value:
+            return
+        i = row * board.board_size + col
+        solution = self.solution
+        if old != 0:
+            self.remove(i)
+            self.unsolvable = False # a cleared value may have been the one in the way
+            if solution is not None and solution[i] != old:
+                self.mismatches -= 1
+        board.set(row, col, value)
+        if value != 0:
+            self.place(i, value)
+            if solution is not None and solution[i] != value:
+                self.mismatches += 1
+
+    def clear(self, row, col):
+        self.set(row, col, 0)
+
+    # output: True if the board can still be completed, a search is only run when the last solution no
+    #         longer agrees with the board
+    def solvable(self):
+        if self.board.conflicts or self.dead is not None or self.unsolvable:
+            return False
+        if self.solution is not None and self.mismatches == 0:
+            return True
+        propagator = self.propagator
+        mark = propagator.mark()
+        self.solves += 1
+        values = propagator.solve(Sudoku_Propagator.HEURISTICS[self.heuristic]())
+        propagator.undo(mark)
+        if values is None:
+            self.unsolvable = True
+            return False
+        self.solution = values
+        self.mismatches = 0
+        return True
+
+    # output: a solved copy of the board, or None if it cannot be completed
+    def solve(self):
+        if not self.solvable():
+            return None
+        return self.board.copy_with_values(self.solution)
+
+    # input: a cell (row, col)
+    # output: list of the digits still possible at the cell after propagation
+    def candidates(self, row, col):
+        mask = self.propagator.cands[row * self.board.board_size + col]
+        return Sudoku_Propagator.digits_of(mask)
+
+    # output: list of (row, col) of every cell holding a digit that another cell of its row, col or sub
+    #         block holds too, sorted
+    def conflicting_cells(self):
+        board = self.board
+        if board.conflicts == 0:
+            return []
+        n = board.board_size
+        units = self.propagator.units
+        cells = set()
+        for u in xrange(3 * n):
+            counts = board.unit_counts[u]
+            for c in units[u]:
+                value = board.board[c / n][c % n]
+                if value and counts[value] > 1:
+                    cells.add(divmod(c, n))
+        return sorted(cells)
+
+    # output: (row, col, value, technique) of the easiest empty cell to fill next, technique being the first
+    #         of HINT_TECHNIQUES that finds it from the values on the board, or None if the board cannot be
+    #         completed (or is complete)
+    def hint(self):
+        if not self.solvable():
+            return None
+        board, propagator = self.board, self.propagator
+        n = board.board_size
+        masks = board.unit_masks
+        units, units_of = propagator.units, propagator.units_of
+        full = propagator.full
+        # output: mask of the digits no peer of cell c holds on the board
+        def free(c):
+            r, col, b = units_of[c]
+            return full & ~(masks[r] | masks[col] | masks[b])
+        deduced = []
+        best = None
+        for i in xrange(n * n):
+            if board.board[i / n][i % n] != 0:
+                continue
+            value = propagator.values[i]
+            if value:
+                if free(i) == 1 << value:
+                    return i / n, i % n, value, 'naked_single'
+                deduced.append(i)
+            elif best is None or Sudoku_Propagator.count_bits(propagator.cands[i]) < \
+                    Sudoku_Propagator.count_bits(propagator.cands[best]):
+                best = i
+        for i in deduced:
+            bit = 1 << propagator.values[i]
+            for u in units_of[i]:
+                if all(c == i or board.board[c / n][c % n] != 0 or not free(c) & bit for c in units[u]):
+                    return i / n, i % n, propagator.values[i], 'hidden_single'
+        if deduced:
+            i = deduced[0]
+            return i / n, i % n, propagator.values[i], 'propagation'
+        if best is None:
+            return None
+        return best / n, best % n, self.solution[best], 'search'
+
+# Program runs from here
+
+if __name__ == "__main__":
+    TEST = True
+    if TEST:
+        from Sudoku_Board import Sudoku_Board
+        test_count = 0
+        pass_count = 0
+        fail_count = 0
+        time_start = time.time()
+
+        def test_message(passed_test, message):
+            global pass_count
+            global fail_count
+            global test_count
+            test_count += 1
+            if passed_test:
+                print ">>> PASSED TEST: " + message + "\n"
+                pass_count += 1
+            else:
+                print "!!! FAILED TEST: " + message + " !!!\n"
+                fail_count += 1
+
+        # output: a Sudoku_Board of a puzzle line
+        def from_line(line):
+            board = Sudoku_Board()
+            board.fill([[int(c) if c != '.' else 0 for c in line[row * 9:(row + 1) * 9]] for row in xrange(9)])
+            return board
+
+        print "TESTING SESSION\n"
+        puzzle = '8..........36......7..9.2...5...7.......457.....1...3...1....68..85...1..9....4..'
+        solution = '812753649943682175675491283154237896369845721287169534521974368438526917796318452'
+
+        m = 'filling the board from hints searches once'
+        session = Sudoku_Session(from_line(puzzle))
+        test_result = session.solvable()
+        techniques = set()
+        hint = session.hint()
+        while hint is not None:
+            row, col, value, technique = hint
+            test_result = test_result and value == int(solution[row * 9 + col])
+            techniques.add(technique)
+            session.set(row, col, value)
+            hint = session.hint()
+        test_result = test_result and session.board.is_complete() and session.solves == 1
+        test_result = test_result and ''.join(str(v) for row in session.board.board for v in row) == solution
+        print 'hint techniques used: ' + str(sorted(techniques))
+        test_result = test_result and techniques <= set(HINT_TECHNIQUES) and 'naked_single' in techniques
+        test_message(test_result, m)
+
+        m = 'a wrong value without a duplicate, then cleared'
+        session = Sudoku_Session(from_line(puzzle))
+        session.solvable()
+        row, col = 0, 1 # solution 1, 2 has no peer on the board
+        session.set(row, col, 2)
+        test_result = session.conflicting_cells() == [] and not session.solvable() and session.solves == 2
+        test_result = test_result and session.hint() is None and session.solve() is None
+        session.clear(row, col)
+        test_result = test_result and session.solvable() and session.solves == 2 # the first solution agrees again
+        test_result = test_result and session.solve().board == from_line(solution).board
+        test_message(test_result, m)
+
+        m = 'conflicting_cells()'
+        session = Sudoku_Session(from_line(puzzle))
+        session.set(0, 1, 8) # 8 at (0, 0)
+        session.set(8, 1, 7) # 7 at (2, 1)
+        test_result = session.conflicting_cells() == [(0, 0), (0, 1), (2, 1), (8, 1)] and not session.solvable()
+        session.set(0, 1, 1)
+        test_result = test_result and session.conflicting_cells() == [(2, 1), (8, 1)]
+        session.clear(8, 1)
+        test_result = test_result and session.conflicting_cells() == [] and session.solvable()
+        test_message(test_result, m)
+
+        m = 'random edits agree with propagating and solving from scratch'
+        rng = random.Random(4)
+        test_result = True
+        for trial in xrange(10):
+            session = Sudoku_Session(Sudoku_Board.generate_random_board(rng.randint(40, 60)))
+            board = session.board
+            for edit in xrange(40):
+                row, col = rng.randrange(9), rng.randrange(9)
+                if board.get(row, col) and rng.random() < 0.6:
+                    session.clear(row, col)
+                else:
+                    session.set(row, col, rng.randint(1, 9))
+                fresh = Sudoku_Propagator.Propagator(9, 3, board.board)
+                consistent = board.conflicts == 0 and fresh.propagate()
+                test_result = test_result and (session.dead is None) == consistent
+                if consistent:
+                    test_result = test_result and fresh.cands == session.propagator.cands
+                expected = consistent and fresh.solve() is not None
+                test_result = test_result and session.solvable() == expected
+                hint = session.hint()
+                if hint is not None:
+                    row, col, value, technique = hint
+                    test_result = test_result and board.get(row, col) == 0 and value in session.candidates(row, col)
+        test_message(test_result, m)
+
+        m = 'hidden single hint'
+        board = Sudoku_Board(4)
+        board.fill([[1, 0, 0, 0], [0, 0, 1, 0], [0, 0, 0, 0], [0, 0, 0, 0]])
+        session = Sudoku_Session(board)
+        while True:
+            hint = session.hint()
+            if hint is None or hint[3] != 'naked_single':
+                break
+            session.set(*hint[:3])
+        test_result = hint is not None and hint[3] in ('hidden_single', 'propagation', 'search')
+        test_message(test_result, m)
+
+        m = '16x16 session'
+        board = Sudoku_Board.generate_random_board(120, 16)
+        session = Sudoku_Session(board)
+        test_result = session.solvable()
+        for step in xrange(20):
+            row, col, value, technique = session.hint()
+            session.set(row, col, value)
+        test_result = test_result and session.solvable() and session.solves == 1
+        test_message(test_result, m)
+
+        m = 'a keystroke costs less than a solve_board() call'
+        board = from_line(puzzle)
+        session = Sudoku_Session(board.copy())
+        session.solvable()
+        cells = [(i / 9, i % 9) for i in xrange(81) if puzzle[i] == '.']
+        keystrokes = 0
+        start = time.time()
+        for row, col in cells:
+            session.set(row, col, int(solution[row * 9 + col]))
+            session.solvable()
+            session.hint()
+            session.conflicting_cells()
+            session.clear(row, col)
+            keystrokes += 2
+        per_keystroke = (time.time() - start) / keystrokes
+        start = time.time()
+        board.solve_board('propagate')
+        full_solve = time.time() - start
+        print 'per keystroke: ' + str(per_keystroke * 1e6) + ' microseconds, solve_board(): ' + \
+            str(full_solve * 1e6) + ' microseconds'
+        test_result = per_keystroke < full_solve and session.solves == 1
+        test_message(test_result, m)
+
+        # displays test result summary:
+        time_end = time.time()
+        print "ran a total of " + str(test_count) + " tests."
+        print "test runtime: " + str(time_end - time_start) + " seconds"
+        print "total tests passed: " + str(pass_count)
+        print "total tests failed: " + str(fail_count)
+        print "\n"
@@ -0,0 +1,184 @@
+import time
+import logging
+import multiprocessing
+
+# Statistics of one solve_board() run
+#
+# The solver does not print anything by itself.  Each run fills a Solver_Stats with the search counters
+# and the wall time of every phase, and reports what it is doing to an optional callback:
+#
+#   callback(event, stats, detail)
+#     event 'message' - detail is a line of text (what older versions printed to stdout)
+#     event 'phase'   - detail is (phase name, seconds), sent when a phase ends
+#     event 'done'    - detail is the solution (a Sudoku_Board) or None, sent once at the end
+#
+# print_hook prints the messages like the solver used to, logging_hook(logger) sends everything to a
+# logging.Logger.
+#
+# A search can also be given Search_Limits (a deadline, a node budget and / or a Cancel_Token).  The engines
+# ask the limits before every guess, and a run that is stopped returns a Timed_Out holding the reason and the
+# statistics gathered so far instead of a solution.
+
+PHASES = ('validation', 'givens', 'propagation', 'search')
+STOP_REASONS = ('deadline', 'nodes', 'cancelled')
+
+class Solver_Stats(object):
+    # input: the callback to report to, or None to stay silent
+    # output: empty statistics
+    def __init__(self, callback = None):
+        self.callback = callback
+        self.engine = None
+        self.heuristic = None
+        self.nodes = 0 # guesses made
+        self.backtracks = 0 # guesses taken back
+        self.propagations = 0 # propagation steps: placed values pushed to their peers and units examined
+        self.max_depth = 0 # deepest number of guesses on the board at once
+        self.times = dict.fromkeys(PHASES, 0.0) # phase -> wall time in seconds
+        self.solved = False
+        self.stopped = None # the reason (see STOP_REASONS) when the limits stopped the run
+        self.phase = None
+        self.phase_start = 0.0
+
+    # input: a phase name (see PHASES)
+    # output: none, but will start timing the phase, ending the phase that was running
+    def start(self, phase):
+        if self.phase is not None:
+            self.stop()
+        self.phase = phase
+        self.phase_start = time.time()
+
+    # output: none, but will add the time since start() to the running phase and report it
+    def stop(self):
+        if self.phase is None:
+            return
+        phase = self.phase
+        elapsed = time.time() - self.phase_start
+        self.times[phase] += elapsed
+        self.phase = None
+        if self.callback is not None:
+            self.callback('phase', self, (phase, elapsed))
+
+    # input: a line of text
+    # output: none, the text is only passed on when there is a callback
+    def message(self, text):
+        if self.callback is not None:
+            self.callback('message', self, text)
+
+    # input: the solution or None
+    # output: none, but will end the running phase and report the result
+    def done(self, solution):
+        self.stop()
+        self.solved = solution is not None and not isinstance(solution, Timed_Out)
+        if self.callback is not None:
+            self.callback('done', self, solution)
+
+    # input: the nodes, backtracks, propagation steps and max depth of a search engine
+    # output: none, but will add them to the counters
+    def add_search(self, nodes, backtracks, propagations, max_depth):
+        self.nodes += nodes
+        self.backtracks += backtracks
+        self.propagations += propagations
+        self.max_depth = max(self.max_depth, max_depth)
+
+    # output: the total wall time of every phase in seconds
+    def total_time(self):
+        return sum(self.times.itervalues())
+
+    # output: dict of every counter and phase time, ready to be logged or dumped as json
+    def as_dict(self):
+        return {'engine': self.engine, 'heuristic': self.heuristic, 'solved': self.solved, 'stopped': self.stopped,
+                'nodes': self.nodes, 'backtracks': self.backtracks, 'propagations': self.propagations,
+                'max_depth': self.max_depth, 'times': dict(self.times), 'total_time': self.total_time()}
+
+    def __repr__(self):
+        return ('Solver_Stats(engine=%s, solved=%s, stopped=%s, nodes=%d, backtracks=%d, propagations=%d, '
+                'max_depth=%d, times=%s)' % (self.engine, self.solved, self.stopped, self.nodes, self.backtracks,
+                                             self.propagations, self.max_depth,
+                                             ', '.join('%s: %.6f' % (p, self.times[p]) for p in PHASES)))
+
+# A flag to stop running searches from another thread or process.  It wraps a multiprocessing.Event, so it
+# has to reach a worker process when the process is created (or through a Pool initializer), it cannot be
+# sent through a queue.
+class Cancel_Token(object):
+    def __init__(self):
+        self.event = multiprocessing.Event()
+
+    # output: none, but every search checking this token will stop at its next check
+    def cancel(self):
+        self.event.set()
+
+    def is_set(self):
+        return self.event.is_set()
+
+# The limits of one search.  exceeded() is called once per guess: the node budget is compared every time,
+# the clock and the cancel token at most every check_every calls as they cost a system call.  A guess on a
+# 25x25 board can take milliseconds, so the limits start by looking every call and only stretch the interval
+# (doubling it) while the calls between two looks take less than CHECK_SLICE seconds.
+CHECK_SLICE = 0.005 # seconds
+
+class Search_Limits(object):
+    # input: the time.time() to stop at, the guesses allowed, a Cancel_Token (or any object with is_set(),
+    #        such as a threading.Event) and how often to look at the clock and the token (a power of 2)
+    # output: limits to pass to a search, None for any of them means no limit of that kind
+    def __init__(self, deadline = None, max_nodes = None, cancel = None, check_every = 64):
+        self.deadline = deadline
+        self.max_nodes = max_nodes
+        self.cancel = cancel
+        self.max_mask = check_every - 1
+        self.mask = 0
+        self.calls = 0
+        self.checked = time.time() # when the clock was last looked at
+        self.reason = None # set once a limit is hit, and kept
+
+    # input: the number of guesses made so far
+    # output: None while the search may go on, otherwise the reason to stop (see STOP_REASONS)
+    def exceeded(self, nodes):
+        if self.reason is not None:
+            return self.reason
+        if self.max_nodes is not None and nodes >= self.max_nodes:
+            self.reason = 'nodes'
+        elif not self.calls & self.mask:
+            now = time.time()
+            if self.deadline is not None and now >= self.deadline:
+                self.reason = 'deadline'
+            elif self.cancel is not None and self.cancel.is_set():
+                self.reason = 'cancelled'
+            if now - self.checked < CHECK_SLICE:
+                self.mask = min(2 * self.mask + 1, self.max_mask)
+            else:
+                self.mask >>= 1
+            self.checked = now
+        self.calls += 1
+        return self.reason
+
+# The result of a run stopped by its limits.  It is false like None, so "if solution:" still reads as
+# "not solved", but it tells why the run stopped and carries the statistics gathered until then.
+class Timed_Out(object):
+    def __init__(self, reason, stats):
+        self.reason = reason
+        self.stats = stats
+
+    def __nonzero__(self):
+        return False
+
+    def __repr__(self):
+        return 'Timed_Out(reason=%s, %r)' % (self.reason, self.stats)
+
+# a callback that prints the messages to stdout, used by solve_board(verbose = True)
+def print_hook(event, stats, detail):
+    if event == 'message':
+        print detail
+
+# input: a logging.Logger and the level to log at
+# output: a callback that logs the messages, the phase times and the final statistics
+def logging_hook(logger, level = logging.DEBUG):
+    def hook(event, stats, detail):
+        if not logger.isEnabledFor(level):
+            return
+        if event == 'message':
+            logger.log(level, '%s', detail)
+        elif event == 'phase':
+            logger.log(level, 'phase %s took %.6f seconds', detail[0], detail[1])
+        else:
+            logger.log(level, '%r', stats)
+    return hook
@@ -0,0 +1,199 @@
+import math
+import itertools
+
+# Symmetries of a sudoku board and a canonical form
+#
+# These changes keep a puzzle valid and keep its number of solutions:
+#   relabeling the digits, permuting the rows inside a band (block_size rows) and the bands themselves,
+#   permuting the cols inside a stack and the stacks themselves, and transposing the board.
+# A transform is the tuple (transpose, rows, cols, digits): the cell (row, col) of the transformed board holds
+# digits[value] where value is the cell (rows[row], cols[col]) of the (transposed) board, digits[0] is 0.
+#
+# canonical_form picks, among every transform, the one that gives the lexicographically smallest board when
+# read row by row, blanks counting as larger than any digit.  Isomorphic puzzles therefore have the same
+# canonical form.  The search goes one row at a time and only keeps the partial transforms that tie for the
+# smallest rows so far, so it looks at a few hundred rows for a typical puzzle instead of the whole group.
+
+STATE_LIMIT = 4096 # partial transforms kept at once, puzzles with more ties (nearly empty ones) are left as is
+
+# input: cells (bytearray or list, row * board_size + col) and board_size
+# output: bytearray of the transposed cells
+def transpose_cells(cells, board_size):
+    n = board_size
+    return bytearray(cells[col * n + row] for row in xrange(n) for col in xrange(n))
+
+# input: cells, board_size and a transform
+# output: bytearray of the transformed cells
+def apply_transform(cells, board_size, transform):
+    n = board_size
+    transpose, rows, cols, digits = transform
+    if transpose:
+        cells = transpose_cells(cells, n)
+    return bytearray(digits[cells[rows[row] * n + cols[col]]] for row in xrange(n) for col in xrange(n))
+
+# input: cells of a transformed board, board_size and the transform that was applied
+# output: bytearray of the cells before the transform, such as the solution of the original puzzle when
+#         given the solution of its canonical form
+def invert_transform(cells, board_size, transform):
+    n = board_size
+    transpose, rows, cols, digits = transform
+    inverse = [0] * len(digits)
+    for value, label in enumerate(digits):
+        inverse[label] = value
+    result = bytearray(n * n)
+    for row in xrange(n):
+        for col in xrange(n):
+            result[rows[row] * n + cols[col]] = inverse[cells[row * n + col]]
+    if transpose:
+        result = transpose_cells(result, n)
+    return result
+
+# output: the identity transform of a board of board_size
+def identity(board_size):
+    return (False, range(board_size), range(board_size), range(board_size + 1))
+
+# input: block_size and a random.Random
+# output: a random order of the board_size rows (or cols) that keeps every band (or stack) together
+def shuffled_lines(block_size, rng):
+    bands = range(block_size)
+    rng.shuffle(bands)
+    lines = []
+    for band in bands:
+        inner = range(block_size)
+        rng.shuffle(inner)
+        lines.extend(band * block_size + line for line in inner)
+    return lines
+
+# input: board_size, block_size and a random.Random (or the random module)
+# output: a transform drawn uniformly from the whole group
+def random_transform(board_size, block_size, rng):
+    digits = range(1, board_size + 1)
+    rng.shuffle(digits)
+    rows, cols = shuffled_lines(block_size, rng), shuffled_lines(block_size, rng)
+    return (rng.random() < 0.5, rows, cols, [0] + digits)
+
+# input: a row (values), board_size and block_size
+# output: list of every col order that gives the smallest first row: stacks holding more clues first, inside a
+#         stack the clue cols then the blank cols.  Stacks with the same number of clues can come in any order.
+#         None when there would be more than STATE_LIMIT orders (large boards).
+def first_row_col_orders(row, board_size, block_size):
+    bs = block_size
+    stacks = []
+    for stack in xrange(bs):
+        cols = range(stack * bs, (stack + 1) * bs)
+        clues = [col for col in cols if row[col]]
+        blanks = [col for col in cols if not row[col]]
+        arrangements = [list(c) + list(b) for c in itertools.permutations(clues) for b in itertools.permutations(blanks)]
+        stacks.append((len(clues), arrangements))
+    stacks.sort(key = lambda stack: -stack[0])
+    groups = [list(group) for count, group in itertools.groupby(stacks, key = lambda stack: stack[0])]
+    total = 1
+    for group in groups:
+        total *= math.factorial(len(group))
+    for count, arrangements in stacks:
+        total *= len(arrangements)
+    if total > STATE_LIMIT:
+        return None
+    orders = []
+    for stack_orders in itertools.product(*[itertools.permutations(group) for group in groups]):
+        chosen = [stack for group in stack_orders for stack in group]
+        for parts in itertools.product(*[arrangements for count, arrangements in chosen]):
+            orders.append([col for part in parts for col in part])
+    return orders
+
+# input: a row, a col order, labels (list, original digit -> label, 0 when not labeled yet), the next free label,
+#        the value used for blanks and the smallest key found so far (None for no bound)
+# output: (key, new labels as dict, next free label), the row as read through the col order with digits that
+#         are seen for the first time labeled in order.  None as soon as the key is known to be above bound.
+def row_key(row, cols, labels, next_label, blank, bound = None):
+    key = []
+    new = {}
+    tied = bound is not None
+    for col in cols:
+        value = row[col]
+        if value == 0:
+            item = blank
+        elif labels[value]:
+            item = labels[value]
+        elif value in new:
+            item = new[value]
+        else:
+            item = new[value] = next_label
+            next_label += 1
+        if tied:
+            other = bound[len(key)]
+            if item > other:
+                return None
+            tied = item == other
+        key.append(item)
+    return key, new, next_label
+
+# input: cells, board_size and block_size
+# output: (canonical cells as a bytearray, transform taking cells to them).  Nearly empty boards, whose
+#         partial transforms tie beyond STATE_LIMIT, get the identity transform.
+def canonical_form(cells, board_size = 9, block_size = 3):
+    n, bs = board_size, block_size
+    blank = n + 1
+    # first row: the rows with the most clues (per stack, sorted) win, before looking at any digit
+    best = None
+    firsts = []
+    for transpose in (False, True):
+        grid = transpose_cells(cells, n) if transpose else bytearray(cells)
+        rows_of = [grid[row * n:(row + 1) * n] for row in xrange(n)]
+        for r in xrange(n):
+            counts = sorted((sum(1 for col in xrange(s * bs, (s + 1) * bs) if rows_of[r][col]) for s in xrange(bs)),
+                            reverse = True)
+            if best is None or counts > best:
+                best = counts
+                firsts = []
+            if counts == best:
+                firsts.append((transpose, rows_of, r))
+    states = [] # (transpose, rows of the grid, chosen rows, col order, labels, next label)
+    for transpose, rows_of, r in firsts:
+        orders = first_row_col_orders(rows_of[r], n, bs)
+        if orders is None:
+            return bytearray(cells), identity(n)
+        for cols in orders:
+            labels = [0] * (n + 1)
+            key, new, next_label = row_key(rows_of[r], cols, labels, 1, blank)
+            for value, label in new.iteritems():
+                labels[value] = label
+            states.append((transpose, rows_of, [r], cols, labels, next_label))
+        if len(states) > STATE_LIMIT:
+            return bytearray(cells), identity(n)
+    # every other row: keep the partial transforms that give the smallest row
+    for depth in xrange(1, n):
+        best = None
+        next_states = []
+        for transpose, rows_of, rows, cols, labels, next_label in states:
+            if depth % bs == 0: # first row of a new band
+                used = set(row / bs for row in rows)
+                options = [row for row in xrange(n) if row / bs not in used]
+            else:
+                band = rows[-1] / bs
+                options = [row for row in xrange(band * bs, (band + 1) * bs) if row not in rows]
+            for r in options:
+                found = row_key(rows_of[r], cols, labels, next_label, blank, best)
+                if found is None:
+                    continue
+                key, new, new_next = found
+                if best is None or key < best:
+                    best = key
+                    next_states = []
+                if key == best:
+                    new_labels = labels
+                    if new:
+                        new_labels = labels[:]
+                        for value, label in new.iteritems():
+                            new_labels[value] = label
+                    next_states.append((transpose, rows_of, rows + [r], cols, new_labels, new_next))
+        states = next_states
+        if len(states) > STATE_LIMIT:
+            return bytearray(cells), identity(n)
+    transpose, rows_of, rows, cols, labels, next_label = states[0]
+    for value in xrange(1, n + 1): # digits missing from the puzzle get the labels that are left, in order
+        if not labels[value]:
+            labels[value] = next_label
+            next_label += 1
+    transform = (transpose, rows, cols, labels)
+    return apply_transform(cells, n, transform), transform